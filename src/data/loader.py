@@ -1,50 +1,210 @@
-from ucimlrepo import fetch_ucirepo
+import os
+import json
+import shutil
+import tempfile
+import datetime
+import logging
+import numpy as np
 import pandas as pd
+from src.utils.cache import get_cache_dir
 
-def load_german_data():
+logger = logging.getLogger(__name__)
+
+# Bump when the on-disk layout changes; older caches are then ignored and refetched
+DATASET_CACHE_VERSION = 1
+# Set to 1/true/yes to never touch the network (air-gapped audit hosts)
+OFFLINE_ENV = 'AEI_OFFLINE'
+
+GERMAN_CACHE_NAME = 'german_credit'
+GERMAN_TARGET_COLUMN = 'class'
+
+# Rename columns to human readable format
+GERMAN_COLUMN_MAP = {
+    'Attribute1': 'checking_status',
+    'Attribute2': 'duration',
+    'Attribute3': 'credit_history',
+    'Attribute4': 'purpose',
+    'Attribute5': 'credit_amount',
+    'Attribute6': 'savings_status',
+    'Attribute7': 'employment',
+    'Attribute8': 'installment_rate',
+    'Attribute9': 'personal_status_sex',
+    'Attribute10': 'other_debtors',
+    'Attribute11': 'residence_since',
+    'Attribute12': 'property',
+    'Attribute13': 'age',
+    'Attribute14': 'other_payment_plans',
+    'Attribute15': 'housing',
+    'Attribute16': 'existing_credits',
+    'Attribute17': 'job',
+    'Attribute18': 'num_dependents',
+    'Attribute19': 'telephone',
+    'Attribute20': 'foreign_worker'
+}
+
+def _is_offline(offline):
+    """Resolves the offline flag: explicit argument first, then $AEI_OFFLINE."""
+    if offline is not None:
+        return offline
+    return os.environ.get(OFFLINE_ENV, '').strip().lower() in ('1', 'true', 'yes')
+
+def _rename_german_columns(X):
+    # Check if columns are indeed Attribute1 etc before renaming to avoid double renaming or errors
+    # UCIMLRepo might sometimes return names if updated
+    if 'Attribute1' in X.columns:
+        X = X.rename(columns=GERMAN_COLUMN_MAP)
+    return X
+
+def save_columnar_cache(frames, cache_dir, source=''):
+    """
+    Stores DataFrames column by column: one .npy per column plus a manifest.json
+    with the schema (dtype, categories) and the cache version. String columns are
+    stored as integer codes with their categories in the manifest. The directory is
+    replaced atomically.
+
+    Args:
+        frames (dict): {name: pd.DataFrame}, e.g. {'X': X, 'y': y}.
+        cache_dir (str): Target directory.
+        source (str): Free-text origin, recorded in the manifest.
+
+    Returns:
+        str: cache_dir.
+    """
+    parent = os.path.dirname(os.path.abspath(cache_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix=f".{os.path.basename(cache_dir)}-")
+    try:
+        manifest = {
+            'version': DATASET_CACHE_VERSION,
+            'source': source,
+            'created': datetime.datetime.now().isoformat(),
+            'frames': {}
+        }
+        for name, df in frames.items():
+            schema = []
+            for i, col in enumerate(df.columns):
+                series = df[col]
+                entry = {'name': str(col), 'dtype': str(series.dtype), 'file': f"{name}_{i}.npy"}
+                if pd.api.types.is_numeric_dtype(series) and not isinstance(series.dtype, pd.CategoricalDtype):
+                    values = series.to_numpy()
+                else:
+                    codes, categories = pd.factorize(series, sort=True)
+                    values = codes.astype(np.int32)
+                    entry['categories'] = [str(c) for c in categories]
+                np.save(os.path.join(tmp_dir, entry['file']), values)
+                schema.append(entry)
+            manifest['frames'][name] = {'n_rows': len(df), 'columns': schema}
+
+        with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir)
+        os.replace(tmp_dir, cache_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return cache_dir
+
+def load_columnar_cache(cache_dir):
+    """
+    Loads a cache written by save_columnar_cache. Numeric columns are memory-mapped.
+
+    Args:
+        cache_dir (str): Cache directory.
+
+    Returns:
+        dict or None: {name: pd.DataFrame}, or None if missing or from another cache version.
+    """
+    manifest_path = os.path.join(cache_dir, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != DATASET_CACHE_VERSION:
+        logger.warning(f"Ignoring dataset cache {cache_dir} from version {manifest.get('version')}.")
+        return None
+
+    frames = {}
+    for name, spec in manifest['frames'].items():
+        data = {}
+        for entry in spec['columns']:
+            values = np.load(os.path.join(cache_dir, entry['file']), mmap_mode='r')
+            if 'categories' in entry:
+                categories = np.asarray(entry['categories'], dtype=object)
+                if entry['dtype'] == 'category':
+                    data[entry['name']] = pd.Categorical.from_codes(values, categories)
+                else:
+                    # -1 codes are missing values
+                    data[entry['name']] = np.where(values >= 0, categories[np.maximum(values, 0)], None)
+            else:
+                data[entry['name']] = values
+        frames[name] = pd.DataFrame(data, copy=False)
+    return frames
+
+def seed_german_cache(path):
+    """
+    Pre-seeds the German Credit cache from a local file, e.g. for air-gapped hosts.
+
+    Accepts the original UCI 'german.data' file (whitespace separated, no header, 20
+    attributes followed by the class) or a CSV with a header that contains the
+    'class' target column (Attribute1..20 or readable names).
+
+    Args:
+        path (str): Data file.
+
+    Returns:
+        tuple: (X, y) as stored in the cache.
+    """
+    if path.endswith('.data'):
+        names = list(GERMAN_COLUMN_MAP) + [GERMAN_TARGET_COLUMN]
+        df = pd.read_csv(path, sep=r'\s+', header=None, names=names)
+    else:
+        df = pd.read_csv(path)
+    if GERMAN_TARGET_COLUMN not in df.columns:
+        raise ValueError(f"Seed file {path} has no '{GERMAN_TARGET_COLUMN}' target column.")
+
+    X = _rename_german_columns(df.drop(columns=[GERMAN_TARGET_COLUMN]))
+    y = df[[GERMAN_TARGET_COLUMN]]
+    save_columnar_cache({'X': X, 'y': y}, get_cache_dir('datasets', GERMAN_CACHE_NAME), source=os.path.abspath(path))
+    logger.info(f"Seeded German Credit cache from {path} ({len(X)} rows).")
+    return X, y
+
+def load_german_data(use_cache=True, offline=None):
     """
     Fetches the German Credit Data from UCI Repository.
-    
+    The renamed frames are cached on disk (see save_columnar_cache); later calls
+    load the memory-mapped cache without any network access.
+
+    Args:
+        use_cache (bool): Read / write the local cache.
+        offline (bool): Never touch the network. Defaults to $AEI_OFFLINE.
+
     Returns:
         tuple: (X, y) where X is the features DataFrame and y is the target Series/DataFrame.
     """
+    cache_dir = get_cache_dir('datasets', GERMAN_CACHE_NAME)
+    if use_cache:
+        frames = load_columnar_cache(cache_dir)
+        if frames is not None:
+            return frames['X'], frames['y']
+
+    if _is_offline(offline):
+        raise RuntimeError("German Credit Data is not cached and offline mode is on. "
+                           "Seed the cache with seed_german_cache(path).")
+
     try:
-        # fetch dataset 
-        german_credit_data = fetch_ucirepo(id=144) 
-          
-        # data (as pandas dataframes) 
-        X = german_credit_data.data.features 
-        y = german_credit_data.data.targets 
-        
-        # Rename columns to human readable format
-        column_map = {
-            'Attribute1': 'checking_status',
-            'Attribute2': 'duration',
-            'Attribute3': 'credit_history',
-            'Attribute4': 'purpose',
-            'Attribute5': 'credit_amount',
-            'Attribute6': 'savings_status',
-            'Attribute7': 'employment',
-            'Attribute8': 'installment_rate',
-            'Attribute9': 'personal_status_sex',
-            'Attribute10': 'other_debtors',
-            'Attribute11': 'residence_since',
-            'Attribute12': 'property',
-            'Attribute13': 'age',
-            'Attribute14': 'other_payment_plans',
-            'Attribute15': 'housing',
-            'Attribute16': 'existing_credits',
-            'Attribute17': 'job',
-            'Attribute18': 'num_dependents',
-            'Attribute19': 'telephone',
-            'Attribute20': 'foreign_worker'
-        }
-        
-        # Check if columns are indeed Attribute1 etc before renaming to avoid double renaming or errors
-        # UCIMLRepo might sometimes return names if updated
-        if 'Attribute1' in X.columns:
-            X = X.rename(columns=column_map)
-          
-        return X, y
+        from ucimlrepo import fetch_ucirepo
+
+        # fetch dataset
+        german_credit_data = fetch_ucirepo(id=144)
+
+        # data (as pandas dataframes)
+        X = _rename_german_columns(german_credit_data.data.features)
+        y = german_credit_data.data.targets
     except Exception as e:
         raise RuntimeError(f"Failed to fetch German Credit Data: {e}")
+
+    if use_cache:
+        save_columnar_cache({'X': X, 'y': y}, cache_dir, source='ucimlrepo:144')
+    return X, y
@@ -1,44 +1,203 @@
+import os
+import tempfile
+import hashlib
+import datetime
+import joblib
 import pandas as pd
 import numpy as np
+from numpy.lib.format import open_memmap
+from scipy import sparse as sp
 from sklearn.compose import ColumnTransformer
 from sklearn.preprocessing import OneHotEncoder, StandardScaler
 from sklearn.pipeline import Pipeline
+from src.utils.cache import get_cache_dir, fingerprint_frame
 
-def preprocess_data(X, y):
+# Bump when the preprocessor artifact changes; older artifacts are then refitted
+PREPROCESSOR_VERSION = 2
+
+class NamedCSRMatrix(sp.csr_matrix):
     """
-    Preprocesses the German Credit Data.
-    - Encodes categorical variables (OneHot).
-    - Scales numeric variables (StandardScaler).
-    - Returns processed DataFrame with readable column names.
+    CSR matrix carrying its column names as `.columns` (a pd.Index).
+    Row and column indexing, astype and copy keep the names of the selected columns,
+    so a slice such as X[:500] can be handed to any consumer of the full matrix.
+    """
+    columns = None
+    
+    def __getitem__(self, key):
+        out = super().__getitem__(key)
+        if isinstance(out, NamedCSRMatrix) and self.columns is not None:
+            col_key = key[1] if isinstance(key, tuple) and len(key) == 2 else slice(None)
+            out.columns = self.columns[np.atleast_1d(np.arange(self.shape[1])[col_key])]
+        return out
+    
+    def astype(self, dtype, casting='unsafe', copy=True):
+        out = super().astype(dtype, casting=casting, copy=copy)
+        out.columns = self.columns
+        return out
+    
+    def copy(self):
+        out = super().copy()
+        out.columns = self.columns
+        return out
+
+def with_columns(matrix, columns):
+    """
+    Attaches column names to a sparse matrix as `matrix.columns` (CSR data is not copied).
+    
+    Args:
+        matrix (scipy.sparse matrix): Feature matrix.
+        columns (list): One name per column.
+        
+    Returns:
+        NamedCSRMatrix: The CSR matrix with a `columns` pd.Index attribute that survives slicing.
+    """
+    matrix = NamedCSRMatrix(matrix)
+    matrix.columns = pd.Index(columns)
+    return matrix
+
+def fit_preprocessor(X, sparse=False, dtype=np.float64):
+    """
+    Fits the scaler / one-hot encoder on X and returns it as a reusable artifact.
     
     Args:
         X (pd.DataFrame): Features.
-        y (pd.DataFrame/Series): Target.
+        sparse (bool): Produce CSR output on transform (see preprocess_data).
+        dtype (np.dtype): Float dtype of the transformed features (see preprocess_data).
         
     Returns:
-        tuple: (X_processed_df, y_processed_series)
+        dict: 'version', 'fingerprint' (input schema + data), 'transformer' (fitted
+              ColumnTransformer), 'input_columns', 'input_dtypes', 'columns' (output
+              names), 'sparse', 'dtype' and 'created'.
     """
     # Identify columns
     numeric_features = X.select_dtypes(include=['int64', 'float64']).columns
     categorical_features = X.select_dtypes(include=['object', 'category']).columns
 
     # Create transformation pipeline
-    preprocessor = ColumnTransformer(
+    transformer = ColumnTransformer(
         transformers=[
             ('num', StandardScaler(), numeric_features),
-            ('cat', OneHotEncoder(handle_unknown='ignore', sparse_output=False), categorical_features)
-        ]
+            ('cat', OneHotEncoder(handle_unknown='ignore', sparse_output=sparse, dtype=dtype), categorical_features)
+        ],
+        # Always stack to CSR in sparse mode, however dense the result is
+        sparse_threshold=1.0 if sparse else 0.0
     )
-
-    # Fit and transform
-    X_processed = preprocessor.fit_transform(X)
+    transformer.fit(X)
 
     # Get feature names for OneHot
     # Note: sklearn < 1.0 logic might differ, but we are on 1.4+ likely
-    onehot_columns = preprocessor.named_transformers_['cat'].get_feature_names_out(categorical_features)
+    onehot_columns = transformer.named_transformers_['cat'].get_feature_names_out(categorical_features)
     all_columns = list(numeric_features) + list(onehot_columns)
     
-    X_processed_df = pd.DataFrame(X_processed, columns=all_columns)
+    return {
+        'version': PREPROCESSOR_VERSION,
+        'fingerprint': preprocessor_key(X, sparse, dtype),
+        'transformer': transformer,
+        'input_columns': [str(c) for c in X.columns],
+        'input_dtypes': {str(c): str(t) for c, t in X.dtypes.items()},
+        'columns': all_columns,
+        'sparse': sparse,
+        'dtype': np.dtype(dtype).name,
+        'created': datetime.datetime.now().isoformat()
+    }
+
+def preprocessor_key(X, sparse=False, dtype=np.float64):
+    """Store key of the preprocessor fitted on X: fingerprint of schema, data and options."""
+    return fingerprint_frame(X, sparse, np.dtype(dtype).name, PREPROCESSOR_VERSION)
+
+def transform_data(X, preprocessor):
+    """
+    Encodes new rows with a fitted preprocessor, without refitting (single pass).
+    Categories unseen at fit time are encoded as all zeros.
+    
+    Args:
+        X (pd.DataFrame): Features with (at least) the columns the preprocessor was fitted on.
+        preprocessor (dict): Artifact from fit_preprocessor / load_preprocessor.
+        
+    Returns:
+        pd.DataFrame or scipy.sparse.csr_matrix: Encoded rows (CSR with .columns in sparse mode).
+    """
+    missing = [c for c in preprocessor['input_columns'] if c not in X.columns]
+    if missing:
+        raise ValueError(f"Missing columns for the fitted preprocessor: {missing}")
+    
+    X_processed = preprocessor['transformer'].transform(X[preprocessor['input_columns']])
+    # One cast into the target dtype; the DataFrame wraps the result without another copy
+    X_processed = X_processed.astype(preprocessor['dtype'], copy=False)
+    if preprocessor['sparse']:
+        return with_columns(X_processed, preprocessor['columns'])
+    return pd.DataFrame(X_processed, columns=preprocessor['columns'], index=X.index, copy=False)
+
+def save_preprocessor(preprocessor, root=None):
+    """
+    Persists a fitted preprocessor (joblib) under its fingerprint.
+    
+    Args:
+        preprocessor (dict): Artifact from fit_preprocessor.
+        root (str): Store directory. Defaults to <AEI cache>/preprocessors.
+        
+    Returns:
+        str: Path of the artifact file.
+    """
+    root = root or get_cache_dir('preprocessors')
+    path = os.path.join(root, f"{preprocessor['fingerprint']}.joblib")
+    fd, tmp_path = tempfile.mkstemp(dir=root, suffix='.tmp')
+    os.close(fd)
+    joblib.dump(preprocessor, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+def load_preprocessor(key, root=None):
+    """
+    Loads a persisted preprocessor.
+    
+    Args:
+        key (str): Fingerprint, see preprocessor_key.
+        root (str): Store directory. Defaults to <AEI cache>/preprocessors.
+        
+    Returns:
+        dict or None: None if missing or from another artifact version.
+    """
+    path = os.path.join(root or get_cache_dir('preprocessors'), f"{key}.joblib")
+    if not os.path.exists(path):
+        return None
+    preprocessor = joblib.load(path)
+    if preprocessor.get('version') != PREPROCESSOR_VERSION:
+        return None
+    return preprocessor
+
+def preprocess_data(X, y, sparse=False, return_preprocessor=False, cache=False, dtype=np.float64):
+    """
+    Preprocesses the German Credit Data.
+    - Encodes categorical variables (OneHot).
+    - Scales numeric variables (StandardScaler).
+    - Returns processed DataFrame with readable column names.
+    
+    Args:
+        X (pd.DataFrame): Features.
+        y (pd.DataFrame/Series): Target.
+        sparse (bool): Return a CSR matrix with the column names attached (see with_columns)
+                       instead of a dense DataFrame, for high-cardinality categoricals.
+        return_preprocessor (bool): Also return the fitted preprocessor artifact.
+        cache (bool): Reuse / persist the fitted preprocessor keyed by the input fingerprint,
+                      so a repeat audit of the same data skips the fit.
+        dtype (np.dtype): Float dtype of the features; np.float32 (see src.utils.precision)
+                          halves the memory of the processed matrix.
+        
+    Returns:
+        tuple: (X_processed_df, y_processed_series), plus the preprocessor if return_preprocessor.
+    """
+    preprocessor = None
+    if cache:
+        preprocessor = load_preprocessor(preprocessor_key(X, sparse, dtype))
+    if preprocessor is None:
+        preprocessor = fit_preprocessor(X, sparse=sparse, dtype=dtype)
+        if cache:
+            save_preprocessor(preprocessor)
+    
+    X_processed_df = transform_data(X, preprocessor)
+    if not sparse:
+        X_processed_df = X_processed_df.reset_index(drop=True)
     
     # Process target
     # If y is dataframe with 1 column, convert to series
@@ -51,4 +210,203 @@ def preprocess_data(X, y):
     # User didn't specify, keeping as is for now or mapping for standard metric usage.
     # Let's just return it clean.
     
+    if return_preprocessor:
+        return X_processed_df, y, preprocessor
     return X_processed_df, y
+
+def get_feature_families(processed_columns, raw_columns):
+    """
+    Maps raw columns to the processed columns derived from them.
+    A numeric column keeps its own name, a categorical column becomes its
+    one-hot family f"{raw_col}_<category>".
+    
+    Args:
+        processed_columns (list): Columns of X_processed.
+        raw_columns (list): Raw column names (e.g. the selected sensitive features).
+        
+    Returns:
+        dict: {raw_col: [processed columns]}
+    """
+    families = {}
+    for raw_col in raw_columns:
+        cols = [raw_col] if raw_col in processed_columns else []
+        pfx = f"{raw_col}_"
+        cols.extend([c for c in processed_columns if c.startswith(pfx)])
+        families[raw_col] = cols
+    return families
+
+def _rewind(source):
+    """Rewinds a file-like CSV source (e.g. an upload) so it can be read again."""
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return source
+
+def preprocess_csv_streaming(source, target_col, chunksize=100_000, out_path=None, dtype=np.float64,
+                             return_raw=False):
+    """
+    Out-of-core version of preprocess_data for CSV files larger than memory.
+    
+    Pass 1 reads the file in chunks as text, decides the kind of every column over all
+    chunks (categorical as soon as one value is not a number, so an all-missing first
+    chunk does not make a column numeric), collects the categories, accumulates the
+    StandardScaler statistics with partial_fit and hashes the content. Pass 2 re-reads the
+    chunks with the decided dtypes and writes the encoded rows into a memory-mapped .npy
+    file, so resident memory stays bounded by the chunk size. The output matches
+    preprocess_data on the full frame (one-hot categories sorted, a missing value is its
+    own '<col>_nan' category sorted last, like OneHotEncoder).
+    
+    Without out_path the matrix is stored in <AEI cache>/preprocessed under the content
+    hash: re-uploading the same file reuses it (pass 2 is skipped) instead of leaving
+    another matrix-sized file behind.
+    
+    Args:
+        source (str or file-like): CSV path or seekable buffer.
+        target_col (str): Name of the target column.
+        chunksize (int): Rows per chunk.
+        out_path (str): Output .npy file. Defaults to a content-keyed file in <AEI cache>/preprocessed.
+        dtype (np.dtype): dtype of the encoded matrix.
+        return_raw (bool): Also return the raw feature columns, collected during pass 1
+                           (categorical columns as the compact 'category' dtype), so the
+                           caller does not have to parse the whole file again.
+        
+    Returns:
+        tuple: (X_processed_df, y_series), plus the raw feature frame if return_raw.
+               X_processed_df is backed by the read-only memmap.
+    """
+    columns = pd.read_csv(_rewind(source), nrows=0).columns
+    if target_col not in columns:
+        raise ValueError(f"Target column '{target_col}' is not in the CSV.")
+    feature_columns = [c for c in columns if c != target_col]
+    text_dtypes = {col: str for col in feature_columns}
+    
+    # --- Pass 1: column kinds, categories, scaler statistics, row count, content hash ---
+    # One scaler per column, fed only once the column has values; only the numeric ones are used
+    scalers = {}
+    categorical = set()
+    late = set()  # Turned categorical after earlier chunks were taken as numbers
+    categories = {col: set() for col in feature_columns}
+    has_missing = {col: False for col in feature_columns}
+    raw_parts = {col: [] for col in feature_columns}
+    targets = []
+    n_rows = 0
+    digest = hashlib.sha256(repr((target_col, np.dtype(dtype).name, PREPROCESSOR_VERSION)).encode())
+    # Schema first, so the hash does not depend on the chunk size
+    digest.update(repr([str(c) for c in columns]).encode())
+    
+    for chunk in pd.read_csv(_rewind(source), chunksize=chunksize, dtype=text_dtypes):
+        digest.update(pd.util.hash_pandas_object(chunk, index=False).to_numpy().tobytes())
+        targets.append(chunk[target_col].to_numpy())
+        for col in feature_columns:
+            text = chunk[col]
+            missing = text.isna()
+            if col not in categorical:
+                numbers = pd.to_numeric(text, errors='coerce')
+                if (numbers.isna() & ~missing).any():
+                    categorical.add(col)
+                    if n_rows:
+                        late.add(col)
+            if col in categorical:
+                has_missing[col] |= bool(missing.any())
+                categories[col].update(text[~missing].unique())
+                if return_raw:
+                    raw_parts[col].append(pd.Categorical(text))
+                continue
+            values = numbers.to_numpy(dtype=np.float64)
+            if not missing.all():
+                scalers.setdefault(col, StandardScaler()).partial_fit(values[:, None])
+            if return_raw:
+                raw_parts[col].append(values)
+        n_rows += len(chunk)
+    
+    if n_rows == 0:
+        raise ValueError("CSV source is empty.")
+    
+    if late:
+        # Values read as numbers before the first text value are categories too: re-read just these columns
+        late = sorted(late, key=feature_columns.index)
+        for col in late:
+            categories[col], has_missing[col], raw_parts[col] = set(), False, []
+        for chunk in pd.read_csv(_rewind(source), chunksize=chunksize, usecols=late, dtype=text_dtypes):
+            for col in late:
+                missing = chunk[col].isna()
+                has_missing[col] |= bool(missing.any())
+                categories[col].update(chunk[col][~missing].unique())
+                if return_raw:
+                    raw_parts[col].append(pd.Categorical(chunk[col]))
+    
+    numeric_features = [c for c in feature_columns if c not in categorical]
+    categorical_features = [c for c in feature_columns if c in categorical]
+    # A column without any value scales to NaN, like StandardScaler on the full frame
+    mean = np.array([scalers[c].mean_[0] if c in scalers else np.nan for c in numeric_features])
+    scale = np.array([scalers[c].scale_[0] if c in scalers else 1.0 for c in numeric_features])
+    
+    categories = {col: sorted(categories[col]) for col in categorical_features}
+    onehot_columns = []
+    for col in categorical_features:
+        onehot_columns += [f"{col}_{cat}" for cat in categories[col]]
+        if has_missing[col]:
+            onehot_columns.append(f"{col}_nan")
+    all_columns = numeric_features + onehot_columns
+    y = pd.Series(np.concatenate(targets), name=target_col)
+    
+    raw = None
+    if return_raw:
+        raw = pd.DataFrame({col: _concat_raw(raw_parts.pop(col), categories.get(col))
+                            for col in feature_columns})
+    
+    def result(X_processed):
+        X_processed_df = pd.DataFrame(X_processed, columns=all_columns, copy=False)
+        if return_raw:
+            return X_processed_df, y, raw
+        return X_processed_df, y
+    
+    if out_path is None:
+        out_path = os.path.join(get_cache_dir('preprocessed'), f"{digest.hexdigest()[:32]}.npy")
+        if os.path.exists(out_path):
+            return result(np.load(out_path, mmap_mode='r'))
+    
+    # --- Pass 2: encode chunk by chunk into a temporary memmap, then move it in place ---
+    pass2_dtypes = {col: (str if col in categorical else np.float64) for col in feature_columns}
+    fd, tmp_path = tempfile.mkstemp(suffix='.npy', dir=os.path.dirname(os.path.abspath(out_path)))
+    os.close(fd)
+    try:
+        out = open_memmap(tmp_path, mode='w+', dtype=dtype, shape=(n_rows, len(all_columns)))
+        start = 0
+        for chunk in pd.read_csv(_rewind(source), chunksize=chunksize, usecols=feature_columns,
+                                 dtype=pass2_dtypes):
+            stop = start + len(chunk)
+            block = out[start:stop]
+            block[:] = 0
+            if numeric_features:
+                block[:, :len(numeric_features)] = (chunk[numeric_features].to_numpy(dtype=np.float64) - mean) / scale
+            
+            offset = len(numeric_features)
+            for col in categorical_features:
+                codes = pd.Categorical(chunk[col], categories=categories[col]).codes.astype(np.int64)
+                if has_missing[col]:
+                    # The '<col>_nan' column follows the sorted categories
+                    codes[chunk[col].isna().to_numpy()] = len(categories[col])
+                known = codes >= 0
+                block[np.flatnonzero(known), offset + codes[known]] = 1
+                offset += len(categories[col]) + has_missing[col]
+            start = stop
+        out.flush()
+        del out
+        os.replace(tmp_path, out_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    
+    return result(np.load(out_path, mmap_mode='r'))
+
+def _concat_raw(parts, categories=None):
+    """Joins the per-chunk raw values of one column collected by preprocess_csv_streaming."""
+    if categories is not None:
+        codes = np.concatenate([part.set_categories(categories).codes for part in parts])
+        return pd.Categorical.from_codes(codes, categories=categories)
+    values = np.concatenate(parts)
+    # Whole numbers stay integers, as read_csv would have parsed them
+    if not np.isnan(values).any() and np.array_equal(values, np.round(values)):
+        return values.astype(np.int64)
+    return values
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse as sp
+from src.ethics.variants import family_variants, variant_batches
+from src.utils.precision import float_dtype
+
+def _dense_blocks(X, block_rows):
+    """
+    Yields (start, dense rows) blocks of X. A dense array is yielded whole; a sparse
+    matrix is densified block_rows rows at a time.
+    """
+    if not sp.issparse(X):
+        yield 0, X
+        return
+    dtype = float_dtype(X)
+    for start in range(0, X.shape[0], block_rows):
+        yield start, X[start:start + block_rows].toarray().astype(dtype, copy=False)
+
+def _score(model, batch, columns):
+    """
+    Returns (labels, probability matrix or None) for one stacked batch. Without
+    columns (a model fitted on a sparse matrix) the batch is scored as is.
+    """
+    frame = batch if columns is None else pd.DataFrame(batch, columns=columns, copy=False)
+    if hasattr(model, 'predict_proba'):
+        proba = model.predict_proba(frame)
+        return model.classes_[proba.argmax(axis=1)], proba
+    return np.asarray(model.predict(frame)), None
+
+def counterfactual_flip_test(model, X_processed, families, numeric_quantiles=(0.1, 0.25, 0.5, 0.75, 0.9),
+                             max_batch_rows=500_000):
+    """
+    Checks whether decisions change when only a sensitive attribute changes.
+
+    For every sensitive feature, each row is copied once per alternative value of
+    that feature (all other columns untouched). The copies are stacked into large
+    batches of at most max_batch_rows rows and scored with one predict_proba (or
+    predict) call per batch, instead of row by row. A CSR matrix is densified one
+    batch of rows at a time.
+
+    Args:
+        model: Fitted classifier.
+        X_processed (pd.DataFrame or scipy.sparse matrix): The processed dataset the model
+            was trained on (CSR with the column names as .columns, see with_columns).
+        families (dict): {raw_col: [processed columns]}, see get_feature_families.
+        numeric_quantiles (tuple): Quantiles used as counterfactual values of numeric features.
+        max_batch_rows (int): Upper bound on the rows of one stacked batch.
+
+    Returns:
+        dict: {raw_col: {
+                'flip_rate': share of rows whose decision changes for at least one alternative value,
+                'level_flip_rates': {level: share of rows (not already at that level) whose decision changes},
+                'mean_max_proba_shift': mean over rows of the largest probability change (NaN without predict_proba),
+                'flipped_rows': positions of the rows whose decision changes,
+                'n_rows': number of rows tested
+              }}
+    """
+    if sp.issparse(X_processed):
+        X, columns = X_processed.tocsr(), None
+    else:
+        X, columns = X_processed.to_numpy(dtype=float_dtype(X_processed)), X_processed.columns
+    n = X.shape[0]
+
+    base_pred, base_proba = _score(model, X, columns)
+
+    results = {}
+    for raw_col, family_cols in families.items():
+        if not family_cols:
+            continue
+        positions, labels, values = family_variants(X_processed, raw_col, family_cols, numeric_quantiles)
+        n_variants = len(values)
+
+        same_level = np.zeros((n, n_variants), dtype=bool)
+        flipped = np.zeros((n, n_variants), dtype=bool)
+        proba_shift = np.zeros(n)
+
+        for offset, block in _dense_blocks(X, max(1, max_batch_rows // n_variants)):
+            # Rows already at a level are not counterfactuals of that level
+            current = block[:, positions]
+            same_level[offset:offset + len(block)] = np.all(current[:, None, :] == values[None, :, :], axis=2)
+
+            for start, stop, view in variant_batches(block, positions, values, max_batch_rows):
+                rows = stop - start
+                start, stop = start + offset, stop + offset
+                pred, proba = _score(model, view, columns)
+                flipped[start:stop] = pred.reshape(rows, n_variants) != base_pred[start:stop, None]
+                if proba is not None:
+                    shift = np.abs(proba.reshape(rows, n_variants, -1) - base_proba[start:stop, None, :]).max(axis=2)
+                    proba_shift[start:stop] = shift.max(axis=1)
+
+        flipped &= ~same_level
+        eligible = (~same_level).sum(axis=0)
+        level_rates = np.divide(flipped.sum(axis=0), eligible, out=np.full(n_variants, np.nan), where=eligible > 0)
+        any_flip = flipped.any(axis=1)
+
+        results[raw_col] = {
+            'flip_rate': float(any_flip.mean()) if n else 0.0,
+            'level_flip_rates': dict(zip(labels, level_rates)),
+            'mean_max_proba_shift': float(proba_shift.mean()) if base_proba is not None and n else np.nan,
+            'flipped_rows': np.flatnonzero(any_flip),
+            'n_rows': n
+        }
+
+    return results
@@ -1,4 +1,6 @@
 import pandas as pd
+import numpy as np
+from collections import deque
 from fairlearn.metrics import (
     MetricFrame,
     selection_rate,
@@ -7,7 +9,8 @@ from fairlearn.metrics import (
 )
 from sklearn.metrics import accuracy_score
 
-def calculate_fairness_metrics(y_true, y_pred, sensitive_features, unique_privileged_group):
+def calculate_fairness_metrics(y_true, y_pred, sensitive_features, unique_privileged_group,
+                               n_bootstrap=0, confidence=0.95, random_state=42):
     """
     Calculates fairness metrics for a given model prediction.
     
@@ -16,9 +19,13 @@ def calculate_fairness_metrics(y_true, y_pred, sensitive_features, unique_privil
         y_pred (pd.Series): Predicted targets.
         sensitive_features (pd.Series): Sensitive attribute column (e.g. Sex).
         unique_privileged_group (str/int): The value indicating the privileged group (e.g. 'Male').
+        n_bootstrap (int): If > 0, adds bootstrap confidence intervals (see bootstrap_fairness_intervals).
+        confidence (float): Confidence level of the intervals.
+        random_state (int): Seed for the bootstrap.
         
     Returns:
-        dict: Dictionary containing fairness and performance metrics.
+        dict: Dictionary containing fairness and performance metrics, including the
+              error-rate metrics of _error_rate_metrics.
     """
     
     # Selection Rate (Overall)
@@ -46,10 +53,509 @@ def calculate_fairness_metrics(y_true, y_pred, sensitive_features, unique_privil
     # Fairness Metric Frame (Detailed view per group) using MetricFrame
     # For now, we return summary scalars, but MetricFrame is powerful for detailed reports.
     
-    return {
+    metrics = {
         "accuracy": acc,
         "selection_rate": sr,
         "statistical_parity_difference": spd,
         "disparate_impact": dpr,
         "demographic_parity_ratio": dpr # Alias for clarity
     }
+    
+    # Error-rate metrics (equalized odds, equal opportunity, predictive parity, FPR/FNR)
+    # from one (group, y_true, y_pred) count tensor instead of a MetricFrame per metric
+    y_true_arr, y_pred_arr = _as_label_array(y_true), _as_label_array(y_pred)
+    codes, groups = pd.factorize(sensitive_features, sort=True)
+    counts = _group_confusion_counts(codes, len(groups), y_true_arr == 1, y_pred_arr == 1)
+    metrics.update(_error_rate_metrics(groups, counts))
+    
+    if n_bootstrap > 0:
+        metrics.update(bootstrap_fairness_intervals(
+            y_true, y_pred, sensitive_features, n_bootstrap=n_bootstrap,
+            confidence=confidence, random_state=random_state
+        ))
+    
+    return metrics
+
+def _as_label_array(y):
+    """Flattens a Series / single-column DataFrame / array into a 1-D numpy array."""
+    return np.asarray(y).ravel()
+
+def _group_confusion_counts(codes, n_groups, is_true_pos, is_pred_pos):
+    """
+    Builds the (group, y_true, y_pred) count tensor with a single bincount.
+    
+    Args:
+        codes (np.ndarray): Group code per row (from pd.factorize); negative codes are skipped.
+        n_groups (int): Number of groups.
+        is_true_pos (np.ndarray): Boolean, y_true == pos_label.
+        is_pred_pos (np.ndarray): Boolean, y_pred == pos_label.
+        
+    Returns:
+        np.ndarray: int64 array of shape (n_groups, 2, 2), indexed [group, y_true, y_pred].
+    """
+    valid = codes >= 0
+    cell = codes[valid] * 4 + is_true_pos[valid] * 2 + is_pred_pos[valid]
+    return np.bincount(cell, minlength=n_groups * 4).reshape(n_groups, 2, 2)
+
+def _error_rate_metrics(groups, counts):
+    """
+    Group-wise error-rate metrics from a (group, y_true, y_pred) count tensor.
+    
+    Args:
+        groups (list): Group labels, aligned with counts.
+        counts (np.ndarray): (n_groups, 2, 2) tensor from _group_confusion_counts.
+        
+    Returns:
+        dict: 'equalized_odds_difference' (max of the TPR and FPR gaps, as in fairlearn),
+              'equal_opportunity_difference' (TPR gap), 'predictive_parity_difference'
+              (precision gap) and per-group dicts 'group_true_positive_rates',
+              'group_false_positive_rates', 'group_false_negative_rates', 'group_precision'.
+              Groups where a rate is undefined (e.g. no positives) get NaN and are
+              left out of the gaps.
+    """
+    counts = counts.astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        tpr = counts[:, 1, 1] / counts[:, 1, :].sum(axis=1)
+        fpr = counts[:, 0, 1] / counts[:, 0, :].sum(axis=1)
+        ppv = counts[:, 1, 1] / counts[:, :, 1].sum(axis=1)
+    
+    def gap(rates):
+        rates = rates[~np.isnan(rates)]
+        return float(rates.max() - rates.min()) if len(rates) else np.nan
+    
+    tpr_gap, fpr_gap = gap(tpr), gap(fpr)
+    eod = np.nan if np.isnan(tpr_gap) and np.isnan(fpr_gap) else float(np.nanmax([tpr_gap, fpr_gap]))
+    return {
+        "equalized_odds_difference": eod,
+        "equal_opportunity_difference": tpr_gap,
+        "predictive_parity_difference": gap(ppv),
+        "group_true_positive_rates": dict(zip(groups, tpr)),
+        "group_false_positive_rates": dict(zip(groups, fpr)),
+        "group_false_negative_rates": dict(zip(groups, 1 - tpr)),
+        "group_precision": dict(zip(groups, ppv))
+    }
+
+def calculate_multi_fairness_metrics(y_true, y_pred, sensitive_frame, pos_label=1,
+                                     n_bootstrap=0, confidence=0.95, random_state=42):
+    """
+    Calculates fairness metrics for several sensitive attributes in one pass.
+    Each column is factorized once and per-group confusion counts come from one
+    bincount, so no per-metric regrouping. Numerically matches the fairlearn-based
+    calculate_fairness_metrics (selection_rate, demographic_parity_difference/ratio).
+    
+    Args:
+        y_true (pd.Series): True targets.
+        y_pred (pd.Series): Predicted targets.
+        sensitive_frame (pd.DataFrame): One column per sensitive attribute.
+        pos_label (int/str): The favourable outcome (fairlearn default 1).
+        n_bootstrap (int): If > 0, adds bootstrap confidence intervals per attribute.
+        confidence (float): Confidence level of the intervals.
+        random_state (int): Seed for the bootstrap.
+        
+    Returns:
+        dict: {attribute: metrics dict} with the keys of calculate_fairness_metrics plus
+              'group_selection_rates' and 'group_accuracy' ({group: value}).
+    """
+    y_true = _as_label_array(y_true)
+    y_pred = _as_label_array(y_pred)
+    is_true_pos = y_true == pos_label
+    is_pred_pos = y_pred == pos_label
+    is_correct = y_true == y_pred
+    
+    # Overall values are shared by every attribute
+    acc = is_correct.mean()
+    sr = is_pred_pos.mean()
+    
+    results = {}
+    for col in sensitive_frame.columns:
+        codes, groups = pd.factorize(sensitive_frame[col], sort=True)
+        counts = _group_confusion_counts(codes, len(groups), is_true_pos, is_pred_pos)
+        correct = np.bincount(codes[codes >= 0], weights=is_correct[codes >= 0], minlength=len(groups))
+        
+        group_size = counts.sum(axis=(1, 2))
+        group_sr = counts[:, :, 1].sum(axis=1) / group_size
+        group_acc = correct / group_size
+        
+        spd = group_sr.max() - group_sr.min()
+        dpr = group_sr.min() / group_sr.max() if group_sr.max() > 0 else 0.0
+        
+        results[col] = {
+            "accuracy": acc,
+            "selection_rate": sr,
+            "statistical_parity_difference": spd,
+            "disparate_impact": dpr,
+            "demographic_parity_ratio": dpr, # Alias for clarity
+            "group_selection_rates": dict(zip(groups, group_sr)),
+            "group_accuracy": dict(zip(groups, group_acc))
+        }
+        # Error-rate metrics come from the same count tensor
+        results[col].update(_error_rate_metrics(groups, counts))
+        
+        if n_bootstrap > 0:
+            results[col].update(bootstrap_fairness_intervals(
+                y_true, y_pred, sensitive_frame[col], n_bootstrap=n_bootstrap,
+                confidence=confidence, pos_label=pos_label, random_state=random_state
+            ))
+    
+    return results
+
+def bootstrap_fairness_intervals(y_true, y_pred, sensitive_features, n_bootstrap=2000, confidence=0.95,
+                                 pos_label=1, random_state=42):
+    """
+    Percentile bootstrap confidence intervals for SPD, disparate impact and accuracy.
+    
+    Uses a Poisson bootstrap: every replicate re-weights each row with a Poisson(1) count,
+    so all replicates are one (n_bootstrap x n) weight matrix times per-row indicator
+    vectors [in group g | in group g and predicted positive | correct].
+    The metrics only depend on the weight sums over rows with identical indicators
+    (group, predicted positive, correct), and a sum of m Poisson(1) weights is Poisson(m).
+    The weight matrix is therefore drawn directly per indicator cell, an
+    (n_bootstrap x 4 * n_groups) matrix with the same distribution, so the cost no
+    longer depends on the number of rows.
+    
+    Args:
+        y_true (pd.Series): True targets.
+        y_pred (pd.Series): Predicted targets.
+        sensitive_features (pd.Series): Sensitive attribute column.
+        n_bootstrap (int): Number of bootstrap replicates.
+        confidence (float): Confidence level (e.g. 0.95).
+        pos_label (int/str): The favourable outcome.
+        random_state (int): Seed for the resampling weights.
+        
+    Returns:
+        dict: 'statistical_parity_difference_ci', 'disparate_impact_ci', 'accuracy_ci'
+              as (low, high) tuples.
+    """
+    y_true = _as_label_array(y_true)
+    y_pred = _as_label_array(y_pred)
+    codes, groups = pd.factorize(sensitive_features, sort=True)
+    n_groups = len(groups)
+    
+    # Collapse rows into (group, predicted positive, correct) cells
+    valid = codes >= 0
+    cell = codes[valid] * 4 + (y_pred == pos_label)[valid] * 2 + (y_true == y_pred)[valid]
+    cell_counts = np.bincount(cell, minlength=n_groups * 4)
+    
+    # Indicator vectors per cell: [in group g] (n_groups), [group g & positive] (n_groups), [correct]
+    cell_ids = np.arange(n_groups * 4)
+    cell_group, cell_pos, cell_correct = cell_ids // 4, (cell_ids // 2) % 2, cell_ids % 2
+    indicators = np.zeros((n_groups * 4, 2 * n_groups + 1))
+    indicators[cell_ids, cell_group] = 1
+    indicators[cell_ids, n_groups + cell_group] = cell_pos
+    indicators[:, -1] = cell_correct
+    
+    rng = np.random.default_rng(random_state)
+    weights = rng.poisson(cell_counts, size=(n_bootstrap, len(cell_counts))).astype(np.float64)
+    sums = weights @ indicators
+    totals = weights.sum(axis=1)
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # A group can vanish from a replicate; it is then ignored for that replicate
+        group_sr = sums[:, n_groups:2 * n_groups] / sums[:, :n_groups]
+        sr_max = np.nanmax(group_sr, axis=1)
+        sr_min = np.nanmin(group_sr, axis=1)
+        spd = sr_max - sr_min
+        di = np.where(sr_max > 0, sr_min / sr_max, 0.0)
+        acc = sums[:, -1] / totals
+    
+    alpha = (1 - confidence) / 2
+    
+    def interval(values):
+        low, high = np.nanquantile(values, [alpha, 1 - alpha])
+        return (float(low), float(high))
+    
+    return {
+        "statistical_parity_difference_ci": interval(spd),
+        "disparate_impact_ci": interval(di),
+        "accuracy_ci": interval(acc)
+    }
+
+def fairness_threshold_curve(y_true, y_score, sensitive_features, pos_label=1):
+    """
+    Fairness / accuracy trade-off for every distinct decision threshold on the scores.
+    
+    A row is selected at threshold t if its score >= t. Scores are sorted once
+    (descending) and per-group selected / true-positive counts at every threshold are
+    cumulative sums read at the end of each run of tied scores, so the whole curve costs
+    O(n log n) instead of one metric pass per threshold.
+    
+    Args:
+        y_true (pd.Series): True targets.
+        y_score (array-like): Score of the favourable class, e.g. predict_proba(X)[:, k].
+        sensitive_features (pd.Series): Sensitive attribute column.
+        pos_label (int/str): The favourable outcome.
+        
+    Returns:
+        pd.DataFrame: One row per distinct threshold (descending) with 'threshold', 'accuracy',
+                      'selection_rate', 'statistical_parity_difference', 'disparate_impact' and
+                      per group 'selection_rate [g]', 'true_positive_rate [g]',
+                      'false_positive_rate [g]'.
+    """
+    y_true = _as_label_array(y_true)
+    y_score = np.asarray(y_score, dtype=np.float64).ravel()
+    codes, groups = pd.factorize(sensitive_features, sort=True)
+    
+    # Rows with a missing attribute value are left out
+    valid = codes >= 0
+    codes, y_score, is_true_pos = codes[valid], y_score[valid], (y_true == pos_label)[valid]
+    
+    order = np.argsort(-y_score, kind='stable')
+    scores = y_score[order]
+    codes, is_true_pos = codes[order], is_true_pos[order]
+    
+    # Last position of every run of equal scores = the cut for that threshold
+    ends = np.flatnonzero(np.r_[scores[1:] != scores[:-1], True])
+    n_selected = ends + 1
+    n = len(scores)
+    
+    tp_total = np.cumsum(is_true_pos)[ends]
+    fp_total = n_selected - tp_total
+    n_true_pos = is_true_pos.sum()
+    
+    curve = {
+        'threshold': scores[ends],
+        'accuracy': (tp_total + (n - n_true_pos - fp_total)) / n,
+        'selection_rate': n_selected / n
+    }
+    
+    group_sr = np.empty((len(groups), len(ends)))
+    group_cols = {}
+    for g, label in enumerate(groups):
+        in_group = codes == g
+        group_pos = is_true_pos & in_group
+        selected = np.cumsum(in_group)[ends]
+        tp = np.cumsum(group_pos)[ends]
+        n_group, n_pos = in_group.sum(), group_pos.sum()
+        n_neg = n_group - n_pos
+        
+        group_sr[g] = selected / n_group
+        group_cols[f'selection_rate [{label}]'] = group_sr[g]
+        group_cols[f'true_positive_rate [{label}]'] = tp / n_pos if n_pos > 0 else np.full(len(ends), np.nan)
+        group_cols[f'false_positive_rate [{label}]'] = (selected - tp) / n_neg if n_neg > 0 else np.full(len(ends), np.nan)
+    
+    sr_max, sr_min = group_sr.max(axis=0), group_sr.min(axis=0)
+    curve['statistical_parity_difference'] = sr_max - sr_min
+    with np.errstate(invalid='ignore', divide='ignore'):
+        curve['disparate_impact'] = np.where(sr_max > 0, sr_min / sr_max, 0.0)
+    curve.update(group_cols)
+    
+    return pd.DataFrame(curve)
+
+def _fairness_from_counts(groups, counts):
+    """
+    SPD / DI / accuracy from per-group [size, predicted positive, correct] counts.
+    
+    Args:
+        groups (list): Group labels, aligned with counts.
+        counts (np.ndarray): (n_groups, 3) array of [size, predicted positive, correct].
+        
+    Returns:
+        dict: Same scalar keys as calculate_fairness_metrics plus 'group_selection_rates',
+              'group_accuracy' and 'n_samples'. Empty groups are ignored.
+    """
+    seen = counts[:, 0] > 0
+    n = counts[:, 0].sum()
+    if n == 0:
+        return {
+            "accuracy": np.nan, "selection_rate": np.nan,
+            "statistical_parity_difference": np.nan, "disparate_impact": np.nan,
+            "demographic_parity_ratio": np.nan,
+            "group_selection_rates": {}, "group_accuracy": {}, "n_samples": 0
+        }
+    
+    group_n = counts[seen, 0]
+    group_sr = counts[seen, 1] / group_n
+    group_acc = counts[seen, 2] / group_n
+    seen_groups = [g for g, s in zip(groups, seen) if s]
+    
+    spd = group_sr.max() - group_sr.min()
+    dpr = group_sr.min() / group_sr.max() if group_sr.max() > 0 else 0.0
+    
+    return {
+        "accuracy": counts[:, 2].sum() / n,
+        "selection_rate": counts[:, 1].sum() / n,
+        "statistical_parity_difference": spd,
+        "disparate_impact": dpr,
+        "demographic_parity_ratio": dpr, # Alias for clarity
+        "group_selection_rates": dict(zip(seen_groups, group_sr)),
+        "group_accuracy": dict(zip(seen_groups, group_acc)),
+        "n_samples": int(n)
+    }
+
+class StreamingFairnessAccumulator:
+    """
+    Online fairness metrics over mini-batches of logged decisions.
+    
+    Only per-group [size, predicted positive, correct] counts are kept, so memory is
+    O(groups) for the running totals (and O(window * groups) for a sliding window),
+    independent of how many rows have been seen. Windows are counted in batches:
+        - window=None: running totals only
+        - mode='tumbling': the current window is reset every `window` batches; the
+          metrics of the last completed window stay available
+        - mode='sliding': the current window always covers the last `window` batches
+    Partial states from parallel workers can be combined with merge().
+    """
+    
+    def __init__(self, window=None, mode='tumbling', pos_label=1):
+        """
+        Args:
+            window (int): Window length in batches, or None for running totals only.
+            mode (str): 'tumbling' or 'sliding'.
+            pos_label (int/str): The favourable outcome.
+        """
+        if mode not in ('tumbling', 'sliding'):
+            raise ValueError(f"Unknown window mode '{mode}'. Use 'tumbling' or 'sliding'.")
+        if window is not None and window < 1:
+            raise ValueError("window must be a positive number of batches.")
+        
+        self.window = window
+        self.mode = mode
+        self.pos_label = pos_label
+        
+        self.groups = []            # group labels in first-seen order
+        self._group_pos = {}        # label -> row in the count arrays
+        self.totals = np.zeros((0, 3), dtype=np.int64)
+        self.window_counts = np.zeros((0, 3), dtype=np.int64)
+        self.window_batches = deque()  # sliding mode: per-batch counts of the current window
+        self.batches_in_window = 0
+        self.last_window = None     # tumbling mode: counts of the last completed window
+        self.n_batches = 0
+    
+    def _pad(self, counts):
+        """Grows a count array to the current number of groups (new groups have zero counts)."""
+        missing = len(self.groups) - len(counts)
+        if missing > 0:
+            counts = np.vstack([counts, np.zeros((missing, 3), dtype=np.int64)])
+        return counts
+    
+    def _positions(self, labels):
+        """Maps group labels to count rows, registering unseen groups."""
+        for g in labels:
+            if g not in self._group_pos:
+                self._group_pos[g] = len(self.groups)
+                self.groups.append(g)
+        return np.array([self._group_pos[g] for g in labels], dtype=np.int64)
+    
+    def _batch_counts(self, y_true, y_pred, sensitive):
+        """Per-group counts of one batch, aligned with self.groups."""
+        y_true = _as_label_array(y_true)
+        y_pred = _as_label_array(y_pred)
+        codes, labels = pd.factorize(_as_label_array(sensitive))
+        positions = self._positions(list(labels))
+        
+        valid = codes >= 0
+        rows = positions[codes[valid]]
+        n_groups = len(self.groups)
+        counts = np.zeros((n_groups, 3), dtype=np.int64)
+        counts[:, 0] = np.bincount(rows, minlength=n_groups)
+        counts[:, 1] = np.bincount(rows, weights=(y_pred == self.pos_label)[valid], minlength=n_groups)
+        counts[:, 2] = np.bincount(rows, weights=(y_true == y_pred)[valid], minlength=n_groups)
+        return counts
+    
+    def update(self, y_true, y_pred, sensitive):
+        """
+        Adds one mini-batch of decisions.
+        
+        Args:
+            y_true (array-like): True targets.
+            y_pred (array-like): Predicted targets.
+            sensitive (array-like): Sensitive attribute value per row.
+            
+        Returns:
+            StreamingFairnessAccumulator: self, for chaining.
+        """
+        counts = self._batch_counts(y_true, y_pred, sensitive)
+        self.totals = self._pad(self.totals) + counts
+        self.n_batches += 1
+        
+        if self.window is None:
+            return self
+        
+        self.window_counts = self._pad(self.window_counts) + counts
+        if self.mode == 'sliding':
+            self.window_batches.append(counts)
+            if len(self.window_batches) > self.window:
+                self.window_counts -= self._pad(self.window_batches.popleft())
+            self.batches_in_window = len(self.window_batches)
+        else:
+            self.batches_in_window += 1
+            if self.batches_in_window == self.window:
+                self.last_window = self.window_counts
+                self.window_counts = np.zeros((len(self.groups), 3), dtype=np.int64)
+                self.batches_in_window = 0
+        return self
+    
+    def metrics(self, scope='total'):
+        """
+        Current fairness metrics.
+        
+        Args:
+            scope (str): 'total' (everything seen), 'window' (the current window) or
+                         'last_window' (last completed tumbling window).
+                         
+        Returns:
+            dict: See _fairness_from_counts.
+        """
+        if scope == 'total':
+            counts = self.totals
+        elif scope == 'window':
+            if self.window is None:
+                raise ValueError("Accumulator has no window. Pass window=... to track one.")
+            counts = self.window_counts
+        elif scope == 'last_window':
+            if self.mode != 'tumbling' or self.window is None:
+                raise ValueError("'last_window' is only available for tumbling windows.")
+            counts = self.last_window if self.last_window is not None else np.zeros((0, 3), dtype=np.int64)
+        else:
+            raise ValueError(f"Unknown scope '{scope}'. Use 'total', 'window' or 'last_window'.")
+        return _fairness_from_counts(self.groups, self._pad(counts))
+    
+    def merge(self, other):
+        """
+        Folds another accumulator (e.g. from a parallel worker) into this one.
+        
+        Running totals are added. For windows, both states are treated as covering the
+        same stretch of time: sliding windows are added batch by batch from the most
+        recent one, tumbling windows add their current and last completed windows.
+        
+        Args:
+            other (StreamingFairnessAccumulator): State with the same window settings.
+            
+        Returns:
+            StreamingFairnessAccumulator: self, for chaining.
+        """
+        if (other.window, other.mode, other.pos_label) != (self.window, self.mode, self.pos_label):
+            raise ValueError("Can only merge accumulators with the same window, mode and pos_label.")
+        
+        # Re-index the other state's groups onto ours
+        positions = self._positions(list(other.groups))
+        n_groups = len(self.groups)
+        
+        def aligned(counts):
+            out = np.zeros((n_groups, 3), dtype=np.int64)
+            out[positions[:len(counts)]] = counts
+            return out
+        
+        self.totals = self._pad(self.totals) + aligned(other.totals)
+        self.n_batches += other.n_batches
+        
+        if self.window is None:
+            return self
+        
+        self.window_counts = self._pad(self.window_counts) + aligned(other.window_counts)
+        if self.mode == 'sliding':
+            ours = [self._pad(c) for c in self.window_batches]
+            theirs = [aligned(c) for c in other.window_batches]
+            # Align on the most recent batch
+            if len(theirs) > len(ours):
+                ours = [np.zeros((n_groups, 3), dtype=np.int64)] * (len(theirs) - len(ours)) + ours
+            for i, c in enumerate(theirs):
+                ours[len(ours) - len(theirs) + i] = ours[len(ours) - len(theirs) + i] + c
+            self.window_batches = deque(ours)
+            self.batches_in_window = len(ours)
+        else:
+            self.batches_in_window = max(self.batches_in_window, other.batches_in_window)
+            if other.last_window is not None:
+                mine = self._pad(self.last_window) if self.last_window is not None else 0
+                self.last_window = mine + aligned(other.last_window)
+        return self
@@ -0,0 +1,291 @@
+import os
+import json
+import hashlib
+import shutil
+import tempfile
+import datetime
+import logging
+import joblib
+import numpy as np
+import pandas as pd
+from scipy import sparse as sp
+from src.ethics.similarity import SimilarityAnalyzer
+from src.ethics.neighbors import MaskedNeighborsView
+from src.utils.cache import get_cache_dir, fingerprint_frame
+
+logger = logging.getLogger(__name__)
+
+# Bump when the on-disk layout changes; older entries are then ignored and rebuilt
+INDEX_STORE_VERSION = 2
+
+def _hash_parts(*parts):
+    """32 character hex digest of the repr() of the given key parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(repr(part).encode())
+    return digest.hexdigest()[:32]
+
+def _require_dense(X_processed):
+    """The store fingerprints and memory-maps dense matrices only; sparse input is rejected."""
+    if sp.issparse(X_processed):
+        raise ValueError("SimilarityIndexStore needs a dense DataFrame; sparse (CSR) input is not supported. "
+                         "Train the SimilarityAnalyzer directly instead.")
+
+class SimilarityIndexStore:
+    """
+    On-disk store of fitted SimilarityAnalyzer indexes.
+
+    Entries are keyed by a content fingerprint of X_processed plus the masked
+    column set and backend, so the same dataset + sensitive mask reuses the index
+    across sessions and processes. Each entry is a directory holding:
+        - X_masked.npy: the masked feature matrix (loaded memory-mapped)
+        - index.joblib: the fitted neighbor index (numpy buffers memory-mapped)
+        - pair_index.npz: the threshold-sweep pair index, if it was built
+        - meta.json: columns, masked columns, backend and store version
+
+    Analyzers backed by a view of a SharedMaskIndex only record their mask: the
+    shared index is stored once under shared/<shared key>/ (keyed by the data
+    fingerprint and the maskable pool), and both the view and X_masked are rebuilt
+    from it on load.
+    """
+
+    def __init__(self, root=None):
+        """
+        Args:
+            root (str): Store directory. Defaults to <AEI cache>/similarity.
+        """
+        self.root = root or get_cache_dir('similarity')
+        os.makedirs(self.root, exist_ok=True)
+        self._shared = {} # Shared indexes loaded by this store, by shared key
+
+    def data_key(self, X_processed):
+        """
+        Content fingerprint of the dataset. Hashing reads every value, so compute it
+        once and pass it to key() / load_or_train(). Sparse input is rejected (ValueError).
+
+        Returns:
+            str: Hex fingerprint.
+        """
+        _require_dense(X_processed)
+        return fingerprint_frame(X_processed)
+
+    def key(self, X_processed, sensitive_columns_masked, backend='exact', backend_params=None, data_key=None):
+        """
+        Builds the store key for a dataset / mask / backend combination (dense input only, see data_key).
+
+        Args:
+            data_key (str): Precomputed data_key(X_processed); computed if not given.
+
+        Returns:
+            str: Hex fingerprint.
+        """
+        _require_dense(X_processed)
+        masked = sorted(str(c) for c in X_processed.columns if c in sensitive_columns_masked)
+        params = sorted((backend_params or {}).items())
+        return _hash_parts(data_key or self.data_key(X_processed), masked, backend, params)
+
+    def shared_key(self, shared_index, data_key):
+        """Store key of a SharedMaskIndex fitted on the dataset with the given data_key."""
+        params = sorted(shared_index.backend_params.items())
+        return _hash_parts(data_key, 'shared', sorted(str(c) for c in shared_index.maskable_columns),
+                           shared_index.backend, params)
+
+    def save_shared(self, shared_index, data_key):
+        """
+        Stores a SharedMaskIndex once (a no-op if it is already stored).
+
+        Returns:
+            str: Its shared key (also set as shared_index.store_key).
+        """
+        key = self.shared_key(shared_index, data_key)
+        entry_dir = os.path.join(self.root, 'shared', key)
+        if not os.path.isdir(entry_dir):
+            os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+            tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(entry_dir), prefix=f".{key}-")
+            try:
+                joblib.dump(shared_index, os.path.join(tmp_dir, 'index.joblib'))
+                os.replace(tmp_dir, entry_dir)
+            except Exception:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                raise
+        shared_index.store_key = key
+        self._shared[key] = shared_index
+        return key
+
+    def load_shared(self, key):
+        """
+        Loads a stored SharedMaskIndex (memory-mapped, once per store instance).
+
+        Returns:
+            SharedMaskIndex or None: None if it is not stored.
+        """
+        if key in self._shared:
+            return self._shared[key]
+        path = os.path.join(self.root, 'shared', key, 'index.joblib')
+        if not os.path.exists(path):
+            return None
+        shared_index = joblib.load(path, mmap_mode='r')
+        shared_index.store_key = key
+        self._shared[key] = shared_index
+        return shared_index
+
+    def save(self, analyzer, key, data_key=None):
+        """
+        Serializes a trained analyzer under the given key (atomically replaces old entries).
+
+        Args:
+            analyzer (SimilarityAnalyzer): Trained analyzer.
+            key (str): Store key, see key().
+            data_key (str): data_key() of the dataset; needed the first time an analyzer
+                            backed by a shared index is saved.
+
+        Returns:
+            str: Entry directory.
+        """
+        if analyzer.knn_model is None:
+            raise ValueError("Model not trained. Call train() first.")
+        analyzer.merge_buffer()
+
+        shared_key = None
+        if isinstance(analyzer.knn_model, MaskedNeighborsView):
+            shared_index = analyzer.knn_model.shared
+            shared_key = shared_index.store_key
+            if shared_key is None:
+                if data_key is None:
+                    raise ValueError("data_key is required to store a new shared index.")
+                shared_key = self.save_shared(shared_index, data_key)
+
+        entry_dir = os.path.join(self.root, key)
+        tmp_dir = tempfile.mkdtemp(dir=self.root, prefix=f".{key}-")
+        try:
+            if shared_key is None:
+                np.save(os.path.join(tmp_dir, 'X_masked.npy'), analyzer.X_masked.to_numpy())
+                joblib.dump(analyzer.knn_model, os.path.join(tmp_dir, 'index.joblib'))
+            if analyzer.pair_index is not None:
+                np.savez(os.path.join(tmp_dir, 'pair_index.npz'), **analyzer.pair_index)
+
+            meta = {
+                'version': INDEX_STORE_VERSION,
+                'columns': [str(c) for c in analyzer.X_masked.columns],
+                'masked_columns': list(analyzer.masked_columns),
+                'backend': analyzer.backend,
+                'backend_params': analyzer.backend_params,
+                'shared_key': shared_key,
+                'n_rows': len(analyzer.X_masked),
+                'created': datetime.datetime.now().isoformat()
+            }
+            with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+
+            if os.path.isdir(entry_dir):
+                shutil.rmtree(entry_dir)
+            os.replace(tmp_dir, entry_dir)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        logger.info(f"Saved similarity index {key} ({meta['n_rows']} rows).")
+        return entry_dir
+
+    def save_pair_index(self, analyzer):
+        """
+        Rewrites only the pair index of a stored entry, e.g. after ensure_pair_index grew it.
+        The matrix and the neighbor index are left untouched, so nothing is written if the
+        analyzer holds rows the entry does not (add_rows buffer, different row count).
+
+        Args:
+            analyzer (SimilarityAnalyzer): Analyzer loaded from / saved to this store.
+
+        Returns:
+            str or None: Path of the pair index file, None if there is nothing to write.
+        """
+        if analyzer.pair_index is None or not analyzer.index_key or analyzer.buffer:
+            return None
+        entry_dir = os.path.join(self.root, analyzer.index_key)
+        meta_path = os.path.join(entry_dir, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            if json.load(f).get('n_rows') != analyzer.X_masked.shape[0]:
+                logger.warning(f"Not saving the pair index of {analyzer.index_key}: row count differs from the entry.")
+                return None
+
+        path = os.path.join(entry_dir, 'pair_index.npz')
+        fd, tmp_path = tempfile.mkstemp(dir=entry_dir, suffix='.npz')
+        os.close(fd)
+        np.savez(tmp_path, **analyzer.pair_index)
+        os.replace(tmp_path, path)
+        return path
+
+    def load(self, key):
+        """
+        Loads a stored analyzer. Large arrays are memory-mapped, not read.
+
+        Args:
+            key (str): Store key, see key().
+
+        Returns:
+            SimilarityAnalyzer or None: None if the entry is missing or from another store version.
+        """
+        entry_dir = os.path.join(self.root, key)
+        meta_path = os.path.join(entry_dir, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('version') != INDEX_STORE_VERSION:
+            logger.warning(f"Ignoring similarity index {key} from store version {meta.get('version')}.")
+            return None
+
+        analyzer = SimilarityAnalyzer(backend=meta['backend'], backend_params=meta['backend_params'])
+        analyzer.masked_columns = meta['masked_columns']
+        if meta.get('shared_key'):
+            shared_index = self.load_shared(meta['shared_key'])
+            if shared_index is None:
+                return None
+            analyzer.knn_model = shared_index.view(meta['masked_columns'])
+            analyzer.X_masked = shared_index.masked_matrix(meta['masked_columns'])
+        else:
+            X_masked = np.load(os.path.join(entry_dir, 'X_masked.npy'), mmap_mode='r')
+            analyzer.X_masked = pd.DataFrame(X_masked, columns=meta['columns'], copy=False)
+            analyzer.knn_model = joblib.load(os.path.join(entry_dir, 'index.joblib'), mmap_mode='r')
+
+        pair_path = os.path.join(entry_dir, 'pair_index.npz')
+        if os.path.exists(pair_path):
+            with np.load(pair_path) as data:
+                analyzer.pair_index = {k: data[k] for k in data.files}
+                analyzer.pair_index['max_distance'] = float(analyzer.pair_index['max_distance'])
+
+        analyzer.index_key = key
+        return analyzer
+
+    def load_or_train(self, X_processed, sensitive_columns_masked, backend='exact', backend_params=None,
+                      shared_index=None, data_key=None):
+        """
+        Returns the stored analyzer for this dataset / mask, training and saving it on a miss.
+
+        Args:
+            X_processed (pd.DataFrame): The fully processed (numeric) dataset.
+            sensitive_columns_masked (list): Columns ignored for similarity.
+            backend (str): Neighbor backend, see SimilarityAnalyzer.
+            backend_params (dict): Backend parameters.
+            shared_index (SharedMaskIndex): Optional shared structure used on a miss instead of a new fit.
+            data_key (str): Precomputed data_key(X_processed), so the data is hashed only once.
+
+        Returns:
+            SimilarityAnalyzer: Trained analyzer (with index_key set).
+        """
+        data_key = data_key or self.data_key(X_processed)
+        key = self.key(X_processed, sensitive_columns_masked, backend, backend_params, data_key=data_key)
+
+        analyzer = self.load(key)
+        if analyzer is not None:
+            logger.info(f"Reusing stored similarity index {key}.")
+            return analyzer
+
+        analyzer = SimilarityAnalyzer(backend=backend, backend_params=backend_params)
+        analyzer.train(X_processed, sensitive_columns_masked=sensitive_columns_masked, shared_index=shared_index)
+        self.save(analyzer, key, data_key=data_key)
+        analyzer.index_key = key
+        return analyzer
@@ -0,0 +1,153 @@
+import pandas as pd
+import numpy as np
+from itertools import combinations
+
+def _bucket_numeric(col, numeric_bins, max_levels):
+    """Quantile-buckets numeric columns with many distinct values (e.g. age); others pass through."""
+    if pd.api.types.is_numeric_dtype(col) and col.nunique() > max_levels:
+        return pd.qcut(col, q=numeric_bins, duplicates='drop').astype(str)
+    return col
+
+def build_fairness_cube(y_true, y_pred, sensitive_frame, pos_label=1, numeric_bins=4, max_levels=10):
+    """
+    Builds one group-by cube of prediction / label counts over all sensitive attributes.
+    Only non-empty cells are stored, so the cube is at most n rows even for many attributes.
+
+    Args:
+        y_true (pd.Series): True targets.
+        y_pred (pd.Series): Predicted targets.
+        sensitive_frame (pd.DataFrame): One column per sensitive attribute.
+        pos_label (int/str): The favourable outcome.
+        numeric_bins (int): Quantile buckets for numeric attributes.
+        max_levels (int): Numeric attributes with more distinct values than this are bucketed.
+
+    Returns:
+        dict: 'attributes', 'levels' (list of level arrays), 'cell_codes' (n_cells, n_attributes),
+              and per-cell count arrays 'n', 'pred_pos', 'true_pos', 'tp', 'correct'.
+    """
+    y_true = np.asarray(y_true).ravel()
+    y_pred = np.asarray(y_pred).ravel()
+    attributes = list(sensitive_frame.columns)
+
+    codes, levels = [], []
+    for attr in attributes:
+        c, lv = pd.factorize(_bucket_numeric(sensitive_frame[attr], numeric_bins, max_levels), sort=True)
+        codes.append(c)
+        levels.append(np.asarray(lv))
+    codes = np.vstack(codes)
+
+    # Rows with a missing attribute value are left out of the cube
+    valid = (codes >= 0).all(axis=0)
+    dims = tuple(len(lv) for lv in levels)
+    flat = np.ravel_multi_index(codes[:, valid], dims)
+    cells, cell_of_row = np.unique(flat, return_inverse=True)
+
+    is_true_pos = (y_true == pos_label)[valid]
+    is_pred_pos = (y_pred == pos_label)[valid]
+    is_correct = (y_true == y_pred)[valid]
+
+    def cell_sum(weights):
+        return np.bincount(cell_of_row, weights=weights, minlength=len(cells))
+
+    return {
+        'attributes': attributes,
+        'levels': levels,
+        'cell_codes': np.array(np.unravel_index(cells, dims)).T,
+        'n': np.bincount(cell_of_row, minlength=len(cells)).astype(np.float64),
+        'pred_pos': cell_sum(is_pred_pos),
+        'true_pos': cell_sum(is_true_pos),
+        'tp': cell_sum(is_pred_pos & is_true_pos),
+        'correct': cell_sum(is_correct)
+    }
+
+def intersectional_fairness(y_true, y_pred, sensitive_frame, min_support=30, max_order=None,
+                            pos_label=1, numeric_bins=4, max_levels=10):
+    """
+    Fairness metrics for every intersection of the sensitive attributes, ranked worst first.
+
+    All subsets of attributes are rolled up from one cube (build_fairness_cube) instead of
+    re-grouping the data per combination. Groups below min_support are dropped, and their
+    cells are pruned from every larger intersection (a superset group can never have more
+    support than its parents), which keeps 5-6 attributes tractable.
+
+    Args:
+        y_true (pd.Series): True targets.
+        y_pred (pd.Series): Predicted targets.
+        sensitive_frame (pd.DataFrame): One column per sensitive attribute.
+        min_support (int): Minimum group size to report.
+        max_order (int): Largest intersection size. Defaults to all attributes.
+        pos_label (int/str): The favourable outcome.
+        numeric_bins (int): Quantile buckets for numeric attributes.
+        max_levels (int): Numeric attributes with more distinct values than this are bucketed.
+
+    Returns:
+        pd.DataFrame: One row per supported group with 'attributes', 'group', 'order', 'support',
+                      'selection_rate', 'accuracy', 'true_positive_rate',
+                      'statistical_parity_difference' and 'disparate_impact' (both vs. the overall
+                      selection rate), sorted by disparate_impact ascending.
+    """
+    cube = build_fairness_cube(y_true, y_pred, sensitive_frame, pos_label, numeric_bins, max_levels)
+    attributes, levels, cell_codes = cube['attributes'], cube['levels'], cube['cell_codes']
+    n_attr = len(attributes)
+    max_order = min(max_order or n_attr, n_attr)
+
+    overall_sr = cube['pred_pos'].sum() / cube['n'].sum() if cube['n'].sum() > 0 else 0.0
+
+    # alive[subset] = cells whose group in that subset reached min_support
+    alive = {(): np.ones(len(cell_codes), dtype=bool)}
+    rows = []
+
+    for order in range(1, max_order + 1):
+        for subset in combinations(range(n_attr), order):
+            mask = np.logical_and.reduce([alive[tuple(a for a in subset if a != drop)] for drop in subset])
+            if not mask.any():
+                alive[subset] = mask
+                continue
+
+            # Roll the surviving cells up to this subset of attributes
+            sub_dims = tuple(len(levels[a]) for a in subset)
+            sub_flat = np.ravel_multi_index(cell_codes[mask][:, subset].T, sub_dims)
+            groups, group_of_cell = np.unique(sub_flat, return_inverse=True)
+
+            def group_sum(key):
+                return np.bincount(group_of_cell, weights=cube[key][mask], minlength=len(groups))
+
+            support = group_sum('n')
+            supported = support >= min_support
+
+            alive_sub = mask.copy()
+            alive_sub[mask] = supported[group_of_cell]
+            alive[subset] = alive_sub
+
+            if not supported.any():
+                continue
+
+            pred_pos, true_pos, tp, correct = (group_sum(k)[supported] for k in ('pred_pos', 'true_pos', 'tp', 'correct'))
+            support = support[supported]
+            group_levels = np.unravel_index(groups[supported], sub_dims)
+
+            sr = pred_pos / support
+            with np.errstate(invalid='ignore', divide='ignore'):
+                tpr = np.where(true_pos > 0, tp / true_pos, np.nan)
+
+            rows.append(pd.DataFrame({
+                'attributes': ' & '.join(attributes[a] for a in subset),
+                'group': [
+                    ' & '.join(f"{attributes[a]}={levels[a][code[i]]}" for i, a in enumerate(subset))
+                    for code in zip(*group_levels)
+                ],
+                'order': order,
+                'support': support.astype(np.int64),
+                'selection_rate': sr,
+                'accuracy': correct / support,
+                'true_positive_rate': tpr,
+                'statistical_parity_difference': sr - overall_sr,
+                'disparate_impact': sr / overall_sr if overall_sr > 0 else np.nan
+            }))
+
+    if not rows:
+        return pd.DataFrame(columns=['attributes', 'group', 'order', 'support', 'selection_rate', 'accuracy',
+                                     'true_positive_rate', 'statistical_parity_difference', 'disparate_impact'])
+
+    result = pd.concat(rows, ignore_index=True)
+    return result.sort_values(['disparate_impact', 'support'], ascending=[True, False]).reset_index(drop=True)
@@ -0,0 +1,520 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy import sparse as sp
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.neighbors import NearestNeighbors
+from threadpoolctl import threadpool_limits
+from src.utils.precision import float_dtype
+
+def _as_array(X):
+    """
+    Converts a DataFrame / array-like to a C-contiguous float array without a copy
+    where possible. float32 input stays float32 (see src.utils.precision), anything
+    else becomes float64.
+    """
+    return np.ascontiguousarray(np.asarray(X, dtype=float_dtype(X)))
+
+def _group_by_key(keys, n_keys):
+    """
+    Sorts positions by key and returns (order, offsets) so that
+    order[offsets[k]:offsets[k + 1]] are the positions holding key k.
+    """
+    order = np.argsort(keys, kind='stable')
+    offsets = np.searchsorted(keys[order], np.arange(n_keys + 1))
+    return order, offsets
+
+def _split_by_row(rows, cols, dists, n_queries):
+    """Splits flat (row, col, dist) matches into sklearn-style per-query object arrays."""
+    order, offsets = _group_by_key(rows, n_queries)
+    ind_lists = np.empty(n_queries, dtype=object)
+    dist_lists = np.empty(n_queries, dtype=object)
+    for q, (ind, dist) in enumerate(zip(np.split(cols[order], offsets[1:-1]), np.split(dists[order], offsets[1:-1]))):
+        ind_lists[q] = ind
+        dist_lists[q] = dist
+    return dist_lists, ind_lists
+
+def _flatten_matches(dist_lists, ind_lists):
+    """Inverse of _split_by_row: per-query object arrays -> flat (row, col, dist) arrays."""
+    counts = np.fromiter((len(ind) for ind in ind_lists), dtype=np.int64, count=len(ind_lists))
+    rows = np.repeat(np.arange(len(ind_lists)), counts)
+    if counts.sum() == 0:
+        return rows, np.empty(0, dtype=np.int64), np.empty(0)
+    return rows, np.concatenate(list(ind_lists)).astype(np.int64), np.concatenate(list(dist_lists))
+
+class IVFNeighbors:
+    """
+    Approximate nearest neighbors with an inverted-file (IVF) index.
+
+    The data is partitioned by a coarse k-means quantizer into n_lists cells.
+    A query only scans the points stored in its n_probe closest cells, so the
+    cost per query is about n * n_probe / n_lists distance evaluations instead of n.
+
+    Exposes the same kneighbors / radius_neighbors interface as
+    sklearn.neighbors.NearestNeighbors so it can be used as a drop-in backend.
+
+    Recall / speed trade-off:
+        - n_lists: more cells = smaller cells = faster queries, lower recall.
+        - n_probe: more probed cells = higher recall, slower queries.
+    """
+
+    def __init__(self, n_lists=None, n_probe=8, batch_size=4096, random_state=42):
+        """
+        Args:
+            n_lists (int): Number of coarse cells. Defaults to sqrt(n_samples).
+            n_probe (int): Number of cells scanned per query.
+            batch_size (int): Query rows processed at once (bounds the distance tiles).
+            random_state (int): Seed for the k-means quantizer.
+        """
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.batch_size = batch_size
+        self.random_state = random_state
+
+    def fit(self, X):
+        """
+        Trains the coarse quantizer and fills the inverted lists.
+
+        Args:
+            X (pd.DataFrame / np.ndarray): Data to index.
+
+        Returns:
+            IVFNeighbors: self
+        """
+        self._fit_X = _as_array(X)
+        n_samples = self._fit_X.shape[0]
+
+        n_lists = self.n_lists or int(round(np.sqrt(n_samples)))
+        self.n_lists_ = int(np.clip(n_lists, 1, n_samples))
+
+        quantizer = MiniBatchKMeans(
+            n_clusters=self.n_lists_,
+            batch_size=max(1024, 3 * self.n_lists_),
+            n_init=3,
+            random_state=self.random_state
+        )
+        labels = quantizer.fit_predict(self._fit_X)
+
+        self.cluster_centers_ = quantizer.cluster_centers_
+        self._members, self._list_offsets = _group_by_key(labels, self.n_lists_)
+        self._sq_norms = np.einsum('ij,ij->i', self._fit_X, self._fit_X)
+        self.n_samples_fit_ = n_samples
+        return self
+
+    def _probe(self, Xq):
+        """Returns the (n_queries, n_probe) ids of the closest cells for every query."""
+        n_probe = min(self.n_probe, self.n_lists_)
+        center_d2 = (
+            np.einsum('ij,ij->i', Xq, Xq)[:, None]
+            - 2 * Xq @ self.cluster_centers_.T
+            + np.einsum('ij,ij->i', self.cluster_centers_, self.cluster_centers_)[None, :]
+        )
+        if n_probe == self.n_lists_:
+            return np.broadcast_to(np.arange(self.n_lists_), (len(Xq), n_probe))
+        return np.argpartition(center_d2, n_probe - 1, axis=1)[:, :n_probe]
+
+    def _iter_cells(self, Xq):
+        """
+        Yields (query_positions, member_positions, squared_distances) for every cell
+        probed by at least one query in Xq.
+        """
+        probes = self._probe(Xq)
+        n_probe = probes.shape[1]
+        q_norms = np.einsum('ij,ij->i', Xq, Xq)
+
+        # Invert the probe table: for each cell, which queries scan it
+        order, offsets = _group_by_key(probes.ravel(), self.n_lists_)
+
+        for cell in range(self.n_lists_):
+            queries = order[offsets[cell]:offsets[cell + 1]] // n_probe
+            members = self._members[self._list_offsets[cell]:self._list_offsets[cell + 1]]
+            if len(queries) == 0 or len(members) == 0:
+                continue
+
+            d2 = q_norms[queries, None] + self._sq_norms[None, members] - 2 * Xq[queries] @ self._fit_X[members].T
+            np.maximum(d2, 0, out=d2)
+            yield queries, members, d2
+
+    def kneighbors(self, X, n_neighbors=5, return_distance=True):
+        """
+        Approximate k nearest neighbors.
+        Queries whose probed cells hold fewer than n_neighbors points are padded
+        with index -1 and distance inf.
+
+        Args:
+            X (pd.DataFrame / np.ndarray): Query points.
+            n_neighbors (int): Number of neighbors per query.
+            return_distance (bool): Whether to return distances.
+
+        Returns:
+            tuple: (distances, indices), each (n_queries, n_neighbors), sorted by distance.
+        """
+        Xq_all = _as_array(X)
+        all_d = np.full((len(Xq_all), n_neighbors), np.inf)
+        all_i = np.full((len(Xq_all), n_neighbors), -1, dtype=np.int64)
+
+        for start in range(0, len(Xq_all), self.batch_size):
+            Xq = Xq_all[start:start + self.batch_size]
+            best_d = all_d[start:start + len(Xq)]
+            best_i = all_i[start:start + len(Xq)]
+
+            for queries, members, d2 in self._iter_cells(Xq):
+                # Merge this cell's candidates into the running top-k of each query
+                cand_d = np.hstack([best_d[queries], d2])
+                cand_i = np.hstack([best_i[queries], np.broadcast_to(members, d2.shape)])
+                top = np.argpartition(cand_d, n_neighbors - 1, axis=1)[:, :n_neighbors]
+                best_d[queries] = np.take_along_axis(cand_d, top, axis=1)
+                best_i[queries] = np.take_along_axis(cand_i, top, axis=1)
+
+        order = np.argsort(all_d, axis=1, kind='stable')
+        all_d = np.sqrt(np.take_along_axis(all_d, order, axis=1))
+        all_i = np.take_along_axis(all_i, order, axis=1)
+
+        if return_distance:
+            return all_d, all_i
+        return all_i
+
+    def radius_neighbors(self, X, radius, return_distance=True):
+        """
+        Approximate radius query (distance <= radius, like sklearn).
+
+        Args:
+            X (pd.DataFrame / np.ndarray): Query points.
+            radius (float): Search radius.
+            return_distance (bool): Whether to return distances.
+
+        Returns:
+            tuple: (distances, indices), object arrays holding one array per query.
+        """
+        Xq_all = _as_array(X)
+        rows, cols, dists = [], [], []
+
+        for start in range(0, len(Xq_all), self.batch_size):
+            Xq = Xq_all[start:start + self.batch_size]
+            for queries, members, d2 in self._iter_cells(Xq):
+                q_pos, m_pos = np.nonzero(d2 <= radius ** 2)
+                rows.append(queries[q_pos] + start)
+                cols.append(members[m_pos])
+                dists.append(np.sqrt(d2[q_pos, m_pos]))
+
+        rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+        cols = np.concatenate(cols) if cols else np.empty(0, dtype=np.int64)
+        dists = np.concatenate(dists) if dists else np.empty(0)
+
+        # Split the flat matches back into one array per query
+        dist_lists, ind_lists = _split_by_row(rows, cols, dists, len(Xq_all))
+
+        if return_distance:
+            return dist_lists, ind_lists
+        return ind_lists
+
+def _block_rows(n_features, memory_budget_mb, n_workers, itemsize=8):
+    """
+    Picks the tile edge b so that every worker's b x b distance tile (float + mask,
+    ~2 * itemsize bytes per cell with headroom) plus its two b x n_features input
+    blocks fit in an equal share of the memory budget.
+    """
+    per_worker = memory_budget_mb * 1024 ** 2 / n_workers
+    cell = 2 * itemsize
+    block = int(np.sqrt(per_worker / cell))
+    while block > 1 and block * block * cell + 2 * block * n_features * itemsize > per_worker:
+        block = int(block * 0.9)
+    return max(1, block)
+
+def blocked_pairs_within(X, distance_threshold, memory_budget_mb=512, n_jobs=None):
+    """
+    Exact all-pairs search with a fixed memory budget, independent of tree structures
+    (which degrade to brute force in high dimensions anyway).
+
+    X is tiled into row blocks; for every upper-triangular tile (i <= j) the squared
+    Euclidean distances come from one matrix product
+        ||a - b||^2 = ||a||^2 + ||b||^2 - 2 a.b
+    and only entries under the threshold are kept. Tiles run on a thread pool
+    (BLAS releases the GIL) with BLAS limited to one thread per worker, so the pool
+    does not oversubscribe the CPU, and the tile size is chosen so all workers together
+    stay within memory_budget_mb. float32 input is tiled in float32 (half the memory,
+    single-precision BLAS); distances close to 0 then carry a small absolute error.
+
+    Args:
+        X (pd.DataFrame / np.ndarray / scipy.sparse matrix): Feature matrix.
+        distance_threshold (float): Keep pairs with distance < threshold.
+        memory_budget_mb (float): Memory budget for the distance tiles of all workers.
+        n_jobs (int): Worker threads. Defaults to the CPU count; with one worker BLAS keeps its own threads.
+
+    Returns:
+        tuple: (rows, cols, distances) arrays with rows < cols.
+    """
+    is_sparse = sp.issparse(X)
+    if is_sparse:
+        # CSR stays sparse; only the b x b distance tiles are dense
+        X = sp.csr_matrix(X, dtype=float_dtype(X))
+        sq_norms = np.asarray(X.multiply(X).sum(axis=1)).ravel()
+    else:
+        X = _as_array(X)
+        sq_norms = np.einsum('ij,ij->i', X, X)
+    n_rows, n_features = X.shape
+    n_workers = n_jobs or os.cpu_count() or 1
+
+    # Sparse input blocks are small next to the dense tile, so only the tile is budgeted
+    block = _block_rows(0 if is_sparse else n_features, memory_budget_mb, n_workers, X.dtype.itemsize)
+    limit = distance_threshold ** 2
+
+    def run_tile(tile):
+        i0, j0 = tile
+        i1, j1 = min(i0 + block, n_rows), min(j0 + block, n_rows)
+
+        # In-place updates keep a single b x b float buffer per tile
+        d2 = X[i0:i1] @ X[j0:j1].T
+        if is_sparse:
+            d2 = d2.toarray()
+        d2 *= -2
+        d2 += sq_norms[i0:i1, None]
+        d2 += sq_norms[None, j0:j1]
+        np.maximum(d2, 0, out=d2)
+
+        mask = d2 < limit
+        if i0 == j0:
+            mask &= np.triu(np.ones(mask.shape, dtype=bool), k=1)
+        r, c = np.nonzero(mask)
+        return r + i0, c + j0, np.sqrt(d2[r, c])
+
+    tiles = [(i0, j0) for i0 in range(0, n_rows, block) for j0 in range(i0, n_rows, block)]
+    # n_workers threads x BLAS threads each would oversubscribe the cores: one BLAS thread per tile
+    with threadpool_limits(limits=1 if n_workers > 1 else None, user_api='blas'):
+        with ThreadPoolExecutor(max_workers=n_workers) as pool:
+            results = list(pool.map(run_tile, tiles))
+
+    if not results:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    rows, cols, dists = zip(*results)
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(dists)
+
+class SharedMaskIndex:
+    """
+    One neighbor structure shared by every sensitive mask drawn from a pool of
+    maskable columns (e.g. the one-hot families of all candidate sensitive features).
+
+    The index is fitted once on the core columns (never masked). For a mask M, the
+    distance over the remaining columns is
+        d_M(x, y)^2 = d_core(x, y)^2 + sum over kept maskable columns (x_c - y_c)^2
+    so d_core <= d_M: a core radius query is a complete candidate set, and adding the
+    kept columns' contribution makes the answer exact. Switching masks therefore
+    costs a query-time correction instead of a refit.
+    """
+
+    def __init__(self, backend='exact', backend_params=None):
+        """
+        Args:
+            backend (str): Backend of the core index, see make_neighbors_index.
+            backend_params (dict): Backend parameters.
+        """
+        self.backend = backend
+        self.backend_params = backend_params or {}
+
+    def fit(self, X_processed, maskable_columns):
+        """
+        Fits the core index.
+
+        Args:
+            X_processed (pd.DataFrame): The fully processed (numeric) dataset.
+            maskable_columns (list): Every column any later mask may drop.
+
+        Returns:
+            SharedMaskIndex: self
+        """
+        self.columns = list(X_processed.columns)
+        self.maskable_columns = [c for c in self.columns if c in maskable_columns]
+        core_columns = [c for c in self.columns if c not in maskable_columns]
+        if not core_columns:
+            raise ValueError("At least one column must stay outside the maskable pool.")
+
+        self.core_columns = core_columns
+        self.core_index = make_neighbors_index(self.backend, **self.backend_params)
+        # The core index is fitted on this very array, so keeping it costs no extra memory
+        self._core_X = _as_array(X_processed[core_columns])
+        self.core_index.fit(self._core_X)
+        self._maskable_X = _as_array(X_processed[self.maskable_columns])
+        self.store_key = None # Set once the index is saved in a SimilarityIndexStore
+        return self
+
+    def view(self, masked_columns):
+        """
+        Returns a neighbor index over all columns except masked_columns.
+
+        Args:
+            masked_columns (list): Columns to drop; all must be in the maskable pool.
+
+        Returns:
+            MaskedNeighborsView: Index with kneighbors / radius_neighbors.
+        """
+        not_maskable = [c for c in masked_columns if c in self.columns and c not in self.maskable_columns]
+        if not_maskable:
+            raise ValueError(f"Columns outside the shared maskable pool: {not_maskable}")
+        return MaskedNeighborsView(self, masked_columns)
+
+    def masked_matrix(self, masked_columns):
+        """
+        Rebuilds X_processed minus masked_columns (original column order) from the
+        core and maskable arrays, e.g. for an analyzer loaded from a store entry
+        that only records its mask.
+
+        Returns:
+            pd.DataFrame: The masked feature matrix.
+        """
+        view = MaskedNeighborsView(self, masked_columns)
+        block = np.empty((len(self._core_X), len(view.columns)), dtype=self._core_X.dtype)
+        block[:, view._core_pos] = self._core_X
+        block[:, view._extra_pos] = view._extra_X
+        return pd.DataFrame(block, columns=view.columns, copy=False)
+
+class MaskedNeighborsView:
+    """
+    Exact neighbor queries for one mask of a SharedMaskIndex.
+    Queries are given in the masked column space (X_processed minus the mask, original order).
+    """
+
+    def __init__(self, shared, masked_columns):
+        self.shared = shared
+        self.columns = [c for c in shared.columns if c not in masked_columns]
+        position = {c: i for i, c in enumerate(self.columns)}
+        self._core_pos = np.array([position[c] for c in shared.core_columns])
+        kept = [c for c in shared.maskable_columns if c not in masked_columns]
+        self._extra_pos = np.array([position[c] for c in kept], dtype=np.int64)
+        self._extra_X = shared._maskable_X[:, [shared.maskable_columns.index(c) for c in kept]]
+
+    def fit(self, X):
+        # The core index is shared and already fitted
+        return self
+
+    def _extra_d2(self, Xq_extra, rows, cols):
+        """Squared distance contribution of the kept maskable columns for flat (row, col) pairs."""
+        if len(self._extra_pos) == 0:
+            return np.zeros(len(rows))
+        diff = Xq_extra[rows] - self._extra_X[cols]
+        return np.einsum('ij,ij->i', diff, diff)
+
+    def radius_neighbors(self, X, radius, return_distance=True):
+        """
+        Exact radius query (distance <= radius) in the masked space.
+
+        Returns:
+            tuple: (distances, indices), object arrays holding one array per query.
+        """
+        Xq = _as_array(X)
+        dist_lists, ind_lists = self.shared.core_index.radius_neighbors(Xq[:, self._core_pos], radius=radius)
+        rows, cols, core_d = _flatten_matches(dist_lists, ind_lists)
+
+        d2 = core_d ** 2 + self._extra_d2(Xq[:, self._extra_pos], rows, cols)
+        keep = d2 <= radius ** 2
+        dist_lists, ind_lists = _split_by_row(rows[keep], cols[keep], np.sqrt(d2[keep]), len(Xq))
+
+        if return_distance:
+            return dist_lists, ind_lists
+        return ind_lists
+
+    def kneighbors(self, X, n_neighbors=5, return_distance=True, chunk_size=256):
+        """
+        Exact k nearest neighbors in the masked space.
+        The k core neighbors give an upper bound on the k-th masked distance; every
+        point within that bound in core space is a candidate, and candidates are
+        re-ranked by masked distance.
+
+        Returns:
+            tuple: (distances, indices), each (n_queries, n_neighbors).
+        """
+        Xq = _as_array(X)
+        core_q, extra_q = Xq[:, self._core_pos], Xq[:, self._extra_pos]
+        if len(self._extra_pos) == 0:
+            return self.shared.core_index.kneighbors(core_q, n_neighbors=n_neighbors, return_distance=return_distance)
+
+        # 1. Upper bound on each query's k-th masked distance from its k core neighbors
+        core_d, core_i = self.shared.core_index.kneighbors(core_q, n_neighbors=n_neighbors)
+        rows = np.repeat(np.arange(len(Xq)), n_neighbors)
+        bound_d2 = core_d.ravel() ** 2 + self._extra_d2(extra_q, rows, core_i.ravel())
+        bound = np.sqrt(bound_d2.reshape(len(Xq), n_neighbors).max(axis=1))
+
+        all_d = np.empty((len(Xq), n_neighbors))
+        all_i = np.empty((len(Xq), n_neighbors), dtype=np.int64)
+
+        # 2. Radius query per chunk of queries with similar bounds, then exact re-ranking
+        by_bound = np.argsort(bound)
+        for start in range(0, len(Xq), chunk_size):
+            queries = by_bound[start:start + chunk_size]
+            radius = bound[queries].max() * (1 + 1e-9) + 1e-12
+            dist_lists, ind_lists = self.radius_neighbors(Xq[queries], radius=radius)
+            q_rows, cols, dists = _flatten_matches(dist_lists, ind_lists)
+
+            order = np.lexsort((dists, q_rows))
+            q_rows, cols, dists = q_rows[order], cols[order], dists[order]
+            rank = np.arange(len(q_rows)) - np.searchsorted(q_rows, q_rows)
+            top = rank < n_neighbors
+            all_d[queries[q_rows[top]], rank[top]] = dists[top]
+            all_i[queries[q_rows[top]], rank[top]] = cols[top]
+
+        if return_distance:
+            return all_d, all_i
+        return all_i
+
+NEIGHBOR_BACKENDS = {
+    'exact': lambda **params: NearestNeighbors(**{'n_neighbors': 10, 'algorithm': 'auto', **params}),
+    'ivf': IVFNeighbors
+}
+
+def make_neighbors_index(backend='exact', **params):
+    """
+    Creates an (unfitted) neighbor index for the given backend name.
+
+    Args:
+        backend (str): 'exact' (sklearn NearestNeighbors) or 'ivf' (IVFNeighbors).
+        **params: Backend specific parameters (e.g. n_lists, n_probe for 'ivf').
+
+    Returns:
+        object: Index with fit / kneighbors / radius_neighbors.
+    """
+    if backend not in NEIGHBOR_BACKENDS:
+        raise ValueError(f"Unknown neighbor backend: {backend}. Choose from {list(NEIGHBOR_BACKENDS)}.")
+    return NEIGHBOR_BACKENDS[backend](**params)
+
+def measure_recall(X, approx_index, n_neighbors=10, n_queries=500, random_state=42):
+    """
+    Measures recall@k of a fitted approximate index against an exact brute-force search.
+    A returned neighbor counts as a hit if it is no farther than the exact k-th
+    neighbor, so ties between equidistant points are not counted as misses.
+
+    Args:
+        X (pd.DataFrame / np.ndarray): The data the approximate index was fitted on.
+        approx_index: Fitted index with a kneighbors method.
+        n_neighbors (int): k for recall@k.
+        n_queries (int): Number of sampled query rows.
+        random_state (int): Seed for sampling query rows.
+
+    Returns:
+        dict: recall_at_k, n_neighbors, n_queries, exact_seconds, approx_seconds, speedup.
+    """
+    X = _as_array(X)
+    rng = np.random.default_rng(random_state)
+    query_rows = rng.choice(len(X), size=min(n_queries, len(X)), replace=False)
+    Xq = X[query_rows]
+
+    exact = NearestNeighbors(n_neighbors=n_neighbors, algorithm='brute').fit(X)
+    t0 = time.perf_counter()
+    exact_d, _ = exact.kneighbors(Xq, n_neighbors=n_neighbors)
+    exact_seconds = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    approx_d, _ = approx_index.kneighbors(Xq, n_neighbors=n_neighbors)
+    approx_seconds = time.perf_counter() - t0
+
+    kth = exact_d[:, -1:] * (1 + 1e-9) + 1e-12
+    hits = (approx_d <= kth).sum(axis=1)
+
+    return {
+        'recall_at_k': float(hits.mean() / n_neighbors),
+        'n_neighbors': n_neighbors,
+        'n_queries': len(query_rows),
+        'exact_seconds': exact_seconds,
+        'approx_seconds': approx_seconds,
+        'speedup': exact_seconds / approx_seconds if approx_seconds > 0 else float('inf')
+    }
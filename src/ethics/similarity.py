@@ -1,19 +1,187 @@
 import pandas as pd
 import numpy as np
-from sklearn.neighbors import NearestNeighbors
+from scipy import sparse as sp
 from sklearn.preprocessing import StandardScaler
+from sklearn.metrics.pairwise import euclidean_distances
+from src.ethics.neighbors import make_neighbors_index, measure_recall, blocked_pairs_within
+from src.data.preprocessing import with_columns
+from src.utils.precision import float_dtype
+
+PAIR_COLUMNS = ['Person A', 'Person B', 'Distance']
+# Upper bound on the pairs held by the threshold-sweep pair index (see ensure_pair_index)
+PAIR_INDEX_MAX_PAIRS = 5_000_000
+# Rows gathered at a time when building the masked matrix
+_GATHER_ROWS = 65_536
+
+# Sparse mode (see preprocess_data(sparse=True)): X is a CSR matrix with `.columns`.
+# These helpers give DataFrames and CSR the same row / column operations, CSR is never densified.
+
+def _drop_columns(X, cols_to_drop, dtype=None):
+    """
+    X without the given columns, as one contiguous block of the given float dtype
+    (default: float32 stays float32, anything else becomes float64). The kept columns
+    are gathered straight into the new block: no drop() copy and no extra cast copy.
+    CSR is masked by column index.
+    """
+    dtype = dtype or float_dtype(X)
+    keep = np.flatnonzero(~X.columns.isin(cols_to_drop))
+    if sp.issparse(X):
+        return with_columns(X[:, keep].astype(dtype, copy=False), X.columns[keep])
+    
+    values = X.to_numpy(copy=False)
+    if len(keep) == values.shape[1] and values.dtype == dtype and values.flags.c_contiguous:
+        block = values
+    else:
+        block = np.empty((len(X), len(keep)), dtype=dtype)
+        # Row chunks bound the gather temporary
+        for start in range(0, len(X), _GATHER_ROWS):
+            block[start:start + _GATHER_ROWS] = values[start:start + _GATHER_ROWS, keep]
+    return pd.DataFrame(block, columns=X.columns[keep], index=X.index, copy=False)
+
+def _row_block(X, start, stop):
+    """Rows start..stop of a DataFrame or CSR matrix."""
+    return X[start:stop] if sp.issparse(X) else X.iloc[start:stop]
+
+def _stack_rows(blocks):
+    """Row-wise concatenation with a fresh 0..n-1 numbering."""
+    if sp.issparse(blocks[0]):
+        return with_columns(sp.vstack(blocks, format='csr'), blocks[0].columns)
+    return pd.concat(blocks, ignore_index=True)
+
+def _canonical_pairs(rows, cols, dists):
+    """
+    Orders each pair as (min, max), drops self-matches and removes duplicates.
+    
+    Args:
+        rows (np.ndarray): Row positions of the query points.
+        cols (np.ndarray): Row positions of the matched neighbors.
+        dists (np.ndarray): Distance for every (row, col) match.
+        
+    Returns:
+        tuple: (person_a, person_b, distance) as int32/int32/float32 arrays,
+               sorted by (person_a, person_b).
+    """
+    rows = np.asarray(rows)
+    cols = np.asarray(cols)
+    dists = np.asarray(dists)
+    
+    not_self = rows != cols
+    person_a = np.minimum(rows, cols)[not_self].astype(np.int32)
+    person_b = np.maximum(rows, cols)[not_self].astype(np.int32)
+    pair_dist = dists[not_self].astype(np.float32)
+    
+    # Pair 2-5 and 5-2 collapse onto the same (a, b) key; keep the first (closest) one
+    order = np.lexsort((pair_dist, person_b, person_a))
+    person_a, person_b, pair_dist = person_a[order], person_b[order], pair_dist[order]
+    
+    first = np.ones(len(person_a), dtype=bool)
+    first[1:] = (person_a[1:] != person_a[:-1]) | (person_b[1:] != person_b[:-1])
+    
+    return person_a[first], person_b[first], pair_dist[first]
+
+def _pairs_frame(person_a, person_b, pair_dist):
+    """Wraps pair arrays into the ['Person A', 'Person B', 'Distance'] DataFrame."""
+    return pd.DataFrame({
+        PAIR_COLUMNS[0]: np.asarray(person_a, dtype=np.int32),
+        PAIR_COLUMNS[1]: np.asarray(person_b, dtype=np.int32),
+        PAIR_COLUMNS[2]: np.asarray(pair_dist, dtype=np.float32)
+    })
+
+def analyze_pair_discordance(person_a, person_b, y_pred, sensitive_frame, distances=None, pair_ids=None):
+    """
+    Counts discordant outcomes among similar pairs, split by whether the two people
+    share the sensitive group, for several sensitive features in one vectorized pass.
+    
+    Args:
+        person_a (array): Row positions of the first person of each pair.
+        person_b (array): Row positions of the second person of each pair.
+        y_pred (pd.Series / array): Predictions for the whole dataset (positional).
+        sensitive_frame (pd.DataFrame): Raw sensitive columns for the whole dataset (positional).
+        distances (array): Optional pair distances, shown in the detail table.
+        pair_ids (array): Optional pair ids (e.g. the pairs DataFrame index), shown in the detail table.
+        
+    Returns:
+        dict: {feature: {'rate_same', 'rate_diff', 'total_same', 'total_diff',
+                         'discordant_same', 'discordant_diff', 'details'}}
+              where 'details' is a DataFrame of the discordant cross-group pairs.
+    """
+    person_a = np.asarray(person_a, dtype=np.int64)
+    person_b = np.asarray(person_b, dtype=np.int64)
+    if pair_ids is None:
+        pair_ids = np.arange(len(person_a))
+    if distances is None:
+        distances = np.full(len(person_a), np.nan)
+    
+    preds = np.asarray(y_pred)
+    out_a, out_b = preds[person_a], preds[person_b]
+    is_discordant = out_a != out_b
+    
+    results = {}
+    for feature in sensitive_frame.columns:
+        values = sensitive_frame[feature].to_numpy()
+        codes, _ = pd.factorize(sensitive_frame[feature])
+        
+        # Missing values (code -1) never count as the same group, like NaN != NaN
+        is_same = (codes[person_a] == codes[person_b]) & (codes[person_a] >= 0)
+        is_diff = ~is_same
+        
+        total_same = int(is_same.sum())
+        total_diff = int(is_diff.sum())
+        discordant_same = int((is_discordant & is_same).sum())
+        discordant_diff = int((is_discordant & is_diff).sum())
+        
+        detail = is_discordant & is_diff
+        details = pd.DataFrame({
+            'Pair ID': np.asarray(pair_ids)[detail],
+            f'{feature}_A': values[person_a[detail]],
+            f'{feature}_B': values[person_b[detail]],
+            'Outcome_A': out_a[detail],
+            'Outcome_B': out_b[detail],
+            'Dist': np.asarray(distances)[detail]
+        })
+        
+        results[feature] = {
+            'rate_same': discordant_same / total_same if total_same > 0 else 0,
+            'rate_diff': discordant_diff / total_diff if total_diff > 0 else 0,
+            'total_same': total_same,
+            'total_diff': total_diff,
+            'discordant_same': discordant_same,
+            'discordant_diff': discordant_diff,
+            'details': details
+        }
+    
+    return results
 
 class SimilarityAnalyzer:
     """
     Analyzes neighborhood similarity to detect individual discrimination.
     """
     
-    def __init__(self):
+    def __init__(self, backend='exact', backend_params=None, max_buffer_rows=50_000, dtype=None):
+        """
+        Args:
+            backend (str): Neighbor index backend. 'exact' uses sklearn NearestNeighbors,
+                           'ivf' uses the approximate IVFNeighbors index for very large data.
+            backend_params (dict): Extra parameters for the backend (e.g. {'n_lists': 1000, 'n_probe': 16}).
+            max_buffer_rows (int): Rows appended with add_rows are kept in a small brute-force
+                                   segment and merged into the index once it grows past this size.
+            dtype (np.dtype): Float dtype of the masked matrix and the distance computations.
+                              Defaults to the input's (float32 input stays float32, see
+                              src.utils.precision); np.float32 halves the memory.
+        """
+        self.backend = backend
+        self.backend_params = backend_params or {}
+        self.max_buffer_rows = max_buffer_rows
+        self.dtype = dtype
+        self.buffer = [] # Masked rows appended since the last (re)fit
         self.knn_model = None
         self.X_masked = None
+        self.masked_columns = []
+        self.index_key = None # Set when the analyzer is backed by a SimilarityIndexStore entry
         self.scaler = StandardScaler()
+        self.pair_index = None
         
-    def train(self, X_processed, sensitive_columns_masked):
+    def train(self, X_processed, sensitive_columns_masked, shared_index=None):
         """
         Trains KNN on the dataset EXCLUDING the sensitive columns.
         
@@ -21,12 +189,20 @@ class SimilarityAnalyzer:
             X_processed (pd.DataFrame): The fully processed (numeric) dataset.
             sensitive_columns_masked (list): List of column names in X_processed 
                                              that should be ignored for similarity calculation.
+            shared_index (SharedMaskIndex): Optional index fitted once on X_processed for a pool
+                                            of maskable columns. If given, no KNN model is fitted;
+                                            queries go through an exact view for this mask.
         """
         # Drop sensitive columns from the features used for distance calculation
         # We need to ensure we drop all OHE columns related to the sensitive feature if they exist
         cols_to_drop = [c for c in X_processed.columns if c in sensitive_columns_masked]
         
-        self.X_masked = X_processed.drop(columns=cols_to_drop)
+        if sp.issparse(X_processed) and (shared_index is not None or self.backend != 'exact'):
+            raise ValueError("Sparse input supports the 'exact' backend without a shared index "
+                             "(pair search modes 'knn', 'radius' and 'blocked').")
+        
+        self.masked_columns = cols_to_drop
+        self.X_masked = _drop_columns(X_processed, cols_to_drop, self.dtype)
         
         # Scale the data for KNN (Euclidean distance requires scaling)
         # Note: X_processed might already be scaled, but safe to ensure or just use as is if known scaled.
@@ -34,8 +210,13 @@ class SimilarityAnalyzer:
         # It's better to rescale everything to 0-1 or similar range so OHE doesn't dominate or vanish.
         # For simplicity here, we assume X_processed is already reasonably scaled or we trust the workflow.
         
-        self.knn_model = NearestNeighbors(n_neighbors=10, algorithm='auto')
-        self.knn_model.fit(self.X_masked)
+        if shared_index is not None:
+            self.knn_model = shared_index.view(cols_to_drop)
+        else:
+            self.knn_model = make_neighbors_index(self.backend, **self.backend_params)
+            self.knn_model.fit(self.X_masked)
+        self.pair_index = None # Stale once the model is refitted
+        self.buffer = []
         
     def find_neighbors(self, target_idx, n_neighbors=5):
         """
@@ -46,53 +227,350 @@ class SimilarityAnalyzer:
             n_neighbors (int): Number of neighbors to find.
             
         Returns:
-            tuple: (distances, indices)
+            tuple: (distances, indices). With an approximate backend fewer than n_neighbors
+                   may be returned (padding of unfilled slots is dropped).
         """
         if self.knn_model is None:
             raise ValueError("Model not trained. Call train() first.")
+        self.merge_buffer()
             
         # Get target feature vector
-        target_features = self.X_masked.iloc[target_idx].values.reshape(1, -1)
+        target_features = _row_block(self.X_masked, target_idx, target_idx + 1)
         
         distances, indices = self.knn_model.kneighbors(target_features, n_neighbors=n_neighbors)
-        return distances[0], indices[0]
+        # IVF pads slots its probed cells could not fill with index -1
+        found = indices[0] >= 0
+        return distances[0][found], indices[0][found]
 
-    def find_all_similar_pairs(self, n_neighbors=2, distance_threshold=0.5):
+    def find_all_similar_pairs(self, n_neighbors=2, distance_threshold=0.5, mode='knn', chunk_size=2048,
+                               memory_budget_mb=512, n_jobs=None):
         """
         Finds all pairs/groups of individuals who are highly similar.
         Returns unique pairs (i, j) where distance(i, j) < threshold.
+        The threshold mask, (min, max) ordering and deduplication run as array
+        operations on the kneighbors output, so no Python-level loop over rows.
         
         Args:
-            n_neighbors (int): How many neighbors to check per point.
+            n_neighbors (int): How many neighbors to check per point ('knn' mode only).
             distance_threshold (float): Similarity cutoff. Lower = Strict identity.
+            mode (str): 'knn' checks the n_neighbors closest points per row, so each
+                        person reports at most n_neighbors - 1 twins.
+                        'radius' returns every pair under the threshold (see iter_similar_pairs).
+                        'blocked' is also exhaustive but skips the tree: tiled matrix-product
+                        distances on a thread pool (see neighbors.blocked_pairs_within).
+            chunk_size (int): Rows per radius query ('radius' mode only).
+            memory_budget_mb (float): Memory budget for distance tiles ('blocked' mode only).
+            n_jobs (int): Worker threads ('blocked' mode only). Defaults to the CPU count.
             
         Returns:
-            pd.DataFrame: Columns ['Person A', 'Person B', 'Distance']
+            pd.DataFrame: Columns ['Person A', 'Person B', 'Distance'] (int32, int32, float32)
         """
         if self.knn_model is None:
             raise ValueError("Model not trained.")
+        self.merge_buffer()
+        
+        if mode == 'radius':
+            chunks = list(self.iter_similar_pairs(distance_threshold=distance_threshold, chunk_size=chunk_size))
+            if not chunks:
+                return _pairs_frame([], [], [])
+            return pd.concat(chunks, ignore_index=True)
+        if mode == 'blocked':
+            rows, cols, dists = blocked_pairs_within(
+                self.X_masked, distance_threshold, memory_budget_mb=memory_budget_mb, n_jobs=n_jobs
+            )
+            return _pairs_frame(*_canonical_pairs(rows, cols, dists))
+        if mode != 'knn':
+            raise ValueError(f"Unknown pair search mode: {mode}")
             
         # Find neighbors for everyone
         # This returns (n_samples, n_neighbors)
         distances, indices = self.knn_model.kneighbors(self.X_masked, n_neighbors=n_neighbors)
         
-        pairs = []
+        # Flatten the neighbor matrix into (row, neighbor, distance) triples.
+        # Column 0 is usually the point itself, self-matches are dropped in _canonical_pairs.
+        rows = np.repeat(np.arange(indices.shape[0]), indices.shape[1])
+        cols = indices.ravel()
+        dists = distances.ravel()
+        
+        within = dists < distance_threshold
+        person_a, person_b, pair_dist = _canonical_pairs(rows[within], cols[within], dists[within])
+        
+        return _pairs_frame(person_a, person_b, pair_dist)
+
+    def iter_similar_pairs(self, distance_threshold=0.5, chunk_size=2048, max_pairs_per_chunk=2_000_000,
+                           min_distance=0.0):
+        """
+        Streams every pair (i, j) with distance(i, j) < threshold, chunk by chunk.
+        Uses radius queries on the fitted tree, so dense regions are not truncated
+        the way a fixed n_neighbors search is.
+        
+        The chunk size adapts to the observed pair density. The first chunk is a probe
+        small enough that even the worst case (every row matching every row) stays
+        within max_pairs_per_chunk; later chunks at most double in size and are capped
+        at max_pairs_per_chunk / observed matches per row, so a jump in density is
+        caught after one chunk instead of materializing a full chunk_size query.
+        
+        Args:
+            distance_threshold (float): Similarity cutoff. Lower = Strict identity.
+            chunk_size (int): Maximum number of query rows per radius query.
+            max_pairs_per_chunk (int): Target number of raw matches per chunk.
+            min_distance (float): Only yield pairs with distance >= min_distance (used to
+                                  extend the pair index by a distance band).
+            
+        Yields:
+            pd.DataFrame: Columns ['Person A', 'Person B', 'Distance'] for one chunk of rows.
+                          Chunks are disjoint, Person A < Person B.
+        """
+        if self.knn_model is None:
+            raise ValueError("Model not trained. Call train() first.")
+        self.merge_buffer()
+        
+        n_rows = self.X_masked.shape[0]
+        rows_per_chunk = int(np.clip(max_pairs_per_chunk // max(n_rows, 1), 1, chunk_size))
+        start = 0
         
-        # indices[:, 0] is the point itself (dist 0), so look at others
-        for i in range(len(self.X_masked)):
-            for k in range(1, n_neighbors): # Start from 1 to skip self
-                neighbor_idx = indices[i, k]
-                dist = distances[i, k]
+        while start < n_rows:
+            stop = min(n_rows, start + rows_per_chunk)
+            dist_lists, ind_lists = self.knn_model.radius_neighbors(
+                _row_block(self.X_masked, start, stop), radius=distance_threshold
+            )
+            
+            counts = np.fromiter((len(ind) for ind in ind_lists), dtype=np.int64, count=len(ind_lists))
+            n_found = int(counts.sum())
+            
+            # Grow at most 2x per chunk, capped by the observed pair density
+            per_row = n_found / (stop - start)
+            budget_rows = max_pairs_per_chunk / per_row if per_row else chunk_size
+            rows_per_chunk = int(np.clip(min(2 * rows_per_chunk, budget_rows), 1, chunk_size))
+            
+            if n_found:
+                rows = np.repeat(np.arange(start, stop), counts)
+                cols = np.concatenate(list(ind_lists))
+                dists = np.concatenate(list(dist_lists))
                 
-                if dist < distance_threshold:
-                    # Avoid duplicates (pair 2-5 is same as 5-2)
-                    p1, p2 = sorted((i, neighbor_idx))
-                    pairs.append((p1, p2, dist))
-                    
-        # Dedup list
-        pairs = sorted(list(set(pairs)))
+                # Each pair is seen from both sides; keep i < j (this also drops self-matches).
+                # radius_neighbors is inclusive, the threshold is strict.
+                keep = (cols > rows) & (dists < distance_threshold) & (dists >= min_distance)
+                yield _pairs_frame(*_canonical_pairs(rows[keep], cols[keep], dists[keep]))
+            
+            start = stop
+
+    def build_pair_index(self, max_distance=5.0, chunk_size=2048, max_pairs=None):
+        """
+        Builds a distance-sorted index of every pair closer than max_distance.
+        Any threshold up to max_distance is then answered by query_pair_index with a
+        binary search instead of a new KNN query. The pair count grows quadratically
+        with the rows for loose distances, so interactive callers should use
+        ensure_pair_index, which only indexes up to the threshold actually asked for.
         
-        return pd.DataFrame(pairs, columns=['Person A', 'Person B', 'Distance'])
+        Args:
+            max_distance (float): Largest threshold the index must answer.
+            chunk_size (int): Rows per radius query while building.
+            max_pairs (int): Optional cap on the indexed pairs; exceeding it raises ValueError.
+            
+        Returns:
+            dict: Sorted 'person_a', 'person_b', 'distance' arrays and 'max_distance'.
+        """
+        self.pair_index = {
+            'person_a': np.empty(0, dtype=np.int32),
+            'person_b': np.empty(0, dtype=np.int32),
+            'distance': np.empty(0, dtype=np.float32),
+            'max_distance': 0.0
+        }
+        if not self._extend_pair_index(max_distance, chunk_size, max_pairs):
+            self.pair_index = None
+            raise ValueError(f"More than {max_pairs} pairs are closer than {max_distance}.")
+        return self.pair_index
+    
+    def ensure_pair_index(self, distance_threshold, step=0.5, chunk_size=2048, max_pairs=PAIR_INDEX_MAX_PAIRS):
+        """
+        Lazily grows the pair index so it answers distance_threshold.
+        
+        The index is built (or extended) only up to the next multiple of step above the
+        threshold, so a strict slider position never pays for the pairs of a loose one.
+        Extending from the indexed maximum d0 to d1 only adds the pairs in [d0, d1): they
+        all sort after the existing ones, so they are appended without re-sorting.
+        
+        Args:
+            distance_threshold (float): Threshold about to be queried.
+            step (float): Granularity of the indexed range.
+            chunk_size (int): Rows per radius query while extending.
+            max_pairs (int): Cap on the indexed pairs. If the extension would exceed it,
+                             the index is left unchanged (use iter_similar_pairs instead).
+            
+        Returns:
+            bool: True if query_pair_index(distance_threshold) can be answered.
+        """
+        if self.pair_index is not None and distance_threshold <= self.pair_index['max_distance']:
+            return True
+        target = max(float(np.ceil(distance_threshold / step - 1e-9) * step), distance_threshold)
+        
+        if self.pair_index is None:
+            try:
+                self.build_pair_index(target, chunk_size, max_pairs)
+            except ValueError:
+                return False
+            return True
+        return self._extend_pair_index(target, chunk_size, max_pairs)
+    
+    def _extend_pair_index(self, max_distance, chunk_size, max_pairs):
+        """Appends the pairs in [current max, max_distance); False (index unchanged) past max_pairs."""
+        index = self.pair_index
+        n_indexed = len(index['distance'])
+        
+        chunks, n_new = [], 0
+        for chunk in self.iter_similar_pairs(distance_threshold=max_distance, chunk_size=chunk_size,
+                                             min_distance=index['max_distance']):
+            n_new += len(chunk)
+            if max_pairs is not None and n_indexed + n_new > max_pairs:
+                return False
+            chunks.append(chunk)
+        
+        pairs_df = pd.concat(chunks, ignore_index=True) if chunks else _pairs_frame([], [], [])
+        order = np.argsort(pairs_df['Distance'].to_numpy(), kind='stable')
+        
+        index['person_a'] = np.concatenate([index['person_a'], pairs_df['Person A'].to_numpy()[order]])
+        index['person_b'] = np.concatenate([index['person_b'], pairs_df['Person B'].to_numpy()[order]])
+        index['distance'] = np.concatenate([index['distance'], pairs_df['Distance'].to_numpy()[order]])
+        index['max_distance'] = max_distance
+        return True
+    
+    def query_pair_index(self, distance_threshold):
+        """
+        Returns all pairs with distance < threshold from the prebuilt pair index.
+        
+        Args:
+            distance_threshold (float): Similarity cutoff, at most the index max_distance.
+            
+        Returns:
+            pd.DataFrame: Columns ['Person A', 'Person B', 'Distance'], closest pairs first.
+        """
+        if self.pair_index is None:
+            raise ValueError("Pair index not built. Call ensure_pair_index() first.")
+        if distance_threshold > self.pair_index['max_distance']:
+            raise ValueError(
+                f"Threshold {distance_threshold} exceeds the pair index range "
+                f"({self.pair_index['max_distance']}). Extend it with ensure_pair_index()."
+            )
+        
+        # Distances are sorted, so '< threshold' is a prefix of the index
+        stop = np.searchsorted(self.pair_index['distance'], np.float32(distance_threshold), side='left')
+        
+        return _pairs_frame(
+            self.pair_index['person_a'][:stop],
+            self.pair_index['person_b'][:stop],
+            self.pair_index['distance'][:stop]
+        )
+
+    def recall_report(self, n_neighbors=10, n_queries=500, random_state=42):
+        """
+        Measures recall@k and speed of the fitted index against an exact brute-force search.
+        Mainly useful to tune n_lists / n_probe of the 'ivf' backend.
+        
+        Returns:
+            dict: See src.ethics.neighbors.measure_recall.
+        """
+        if self.knn_model is None:
+            raise ValueError("Model not trained. Call train() first.")
+        self.merge_buffer()
+        return measure_recall(self.X_masked, self.knn_model, n_neighbors=n_neighbors,
+                              n_queries=n_queries, random_state=random_state)
+
+    def add_rows(self, X_new, distance_threshold=0.5):
+        """
+        Appends new records (e.g. today's applications) without refitting the index.
+        
+        New rows are compared against the historical population with one radius query
+        on the existing index, and against the buffered segment of earlier appended rows
+        by brute force. Historical rows are never re-queried. The buffer is merged into
+        the index (one refit) once it exceeds max_buffer_rows.
+        If a pair index exists, the new pairs are inserted into it as well.
+        
+        Args:
+            X_new (pd.DataFrame): New rows with the same columns as X_processed.
+            distance_threshold (float): Similarity cutoff for the returned pairs.
+            
+        Returns:
+            pd.DataFrame: New pairs ['Person A', 'Person B', 'Distance'] involving at least one
+                          new row. New rows are numbered after all existing rows.
+        """
+        if self.knn_model is None:
+            raise ValueError("Model not trained. Call train() first.")
+        
+        X_new_masked = _drop_columns(X_new, [c for c in self.masked_columns if c in X_new.columns],
+                                     float_dtype(self.X_masked))
+        if sp.issparse(X_new_masked):
+            if not X_new_masked.columns.equals(self.X_masked.columns):
+                raise ValueError("Sparse rows must have the same columns as the trained matrix.")
+        else:
+            X_new_masked = X_new_masked[self.X_masked.columns].reset_index(drop=True)
+        
+        n_indexed = self.X_masked.shape[0]
+        n_buffered = sum(b.shape[0] for b in self.buffer)
+        n_new = X_new_masked.shape[0]
+        new_ids = np.arange(n_indexed + n_buffered, n_indexed + n_buffered + n_new)
+        
+        # Search wide enough to also feed the pair index
+        radius = distance_threshold
+        if self.pair_index is not None:
+            radius = max(radius, self.pair_index['max_distance'])
+        
+        # 1. New rows vs the indexed history
+        dist_lists, ind_lists = self.knn_model.radius_neighbors(X_new_masked, radius=radius)
+        counts = np.fromiter((len(ind) for ind in ind_lists), dtype=np.int64, count=len(ind_lists))
+        rows = [np.repeat(new_ids, counts)]
+        cols = [np.concatenate(list(ind_lists)).astype(np.int64) if counts.sum() else np.empty(0, dtype=np.int64)]
+        dists = [np.concatenate(list(dist_lists)) if counts.sum() else np.empty(0)]
+        
+        # 2. New rows vs the buffered segment and each other (brute force, the segment is small)
+        segment = _stack_rows(self.buffer + [X_new_masked])
+        seg_d = euclidean_distances(X_new_masked, segment)
+        q_pos, s_pos = np.nonzero(seg_d <= radius)
+        rows.append(new_ids[q_pos])
+        cols.append(n_indexed + s_pos)
+        dists.append(seg_d[q_pos, s_pos])
+        
+        rows, cols, dists = np.concatenate(rows), np.concatenate(cols), np.concatenate(dists)
+        keep = dists < radius
+        person_a, person_b, pair_dist = _canonical_pairs(rows[keep], cols[keep], dists[keep])
+        
+        if self.pair_index is not None:
+            self._insert_into_pair_index(person_a, person_b, pair_dist)
+        
+        self.buffer.append(X_new_masked)
+        self.index_key = None # The pair index now covers rows the stored entry does not have
+        if n_buffered + n_new > self.max_buffer_rows:
+            self.merge_buffer()
+        
+        within = pair_dist < distance_threshold
+        return _pairs_frame(person_a[within], person_b[within], pair_dist[within])
+    
+    def merge_buffer(self):
+        """
+        Merges rows appended with add_rows into X_masked and refits the index.
+        The pair index stays valid (add_rows keeps it up to date).
+        """
+        if not self.buffer:
+            return
+        self.X_masked = _stack_rows([self.X_masked] + self.buffer)
+        self.buffer = []
+        self.knn_model = make_neighbors_index(self.backend, **self.backend_params)
+        self.knn_model.fit(self.X_masked)
+        self.index_key = None # No longer matches a stored entry
+    
+    def _insert_into_pair_index(self, person_a, person_b, pair_dist):
+        """Inserts new pairs (< max_distance) into the sorted pair index."""
+        index = self.pair_index
+        within = pair_dist < index['max_distance']
+        person_a, person_b, pair_dist = person_a[within], person_b[within], pair_dist[within]
+        
+        order = np.argsort(pair_dist, kind='stable')
+        person_a, person_b, pair_dist = person_a[order], person_b[order], pair_dist[order]
+        
+        positions = np.searchsorted(index['distance'], pair_dist, side='right')
+        index['person_a'] = np.insert(index['person_a'], positions, person_a)
+        index['person_b'] = np.insert(index['person_b'], positions, person_b)
+        index['distance'] = np.insert(index['distance'], positions, pair_dist)
 
     def analyze_neighborhood_bias(self, target_idx, neighbor_indices, y_pred, sensitive_values):
         """
@@ -134,3 +612,72 @@ class SimilarityAnalyzer:
             'target_prediction': y_pred.iloc[target_idx],
             'target_sensitive': sensitive_values.iloc[target_idx]
         }
+
+    def analyze_all_neighborhoods(self, neighbor_indices, y_pred, sensitive_values):
+        """
+        Batch version of analyze_neighborhood_bias for every row at once.
+        Row i's neighborhood is row i plus neighbor_indices[i] (each index counted once),
+        aggregated with bincount instead of one pandas groupby per target.
+        
+        Args:
+            neighbor_indices (np.ndarray): (n, k) neighbor positions, e.g. from kneighbors.
+                                           Negative entries (padding) are ignored.
+            y_pred (pd.Series / array): Predictions for the whole dataset (positional).
+            sensitive_values (pd.Series): The sensitive attribute for the dataset.
+            
+        Returns:
+            dict: 'stats' (DataFrame n x groups, local approval rate per group),
+                  'counts' (DataFrame n x groups, members per group),
+                  'consistency_score' (array, 1 - std of predictions per neighborhood),
+                  'dataset_consistency' (float, mean consistency over all rows).
+        """
+        neighbor_indices = np.asarray(neighbor_indices, dtype=np.int64)
+        n_rows = neighbor_indices.shape[0]
+        
+        # Neighborhood = target + neighbors; sort per row to drop repeated indices (e.g. the target itself)
+        members = np.sort(np.hstack([np.arange(n_rows)[:, None], neighbor_indices]), axis=1)
+        valid = members >= 0
+        valid[:, 1:] &= members[:, 1:] != members[:, :-1]
+        members = np.where(valid, members, 0)
+        
+        preds = np.asarray(y_pred, dtype=np.float64)[members]
+        codes, groups = pd.factorize(sensitive_values)
+        member_codes = codes[members]
+        n_groups = len(groups)
+        
+        # Scatter-add predictions into (row, group) cells
+        in_group = valid & (member_codes >= 0)
+        cell = (np.arange(n_rows)[:, None] * n_groups + member_codes)[in_group]
+        counts = np.bincount(cell, minlength=n_rows * n_groups).reshape(n_rows, n_groups)
+        sums = np.bincount(cell, weights=preds[in_group], minlength=n_rows * n_groups).reshape(n_rows, n_groups)
+        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rates = sums / counts
+            
+            # Sample std (ddof=1, like pandas) from running sums; undefined for single-member neighborhoods
+            m = valid.sum(axis=1)
+            s1 = np.where(valid, preds, 0).sum(axis=1)
+            s2 = np.where(valid, preds ** 2, 0).sum(axis=1)
+            var = np.maximum(s2 - s1 ** 2 / m, 0) / (m - 1)
+            consistency = np.where(m > 1, 1.0 - np.sqrt(var), np.nan)
+        
+        return {
+            'stats': pd.DataFrame(rates, columns=groups),
+            'counts': pd.DataFrame(counts, columns=groups),
+            'consistency_score': consistency,
+            'dataset_consistency': float(np.nanmean(consistency)) if np.isfinite(consistency).any() else float('nan')
+        }
+    
+    def neighborhood_consistency(self, y_pred, sensitive_values, n_neighbors=10):
+        """
+        Dataset-level individual fairness: queries the n_neighbors of every row
+        in one kneighbors call and scores all neighborhoods with analyze_all_neighborhoods.
+        
+        Returns:
+            dict: See analyze_all_neighborhoods.
+        """
+        if self.knn_model is None:
+            raise ValueError("Model not trained. Call train() first.")
+        self.merge_buffer()
+        _, indices = self.knn_model.kneighbors(self.X_masked, n_neighbors=n_neighbors)
+        return self.analyze_all_neighborhoods(indices, y_pred, sensitive_values)
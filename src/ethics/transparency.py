@@ -1,19 +1,30 @@
+import os
+import threading
 import pandas as pd
 import numpy as np
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from scipy import sparse as sp
+from src.ethics.variants import family_variants, variant_batches
+from src.utils.precision import float_dtype
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def generate_explanations(model, X_sample):
+def generate_explanations(model, X_sample, families=None, random_state=42):
     """
     Generates global feature importance using RandomForest's native feature_importances_.
     Replaces SHAP due to DLL/OS security blocking issues.
+    Models without feature_importances_ get model-agnostic permutation importance.
     
     Args:
-        model: Trained scikit-learn model (must have feature_importances_ attribute).
-        X_sample (pd.DataFrame): Sample data (used for column names).
+        model: Trained scikit-learn model (feature_importances_ or predict/predict_proba).
+        X_sample (pd.DataFrame): Sample data (column names; rows for permutation importance).
+                                 A named CSR matrix (sparse mode, see with_columns) or a row slice of
+                                 one is also accepted.
+        families (dict): Optional {name: [columns]} blocks permuted together (e.g. one-hot families).
+        random_state (int): Seed for permutation importance.
         
     Returns:
         dict: Contains 'feature_importance' (DataFrame) and 'is_mock' (False).
@@ -38,18 +49,236 @@ def generate_explanations(model, X_sample):
                 'is_mock': False
             }
         else:
-            logger.warning("Model does not support native feature_importances_. Returning mock data.")
-            return _generate_mock_explanations(X_sample)
+            logger.info("Model does not support native feature_importances_. Using permutation importance.")
+            return {
+                'feature_importance': permutation_importance(model, X_sample, families=families,
+                                                             random_state=random_state),
+                'shap_values': None, # Legacy key for compatibility
+                'is_mock': False
+            }
 
     except Exception as e:
         logger.error(f"Error generating native explanations: {str(e)}")
         return _generate_mock_explanations(X_sample)
 
+def _permutation_blocks(columns, families):
+    """Column-position blocks: one per family, plus one per column outside every family."""
+    columns = list(columns)
+    blocks, covered = {}, set()
+    for name, cols in (families or {}).items():
+        cols = [c for c in cols if c in columns and c not in covered]
+        if cols:
+            blocks[name] = [columns.index(c) for c in cols]
+            covered.update(cols)
+    for i, c in enumerate(columns):
+        if c not in covered:
+            blocks[c] = [i]
+    return blocks
+
+def _score_rows(model, batch, columns, base, y):
+    """
+    Per-row score of one stacked batch against the unpermuted predictions.
+    With y: 1 for a correct prediction. Without y: agreement with the base
+    prediction (1 - total variation distance of the probabilities if available).
+    """
+    frame = batch if sp.issparse(batch) else pd.DataFrame(batch, columns=columns, copy=False)
+    if y is None and hasattr(model, 'predict_proba'):
+        proba = model.predict_proba(frame)
+        return 1.0 - 0.5 * np.abs(proba.reshape(-1, *base.shape) - base).sum(axis=2)
+    pred = np.asarray(model.predict(frame)).reshape(-1, len(base))
+    return (pred == (base if y is None else y)).astype(np.float64)
+
+def permutation_importance(model, X, y=None, families=None, n_repeats=5, random_state=42,
+                           n_jobs=None, max_batch_rows=200_000):
+    """
+    Model-agnostic permutation importance for any estimator with predict / predict_proba.
+    
+    Each block (a single column, or a whole one-hot family permuted together) is
+    shuffled once per repeat. The shuffled copies of X for several (block, repeat)
+    tasks are written into a preallocated per-thread buffer and scored in one call;
+    batches run on a thread pool. max_batch_rows is the budget of all buffers together
+    (split across the workers, with fewer workers if one copy of X per worker does not
+    fit). Permutations come from one seeded generator, so results are reproducible.
+    
+    Args:
+        model: Fitted estimator.
+        X (pd.DataFrame): Data to permute (the model's processed features). A CSR matrix
+                          with `.columns` (sparse mode) is permuted without densifying.
+        y (pd.Series): Optional true targets. Importance is then the accuracy drop;
+                       without y it is the mean change of the model's own output.
+        families (dict): {name: [columns]} blocks permuted together, see get_feature_families.
+        n_repeats (int): Shuffles per block.
+        random_state (int): Seed of the permutations.
+        n_jobs (int): Worker threads. Defaults to the CPU count.
+        max_batch_rows (int): Upper bound on the buffered rows of all workers together.
+        
+    Returns:
+        pd.DataFrame: 'feature', 'importance' (mean over repeats) and 'importance_std',
+                      sorted by importance descending.
+    """
+    columns = X.columns
+    is_sparse = sp.issparse(X)
+    X_arr = sp.csc_matrix(X, dtype=float_dtype(X)) if is_sparse else X.to_numpy(dtype=float_dtype(X))
+    n = X_arr.shape[0]
+    y = None if y is None else np.asarray(y).ravel()
+    
+    if y is None and hasattr(model, 'predict_proba'):
+        base = model.predict_proba(X)
+    else:
+        base = np.asarray(model.predict(X))
+    base_score = _score_rows(model, X_arr, columns, base, y).mean() if y is not None else 1.0
+    
+    blocks = _permutation_blocks(columns, families)
+    rng = np.random.default_rng(random_state)
+    perms = [rng.permutation(n) for _ in range(n_repeats)]
+    tasks = [(name, r) for name in blocks for r in range(n_repeats)]
+    
+    # Every worker holds one buffer, so the row budget is shared among them
+    n_workers = max(1, min(n_jobs or os.cpu_count() or 1, max_batch_rows // max(n, 1)))
+    per_batch = max(1, max_batch_rows // n_workers // max(n, 1))
+    batches = [tasks[i:i + per_batch] for i in range(0, len(tasks), per_batch)]
+    local = threading.local()
+    
+    if is_sparse:
+        # Sparse: permuting a column = renumbering the row indices of its CSC entries
+        entry_col = np.repeat(np.arange(X_arr.shape[1]), np.diff(X_arr.indptr))
+        block_entries = {name: np.flatnonzero(np.isin(entry_col, cols)) for name, cols in blocks.items()}
+        inv_perms = [np.argsort(p) for p in perms]
+    
+    def run_sparse(batch_tasks):
+        shuffled = []
+        for name, r in batch_tasks:
+            out = X_arr.copy()
+            entries = block_entries[name]
+            out.indices[entries] = inv_perms[r][out.indices[entries]]
+            out.has_sorted_indices = False
+            shuffled.append(out)
+        return _score_rows(model, sp.vstack(shuffled, format='csr'), columns, base, y).mean(axis=1)
+    
+    def run_dense(batch_tasks):
+        # Each worker thread reuses one buffer across its batches
+        buffer = getattr(local, 'buffer', None)
+        if buffer is None or len(buffer) < len(batch_tasks) * n:
+            buffer = local.buffer = np.empty((per_batch * n, X_arr.shape[1]), dtype=X_arr.dtype)
+        view = buffer[:len(batch_tasks) * n]
+        for i, (name, r) in enumerate(batch_tasks):
+            cols = blocks[name]
+            view[i * n:(i + 1) * n] = X_arr
+            # Gathers only the block's columns of the permuted rows, not a full permuted copy of X
+            view[i * n:(i + 1) * n, cols] = X_arr[perms[r][:, None], cols]
+        return _score_rows(model, view, columns, base, y).mean(axis=1)
+    
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        run = run_sparse if is_sparse else run_dense
+        scores = np.concatenate(list(pool.map(run, batches))) if batches else np.empty(0)
+    
+    drops = (base_score - scores).reshape(len(blocks), n_repeats)
+    return pd.DataFrame({
+        'feature': list(blocks),
+        'importance': drops.mean(axis=1),
+        'importance_std': drops.std(axis=1)
+    }).sort_values(by='importance', ascending=False).reset_index(drop=True)
+
+def top_raw_features(feature_importance, families, k=5):
+    """
+    Ranks raw features by the summed importance of their processed columns.
+    
+    Args:
+        feature_importance (pd.DataFrame): 'feature' / 'importance' table of generate_explanations.
+        families (dict): {raw_col: [processed columns]}, see get_feature_families.
+        k (int): Number of features to return.
+        
+    Returns:
+        list: The k most important raw feature names.
+    """
+    imp = feature_importance.set_index('feature')['importance']
+    totals = {}
+    for raw, cols in families.items():
+        if raw in imp.index and raw not in cols:
+            # Permutation importance is already reported per family
+            totals[raw] = imp[raw]
+        elif cols:
+            totals[raw] = imp.reindex(cols).fillna(0).sum()
+    return sorted(totals, key=totals.get, reverse=True)[:k]
+
+def partial_dependence_curves(model, X, families, grid_resolution=20, sample_size=2000, n_ice=50,
+                              class_label=1, max_batch_rows=500_000, random_state=42):
+    """
+    Partial dependence (PD) and ICE curves for raw features.
+    
+    A numeric feature is set to each point of a quantile grid, a one-hot family to
+    each of its levels. All grid-substituted copies of the (sampled) rows are stacked
+    into batches of at most max_batch_rows rows and scored with one predict_proba
+    (or predict) call per batch instead of one call per grid point. Of a CSR matrix
+    only the sampled rows are densified.
+    
+    Args:
+        model: Fitted estimator.
+        X (pd.DataFrame or scipy.sparse matrix): The processed dataset (CSR with the
+                                                 column names as .columns, see with_columns).
+        families (dict): {raw_col: [processed columns]} of the features to plot.
+        grid_resolution (int): Quantile grid points for numeric features.
+        sample_size (int): Row budget; larger datasets are subsampled (fixed seed).
+        n_ice (int): Number of ICE curves (individual rows) returned per feature.
+        class_label: Class whose probability is plotted (classifiers with predict_proba).
+        max_batch_rows (int): Upper bound on the rows of one scored batch.
+        random_state (int): Seed for the row sample.
+        
+    Returns:
+        dict: {raw_col: {'grid': grid values (numeric) or levels (categorical),
+                         'kind': 'numeric' or 'categorical',
+                         'pd': (n_grid,) mean prediction, 'ice': (n_ice, n_grid) row curves}}
+    """
+    rng = np.random.default_rng(random_state)
+    is_sparse = sp.issparse(X)
+    n = X.shape[0]
+    rows = np.sort(rng.choice(n, sample_size, replace=False)) if n > sample_size else np.arange(n)
+    if is_sparse:
+        X_arr = X.tocsr()[rows].toarray().astype(float_dtype(X), copy=False)
+    else:
+        X_sample = X.iloc[rows] if n > sample_size else X
+        X_arr = X_sample.to_numpy(dtype=float_dtype(X_sample))
+    columns = X.columns
+    columns_list = list(columns)
+    
+    use_proba = hasattr(model, 'predict_proba') and class_label in list(getattr(model, 'classes_', []))
+    k = list(model.classes_).index(class_label) if use_proba else None
+    
+    results = {}
+    for raw_col, family_cols in families.items():
+        if not family_cols:
+            continue
+        if raw_col in family_cols:
+            quantiles = np.linspace(0.05, 0.95, grid_resolution)
+            grid = np.unique(np.quantile(X_arr[:, columns_list.index(raw_col)].astype(np.float64), quantiles))
+            positions, values, kind = [columns_list.index(raw_col)], grid.reshape(-1, 1), 'numeric'
+        else:
+            positions, grid, values = family_variants(X, raw_col, family_cols, None)
+            kind = 'categorical'
+        
+        curves = np.empty((len(X_arr), len(values)))
+        for start, stop, view in variant_batches(X_arr, positions, values, max_batch_rows):
+            # A model fitted on a sparse matrix has no feature names; score the array as is
+            frame = view if is_sparse else pd.DataFrame(view, columns=columns, copy=False)
+            out = model.predict_proba(frame)[:, k] if use_proba else np.asarray(model.predict(frame), dtype=np.float64)
+            curves[start:stop] = out.reshape(stop - start, len(values))
+        
+        results[raw_col] = {
+            'grid': list(grid),
+            'kind': kind,
+            'pd': curves.mean(axis=0),
+            'ice': curves[:n_ice]
+        }
+    return results
+
 def _generate_mock_explanations(X_sample):
     """
     Fallback function to return mock data if everything fails.
     """
-    feature_names = X_sample.columns
+    # Positional names if even the column names are unavailable (e.g. a plain array)
+    feature_names = getattr(X_sample, 'columns', None)
+    if feature_names is None:
+        feature_names = [f"x{i}" for i in range(X_sample.shape[1])]
     # Generate random importance that sums to 1
     mock_importance = np.abs(np.random.randn(len(feature_names)))
     mock_importance /= mock_importance.sum()
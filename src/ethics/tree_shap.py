@@ -0,0 +1,230 @@
+import weakref
+import numpy as np
+import pandas as pd
+from scipy import sparse as sp
+
+# Path-dependent TreeSHAP (Lundberg et al., "Consistent Individualized Feature Attribution
+# for Tree Ensembles") on the fitted sklearn tree arrays, without the shap package.
+#
+# Each leaf is a small game over the distinct features on its root-to-leaf path. A feature
+# that is split on twice is one player: its zero fraction z is the product of the cover
+# ratios of its edges, its one fraction o (0 or 1) says whether the row satisfies all of
+# its conditions (lo < x <= hi). The Shapley value of player i in the leaf game is
+#     v * (o_i - z_i) * integral_0^1 prod_{j != i} (z_j (1 - t) + o_j t) dt
+# (Yu et al., "Linear TreeSHAP"). The integrand is a polynomial of degree < d, so a
+# ceil(d / 2) point Gauss-Legendre rule is exact. Per tree, the paths, cover products and
+# quadrature factors are computed once per model; per row only o changes, and all leaves
+# and rows are handled with a few batched matrix products (rows innermost, so every operand
+# is contiguous) instead of a node recursion.
+
+# Rows x path cells (leaves x path length) of one scored batch: bounds the temporaries of a tree
+_BATCH_CELLS = 2_000_000
+
+# Path structures per fitted estimator; refitting replaces tree_, which invalidates the entry
+_PATH_CACHE = weakref.WeakKeyDictionary()
+
+def _tree_paths(tree, is_classifier):
+    """
+    Per-leaf path structures of one fitted sklearn tree, padded to the largest number d
+    of distinct path features. Padding cells have z = 1 and an always-true condition, so
+    their quadrature factor is 1 and their attribution 0.
+
+    Returns:
+        dict: 'features', 'lo', 'hi' (n_leaves, d, 1) path conditions, 'base' (n_leaves, q, 1)
+              and 'delta' (n_leaves, q, d) log quadrature factors, 'weights' (n_leaves, 2d, q)
+              integration weights for o = 1 (first d) and o = 0 (last d), 'scatter' (one sparse
+              (n_features, n_leaves * d) matrix per output holding the leaf values) and
+              'expected' (n_outputs,).
+    """
+    left, right = tree.children_left, tree.children_right
+    cover = tree.weighted_n_node_samples
+    values = tree.value[:, 0, :]
+    if is_classifier:
+        values = values / values.sum(axis=1, keepdims=True)
+    leaves = np.flatnonzero(left == -1)
+    n_leaves, n_features = len(leaves), tree.n_features
+    expected = (values * cover[:, None])[leaves].sum(axis=0) / cover[0]
+
+    # Walk every leaf up to the root at once; each step records the edge (leaf, child node)
+    internal = np.flatnonzero(left != -1)
+    parent = np.full(tree.node_count, -1, dtype=np.int64)
+    parent[left[internal]] = internal
+    parent[right[internal]] = internal
+    owners, children = [], []
+    node, owner = leaves, np.arange(n_leaves)
+    while True:
+        up = parent[node] >= 0
+        node, owner = node[up], owner[up]
+        if not len(node):
+            break
+        owners.append(owner)
+        children.append(node)
+        node = parent[node]
+
+    if owners:
+        owner, child = np.concatenate(owners), np.concatenate(children)
+        split = parent[child]
+        feature, threshold = tree.feature[split], tree.threshold[split]
+        went_left = left[split] == child
+
+        # Merge the edges of each (leaf, feature): one player per distinct path feature
+        groups, player = np.unique(owner * n_features + feature, return_inverse=True)
+        z = np.ones(len(groups))
+        np.multiply.at(z, player, cover[child] / cover[split])
+        lo = np.full(len(groups), -np.inf)
+        hi = np.full(len(groups), np.inf)
+        np.maximum.at(lo, player[~went_left], threshold[~went_left])
+        np.minimum.at(hi, player[went_left], threshold[went_left])
+        group_leaf, group_feature = groups // n_features, groups % n_features
+        position = np.arange(len(groups)) - np.searchsorted(group_leaf, group_leaf)
+        depth = int(position.max()) + 1
+    else:
+        depth = 0 # Single-leaf tree: nothing to attribute
+
+    features = np.zeros((n_leaves, depth), dtype=np.int64)
+    lo_cells = np.full((n_leaves, depth), -np.inf)
+    hi_cells = np.full((n_leaves, depth), np.inf)
+    z_cells = np.ones((n_leaves, depth))
+    valid = np.zeros((n_leaves, depth), dtype=bool)
+    if depth:
+        features[group_leaf, position] = group_feature
+        lo_cells[group_leaf, position] = lo
+        hi_cells[group_leaf, position] = hi
+        z_cells[group_leaf, position] = z
+        valid[group_leaf, position] = True
+
+    # Gauss-Legendre nodes / weights on [0, 1], exact for the degree < depth integrands
+    nodes, weights = np.polynomial.legendre.leggauss(max(1, (depth + 1) // 2))
+    t, w = (nodes + 1) / 2, weights / 2
+    factor0 = z_cells[:, :, None] * (1 - t)      # o = 0: z (1 - t), > 0 as covers are > 0
+    factor1 = factor0 + t                        # o = 1: z (1 - t) + t
+    log0, log1 = np.log(factor0), np.log(factor1)
+
+    # Leaf values per (leaf, path cell), summed onto the cell's feature
+    cells = np.flatnonzero(valid.ravel())
+    scatter = [sp.csr_matrix((np.repeat(values[leaves, k], depth)[cells], (features.ravel()[cells], cells)),
+                             shape=(n_features, n_leaves * depth)) for k in range(values.shape[1])]
+    # Integrand weights: o_i (1 - z_i) / factor1_i - (1 - o_i) z_i / factor0_i = o_i (a1 + a0) - a0
+    a0 = w * z_cells[:, :, None] / factor0
+    a1 = w * (1 - z_cells)[:, :, None] / factor1
+    return {
+        'features': features,
+        'lo': lo_cells[:, :, None],
+        'hi': hi_cells[:, :, None],
+        'base': log0.sum(axis=1)[:, :, None],
+        'delta': np.ascontiguousarray((log1 - log0).transpose(0, 2, 1)),
+        'weights': np.concatenate([a1 + a0, a0], axis=1),
+        'scatter': scatter,
+        'expected': expected
+    }
+
+def _model_paths(model, is_classifier):
+    """Path structures of every tree of the model, computed once per fitted estimator."""
+    paths = []
+    for est in getattr(model, 'estimators_', [model]):
+        cached = _PATH_CACHE.get(est)
+        if cached is None or cached[0] is not est.tree_:
+            cached = (est.tree_, _tree_paths(est.tree_, is_classifier))
+            _PATH_CACHE[est] = cached
+        paths.append(cached[1])
+    return paths
+
+def _add_tree_shap(paths, X_t, phi):
+    """
+    Adds the attributions of one tree (see _tree_paths) to phi (n_rows, n_features, n_outputs).
+    X_t holds the rows as columns: (n_features, n_rows).
+    """
+    n_leaves, depth = paths['features'].shape
+    if not depth:
+        return
+    # (n_leaves, depth, n_rows): does the row satisfy the conditions of each path feature?
+    x = X_t[paths['features']]
+    one = ((x > paths['lo']) & (x <= paths['hi'])).astype(np.float64)
+
+    # prod_j factor_j at the quadrature points for every leaf and row: (n_leaves, q, n_rows)
+    g = paths['delta'] @ one
+    g += paths['base']
+    np.exp(g, out=g)
+    # Integrated contributions of every path cell: (n_leaves, depth, n_rows)
+    weighted = paths['weights'] @ g
+    contrib = weighted[:, :depth]
+    contrib *= one
+    contrib -= weighted[:, depth:]
+
+    cells = contrib.reshape(n_leaves * depth, -1)
+    for k, scatter in enumerate(paths['scatter']):
+        phi[:, :, k] += (scatter @ cells).T
+
+def forest_shap_values(model, X, chunk_size=4096):
+    """
+    Path-dependent TreeSHAP values of a fitted sklearn tree or forest.
+
+    Reads the estimators' tree arrays directly (path structures are cached per fitted
+    estimator, so repeated calls on the same model skip that step). Rows are processed
+    in chunks of chunk_size, and each tree scores a chunk in batches bounded by its
+    number of leaves and path length. A CSR matrix is densified one chunk at a time.
+
+    Args:
+        model: Fitted RandomForestClassifier / ExtraTreesClassifier / DecisionTreeClassifier
+               (or the regressor counterparts).
+        X (pd.DataFrame or scipy.sparse matrix): Rows to explain, same columns as at fit time.
+        chunk_size (int): Rows processed together.
+
+    Returns:
+        tuple: (values, expected_value). values has shape (n_rows, n_features, n_outputs)
+               (n_outputs = number of classes for classifiers) and, per row and output,
+               sums to the model output minus expected_value.
+    """
+    # sklearn routes rows on float32 features; the same cast keeps the paths (and additivity) identical
+    X_arr = X.tocsr() if sp.issparse(X) else np.asarray(X, dtype=np.float32)
+    n_rows, n_features = X_arr.shape
+    is_classifier = hasattr(model, 'classes_')
+    n_outputs = len(model.classes_) if is_classifier else 1
+
+    paths = _model_paths(model, is_classifier)
+
+    values = np.zeros((n_rows, n_features, n_outputs))
+    for start in range(0, n_rows, chunk_size):
+        chunk = X_arr[start:start + chunk_size]
+        if sp.issparse(chunk):
+            chunk = chunk.toarray().astype(np.float32, copy=False)
+        chunk_t = np.ascontiguousarray(chunk.T)
+        phi = values[start:start + chunk_size]
+        for tree_paths in paths:
+            n_leaves, depth = tree_paths['features'].shape
+            batch = max(1, _BATCH_CELLS // (n_leaves * max(depth, 1)))
+            for b0 in range(0, len(chunk), batch):
+                _add_tree_shap(tree_paths, chunk_t[:, b0:b0 + batch], phi[b0:b0 + batch])
+
+    expected = np.mean([tree_paths['expected'] for tree_paths in paths], axis=0)
+    return values / len(paths), expected
+
+def local_explanations(model, X, rows, class_label=1, families=None):
+    """
+    Per-row TreeSHAP attributions for one class, optionally summed per feature family.
+
+    Args:
+        model: Fitted sklearn tree / forest.
+        X (pd.DataFrame or scipy.sparse matrix): The processed dataset (CSR with the
+                                                 column names as .columns, see with_columns).
+        rows (array-like): Row positions to explain.
+        class_label: Class whose probability is explained (classifiers only).
+        families (dict): Optional {raw_col: [processed columns]}; attributions are additive,
+                         so a one-hot family is reported as the sum of its columns.
+
+    Returns:
+        pd.DataFrame: One row per explained row (indexed by position), one column per
+                      feature (or family).
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    # Only the explained rows of a sparse matrix are densified
+    values, _ = forest_shap_values(model, X.tocsr()[rows] if sp.issparse(X) else X.iloc[rows])
+    k = list(model.classes_).index(class_label) if hasattr(model, 'classes_') else 0
+    attributions = pd.DataFrame(values[:, :, k], index=rows, columns=X.columns)
+
+    if families:
+        grouped = {name: attributions[cols].sum(axis=1) for name, cols in families.items() if cols}
+        covered = {c for cols in families.values() for c in cols}
+        rest = attributions[[c for c in X.columns if c not in covered]]
+        attributions = pd.concat([pd.DataFrame(grouped, index=rows), rest], axis=1)
+    return attributions
@@ -0,0 +1,62 @@
+import numpy as np
+from scipy import sparse as sp
+
+# Stacked "what if" copies of rows with one feature family replaced, shared by the
+# counterfactual flip test and the partial dependence curves.
+
+def family_variants(X_processed, raw_col, family_cols, numeric_quantiles):
+    """
+    Lists the substitute values of one raw feature.
+
+    A one-hot family (f"{raw_col}_<level>") gets one variant per level with that
+    column on and the rest of the family off. A numeric column (kept under its own
+    name) gets one variant per quantile of its processed values.
+
+    Args:
+        X_processed (pd.DataFrame or scipy.sparse matrix): The processed dataset (CSR with
+                                                           the column names as .columns).
+        raw_col (str): Raw feature name.
+        family_cols (list): Its processed columns, see get_feature_families.
+        numeric_quantiles (tuple): Quantiles used as values of a numeric feature.
+
+    Returns:
+        tuple: (column positions, list of level labels, (n_variants, n_family_cols) value matrix)
+    """
+    columns = list(X_processed.columns)
+    if raw_col in family_cols:
+        if sp.issparse(X_processed):
+            column = X_processed.tocsc()[:, columns.index(raw_col)].toarray().ravel()
+        else:
+            column = X_processed[raw_col].to_numpy(dtype=np.float64)
+        values = np.quantile(column, numeric_quantiles)
+        labels = [f"q{int(round(q * 100))}" for q in numeric_quantiles]
+        return [columns.index(raw_col)], labels, values.reshape(-1, 1)
+
+    pfx = f"{raw_col}_"
+    labels = [c[len(pfx):] for c in family_cols]
+    return [columns.index(c) for c in family_cols], labels, np.eye(len(family_cols))
+
+def variant_batches(X, positions, values, max_batch_rows):
+    """
+    Yields (start, stop, batch) where batch stacks every variant of rows start..stop.
+
+    Variant v of row i sits at (i - start) * n_variants + v and equals the row with the
+    columns at positions replaced by values[v]. One buffer (of X's dtype) is preallocated and reused.
+
+    Args:
+        X (np.ndarray): Dense rows.
+        positions (list): Column positions that are replaced.
+        values (np.ndarray): (n_variants, len(positions)) replacement values.
+        max_batch_rows (int): Upper bound on the rows of one batch.
+    """
+    n, n_variants = len(X), len(values)
+    chunk = max(1, max_batch_rows // n_variants)
+    batch = np.empty((min(chunk, n) * n_variants, X.shape[1]), dtype=X.dtype)
+
+    for start in range(0, n, chunk):
+        stop = min(start + chunk, n)
+        rows = stop - start
+        view = batch[:rows * n_variants]
+        view.reshape(rows, n_variants, -1)[:] = X[start:stop, None, :]
+        view.reshape(rows, n_variants, -1)[:, :, positions] = values[None, :, :]
+        yield start, stop, view
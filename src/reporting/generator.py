@@ -1,5 +1,6 @@
 from fpdf import FPDF
 import datetime
+from src.scoring.engine import fairness_score
 
 class EthicsReportPDF(FPDF):
     def __init__(self, lang='en'):
@@ -82,10 +83,38 @@ class EthicsReportPDF(FPDF):
         self.section("Detailed Findings" if self.lang == 'en' else "Detayli Bulgular")
         
         # Fairness
-        f_score = 100 - abs(metrics['fairness'].get('statistical_parity_difference', 0) * 500)
+        f_score = fairness_score(metrics['fairness'])
         self.kv("Fairness Raw Score", f"{f_score:.1f} / 100")
         for k, v in metrics['fairness'].items():
-            self.kv(f" - {k}", f"{v:.4f}")
+            if isinstance(v, (int, float)):
+                self.kv(f" - {k}", f"{v:.4f}")
+            elif isinstance(v, tuple) and len(v) == 2:
+                # Bootstrap confidence interval
+                self.kv(f" - {k}", f"[{v[0]:.4f}, {v[1]:.4f}]")
+        
+        # Per-attribute disparity (all selected sensitive features)
+        for feat, m in metrics.get('fairness_by_feature', {}).items():
+            spd_str = f"{m['statistical_parity_difference']:.4f}"
+            if 'statistical_parity_difference_ci' in m:
+                lo, hi = m['statistical_parity_difference_ci']
+                spd_str += f" (95% CI [{lo:.4f}, {hi:.4f}])"
+            self.kv(f" - SPD [{feat}]", spd_str)
+        
+        # Counterfactual flip test (decision changes when only the sensitive attribute changes)
+        for feat, r in metrics.get('counterfactual', {}).items():
+            self.kv(f" - Flip Rate [{feat}]", f"{r['flip_rate']:.4f}")
+        
+        # Threshold trade-off: the curve read at a few standard cutoffs
+        for feat, curve in metrics.get('threshold_curves', {}).items():
+            self.kv(f"Threshold Trade-off [{feat}]", "cutoff: accuracy / SPD / DI")
+            for cutoff in (0.3, 0.4, 0.5, 0.6, 0.7):
+                # Thresholds are descending; the last one >= cutoff selects the same rows as the cutoff
+                at_cutoff = curve[curve['threshold'] >= cutoff]
+                if at_cutoff.empty:
+                    continue
+                row = at_cutoff.iloc[-1]
+                self.kv(f" - {cutoff:.1f}", f"{row['accuracy']:.4f} / {row['statistical_parity_difference']:.4f} / "
+                                            f"{row['disparate_impact']:.4f}")
             
         self.ln(2)
         
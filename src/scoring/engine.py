@@ -2,6 +2,29 @@ import pandas as pd
 import numpy as np
 from src.scoring.ahp import AHPScorer
 
+# Group-fairness gaps averaged into the Fairness score (missing / undefined ones are skipped)
+FAIRNESS_SCORE_METRICS = ['statistical_parity_difference', 'equalized_odds_difference', 'predictive_parity_difference']
+
+def fairness_score(fairness_metrics):
+    """
+    Multi-metric fairness score (0-100).
+    Each available gap is mapped with the same strict linear penalty (|gap| >= 0.2 -> 0,
+    0 -> 100) and the penalties are averaged. With only SPD available this is the
+    original SPD-only score.
+    
+    Args:
+        fairness_metrics (dict): Output from src.ethics.fairness
+        
+    Returns:
+        float: Fairness score in [0, 100].
+    """
+    gaps = [fairness_metrics.get(k) for k in FAIRNESS_SCORE_METRICS]
+    gaps = [abs(g) for g in gaps if g is not None and not np.isnan(g)]
+    if not gaps:
+        # Ideal Statistical Parity Difference is 0; no metric at all scores as maximal bias.
+        gaps = [1.0]
+    return float(np.mean([max(0, 100 - (g * 500)) for g in gaps]))
+
 class EthicsScoringEngine:
     """
     Main engine to calculate the final Ethical Compliance Score.
@@ -12,22 +35,23 @@ class EthicsScoringEngine:
         self.ahp_scorer = ahp_scorer
         self.scores = {}
         
-    def calculate_raw_score(self, fairness_metrics, transparency_metrics):
+    def calculate_raw_score(self, fairness_metrics, transparency_metrics, similarity_metrics=None):
         """
         Normalizes individual module outputs into 0-100 scales.
         
         Args:
             fairness_metrics (dict): Output from src.ethics.fairness
             transparency_metrics (dict): Output from src.ethics.transparency
+            similarity_metrics (dict): Optional output of SimilarityAnalyzer.analyze_all_neighborhoods.
+                                       Adds a 'Similarity' score (used if it is an AHP criterion).
             
         Returns:
             dict: {criterion: raw_score (0-100)}
         """
         # --- Fairness Score Calculation ---
-        # Ideal Statistical Parity Difference is 0. 
-        # We penalize deviation. Let's map |SPD| > 0.2 to 0 score, 0.0 to 100.
-        spd = abs(fairness_metrics.get('statistical_parity_difference', 1.0))
-        fairness_score = max(0, 100 - (spd * 500)) # Simple linear penalty, strict.
+        # Ideal gaps (SPD, equalized odds, predictive parity) are 0.
+        # We penalize deviation. |gap| > 0.2 maps to 0 score, 0.0 to 100.
+        fair_score = fairness_score(fairness_metrics)
         
         # --- Transparency Score Calculation ---
         # If we have SHAP values (not mock), we give high score.
@@ -39,7 +63,8 @@ class EthicsScoringEngine:
             transparency_score = 50.0 # Penalty for not having real explanations
         else:
             # Check if we have meaningful feature importance
-            imp = transparency_metrics.get('global_importance')
+            # generate_explanations reports it as 'feature_importance'
+            imp = transparency_metrics.get('feature_importance', transparency_metrics.get('global_importance'))
             if imp is not None and not imp.empty:
                 transparency_score = 100.0 
             else:
@@ -50,11 +75,18 @@ class EthicsScoringEngine:
         accountability_score = 75.0 # Placeholder
         
         self.scores = {
-            "Fairness": fairness_score,
+            "Fairness": fair_score,
             "Transparency": transparency_score,
             "Privacy": privacy_score,
             "Accountability": accountability_score
         }
+        
+        # --- Similarity (Individual Fairness) ---
+        # Mean neighborhood consistency (1 = similar people always get the same outcome).
+        if similarity_metrics is not None:
+            consistency = similarity_metrics.get('dataset_consistency', 0.0)
+            self.scores["Similarity"] = float(np.clip(100 * np.nan_to_num(consistency), 0, 100))
+            
         return self.scores
 
     def calculate_final_score(self):
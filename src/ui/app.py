@@ -8,16 +8,34 @@ import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
 from src.data.loader import load_german_data
-from src.data.preprocessing import preprocess_data
-from src.ethics.fairness import calculate_fairness_metrics
-from src.ethics.transparency import generate_explanations
-from src.ethics.similarity import SimilarityAnalyzer
+from src.data.preprocessing import preprocess_data, preprocess_csv_streaming, get_feature_families
+from src.ethics.fairness import calculate_multi_fairness_metrics, fairness_threshold_curve
+from src.ethics.intersectional import intersectional_fairness
+from src.ethics.counterfactual import counterfactual_flip_test
+from src.ethics.tree_shap import local_explanations
+from src.ethics.transparency import generate_explanations, partial_dependence_curves, top_raw_features
+from src.ethics.similarity import analyze_pair_discordance
+from src.ethics.index_store import SimilarityIndexStore
+from src.ethics.neighbors import SharedMaskIndex
 from src.scoring.ahp import AHPScorer
 from src.scoring.engine import EthicsScoringEngine
 from src.ui.translations import get_text
+from src.utils.precision import PRECISIONS, feature_dtype, compact_labels
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 
+# Upper bound of the Step 4 distance slider (also the range of the pair index)
+MAX_DISTANCE_THRESHOLD = 5.0
+# Pairs listed in Step 4 when the threshold is too loose for the pair index
+MAX_LISTED_PAIRS = 100_000
+# Discordant pairs per sensitive feature explained with TreeSHAP in Step 6
+MAX_EXPLAINED_PAIRS = 50
+# Neighbors per row in the Step 6 neighborhood consistency score
+NEIGHBORHOOD_SIZE = 10
+# CSV uploads: rows parsed for the preview, and the size above which preprocessing streams to disk
+PREVIEW_ROWS = 1000
+STREAMING_MIN_BYTES = 100 * 1024 * 1024
+
 # Page Config
 st.set_page_config(page_title="AEI: AI Ethics Inspector", page_icon="🕵️", layout="wide")
 
@@ -70,6 +88,9 @@ if st.session_state.step == 1:
     
     ds_options = [get_text(lang, 's1_ds_default'), get_text(lang, 's1_ds_upload')]
     source = st.radio(get_text(lang, 's1_datasource'), ds_options)
+    # float32 halves the memory of the processed matrix and of every later copy of it
+    dtype = feature_dtype(st.radio(get_text(lang, 's1_precision'), list(PRECISIONS), horizontal=True,
+                                   help=get_text(lang, 's1_precision_help')))
     
     if source == ds_options[0]:
         # CASE 1: Default German Credit Data
@@ -81,13 +102,16 @@ if st.session_state.step == 1:
                     st.session_state.y_raw = y
                     
                     # Preprocess & Train
-                    X_proc, y_proc = preprocess_data(df, y)
+                    X_proc, y_proc = preprocess_data(df, y, cache=True, dtype=dtype)
                     st.session_state.X_processed = X_proc
+                    # Fingerprint and shared neighbor index belong to the previous dataset
+                    st.session_state.data_key = None
+                    st.session_state.shared_index = None
                     
                     model = RandomForestClassifier(n_estimators=50, random_state=42)
                     model.fit(X_proc, y_proc)
                     st.session_state.model = model
-                    st.session_state.y_pred = pd.Series(model.predict(X_proc), index=X_proc.index)
+                    st.session_state.y_pred = compact_labels(model.predict(X_proc), index=X_proc.index)
                     
                     st.success(get_text(lang, 's1_success'))
                     next_step()
@@ -101,28 +125,40 @@ if st.session_state.step == 1:
         
         if uploaded_file:
             try:
-                df_temp = pd.read_csv(uploaded_file)
-                st.write("Preview:", df_temp.head(3))
+                # Only a few rows are parsed for the preview and the target selection
+                df_preview = pd.read_csv(uploaded_file, nrows=PREVIEW_ROWS)
+                st.write("Preview:", df_preview.head(3))
                 
-                target_col = st.selectbox(get_text(lang, 's1_target_col'), df_temp.columns)
+                target_col = st.selectbox(get_text(lang, 's1_target_col'), df_preview.columns)
                 
                 if st.button(get_text(lang, 's1_btn_upload')):
                     with st.spinner(get_text(lang, 's1_loading')):
-                        # Split Target
-                        y = df_temp[target_col]
-                        df = df_temp.drop(columns=[target_col])
+                        # Preprocess & Train (Generic): large files are encoded chunk by chunk into a memmap,
+                        # and the raw columns for the sensitive-attribute steps are collected in the same pass
+                        if uploaded_file.size > STREAMING_MIN_BYTES:
+                            X_proc, y_proc, df = preprocess_csv_streaming(uploaded_file, target_col, dtype=dtype,
+                                                                          return_raw=True)
+                            y = y_proc
+                        else:
+                            uploaded_file.seek(0)
+                            df_temp = pd.read_csv(uploaded_file)
+                            
+                            # Split Target
+                            y = df_temp[target_col]
+                            df = df_temp.drop(columns=[target_col])
+                            X_proc, y_proc = preprocess_data(df, y, cache=True, dtype=dtype)
                         
                         st.session_state.df_raw = df
                         st.session_state.y_raw = y
-                        
-                        # Preprocess & Train (Generic)
-                        X_proc, y_proc = preprocess_data(df, y)
                         st.session_state.X_processed = X_proc
+                        # Fingerprint and shared neighbor index belong to the previous dataset
+                        st.session_state.data_key = None
+                        st.session_state.shared_index = None
                         
                         model = RandomForestClassifier(n_estimators=50, random_state=42)
                         model.fit(X_proc, y_proc)
                         st.session_state.model = model
-                        st.session_state.y_pred = pd.Series(model.predict(X_proc), index=X_proc.index)
+                        st.session_state.y_pred = compact_labels(model.predict(X_proc), index=X_proc.index)
                         
                         st.success(get_text(lang, 's1_success'))
                         next_step()
@@ -158,14 +194,31 @@ elif st.session_state.step == 3:
             st.error(get_text(lang, 's3_err'))
         else:
             # Prepare Analyzer
-            analyzer = SimilarityAnalyzer()
-            masked_cols = []
-            for raw_col in selected:
-                if raw_col in st.session_state.X_processed.columns: masked_cols.append(raw_col)
-                pfx = f"{raw_col}_"
-                masked_cols.extend([c for c in st.session_state.X_processed.columns if c.startswith(pfx)])
+            X_processed = st.session_state.X_processed
+            families = get_feature_families(X_processed.columns, selected)
+            masked_cols = [c for cols in families.values() for c in cols]
+            
+            # Same dataset + same mask as an earlier session -> load the fitted index from disk
+            store = SimilarityIndexStore()
+            # Hashing reads the whole matrix: once per dataset, reused for every mask
+            if st.session_state.get('data_key') is None:
+                st.session_state.data_key = store.data_key(X_processed)
+            data_key = st.session_state.data_key
+            analyzer = store.load(store.key(X_processed, masked_cols, data_key=data_key))
             
-            analyzer.train(st.session_state.X_processed, sensitive_columns_masked=masked_cols)
+            if analyzer is None:
+                # One shared neighbor structure serves every mask drawn from the pool (defaults + all
+                # selections so far), so going back and trying other attributes needs no refit.
+                shared = st.session_state.get('shared_index')
+                if shared is None or not set(masked_cols) <= set(shared.maskable_columns):
+                    pool = set(masked_cols)
+                    pool |= {c for cols in get_feature_families(X_processed.columns, defaults).values() for c in cols}
+                    if shared is not None: pool |= set(shared.maskable_columns)
+                    shared = SharedMaskIndex().fit(X_processed, maskable_columns=pool) if len(pool) < X_processed.shape[1] else None
+                    st.session_state.shared_index = shared
+                
+                analyzer = store.load_or_train(X_processed, sensitive_columns_masked=masked_cols, shared_index=shared,
+                                               data_key=data_key)
             st.session_state.analyzer = analyzer
             
             next_step()
@@ -177,7 +230,7 @@ elif st.session_state.step == 4:
     st.write(get_text(lang, 's4_desc'))
     
     # Dynamic Threshold Slider
-    thresh = st.slider(get_text(lang, 's4_thresh_label'), 0.1, 5.0, 1.5, 0.1, help=get_text(lang, 's4_thresh_help'))
+    thresh = st.slider(get_text(lang, 's4_thresh_label'), 0.1, MAX_DISTANCE_THRESHOLD, 1.5, 0.1, help=get_text(lang, 's4_thresh_help'))
     st.session_state.distance_threshold = thresh
     
     # Threshold Guidance
@@ -196,8 +249,24 @@ elif st.session_state.step == 4:
     with st.spinner(get_text(lang, 's4_spinner')):
         if 'similar_pairs' not in st.session_state:
             analyzer = st.session_state.analyzer
-            # User feedback: Dynamic Threshold
-            pairs_df = analyzer.find_all_similar_pairs(n_neighbors=2, distance_threshold=thresh)
+            # The sorted pair index only covers the thresholds used so far: it grows in steps as the
+            # slider moves past its range, afterwards each threshold is a binary search + slice.
+            indexed_max = analyzer.pair_index['max_distance'] if analyzer.pair_index is not None else None
+            if analyzer.ensure_pair_index(thresh):
+                if analyzer.index_key and analyzer.pair_index['max_distance'] != indexed_max:
+                    SimilarityIndexStore().save_pair_index(analyzer)
+                # User feedback: Dynamic Threshold
+                pairs_df = analyzer.query_pair_index(thresh)
+            else:
+                # Too many pairs to index at this threshold: stream them and list the first MAX_LISTED_PAIRS
+                chunks, n_listed = [], 0
+                for chunk in analyzer.iter_similar_pairs(distance_threshold=thresh):
+                    chunks.append(chunk)
+                    n_listed += len(chunk)
+                    if n_listed >= MAX_LISTED_PAIRS:
+                        break
+                pairs_df = pd.concat(chunks, ignore_index=True).head(MAX_LISTED_PAIRS)
+                st.warning(get_text(lang, 's4_truncated').format(MAX_LISTED_PAIRS))
             st.session_state.pairs_df = pairs_df
     
     pairs_df = st.session_state.pairs_df
@@ -244,6 +313,8 @@ elif st.session_state.step == 5:
     st.session_state.ahp_weights = {'Fairness': w_fair, 'Transparency': w_transp, 'Similarity': w_sim}
     
     if st.button(get_text(lang, 's5_next')):
+        # Step 6 computes its results once per visit
+        st.session_state.pop('analysis', None)
         next_step()
         st.rerun()
 
@@ -251,18 +322,128 @@ elif st.session_state.step == 5:
 elif st.session_state.step == 6:
     st.markdown(f'<div class="step-header">{get_text(lang, "s6_title")}</div>', unsafe_allow_html=True)
     
+    sensitive = st.session_state.sensitive_features
+    X_processed = st.session_state.X_processed
+    model = st.session_state.model
+    pairs = st.session_state.pairs_df
+    raw_families = get_feature_families(X_processed.columns, st.session_state.df_raw.columns)
+    
+    # Every widget change reruns the script: the expensive results (bootstrap, threshold and PD curves,
+    # counterfactual scoring, explanations, TreeSHAP, neighborhoods) are computed once on entering the
+    # step and only redrawn after
+    if 'analysis' not in st.session_state:
+        with st.spinner(get_text(lang, 's6_spinner')):
+            analysis = {'fairness_by_feature': {}, 'intersections': None, 'threshold_curves': {}, 'counterfactual': {},
+                        'pd_curves': {}, 'discordance': {}, 'shap_diffs': {}, 'neighborhoods': None}
+            if sensitive:
+                # 1. Fairness (all selected sensitive attributes in one pass)
+                analysis['fairness_by_feature'] = calculate_multi_fairness_metrics(
+                     st.session_state.y_raw, st.session_state.y_pred, st.session_state.df_raw[sensitive],
+                     n_bootstrap=2000
+                )
+                # Intersections of the selected attributes (e.g. sex x age bucket x foreign_worker), worst first
+                if len(sensitive) > 1:
+                    analysis['intersections'] = intersectional_fairness(
+                        st.session_state.y_raw, st.session_state.y_pred, st.session_state.df_raw[sensitive],
+                        min_support=30
+                    )
+                # Fairness / accuracy trade-off over all cutoffs of P(class 1), one curve per attribute
+                if hasattr(model, 'predict_proba') and 1 in list(model.classes_):
+                    scores = model.predict_proba(X_processed)[:, list(model.classes_).index(1)]
+                    analysis['threshold_curves'] = {
+                        feat: fairness_threshold_curve(st.session_state.y_raw, scores, st.session_state.df_raw[feat])
+                        for feat in sensitive
+                    }
+                # Counterfactual flip test: change only the sensitive attribute and re-score
+                analysis['counterfactual'] = counterfactual_flip_test(
+                    model, X_processed, get_feature_families(X_processed.columns, sensitive)
+                )
+                # Dataset-level individual fairness: outcome consistency of every row's NEIGHBORHOOD_SIZE nearest neighbors
+                analysis['neighborhoods'] = st.session_state.analyzer.neighborhood_consistency(
+                    st.session_state.y_pred, st.session_state.df_raw[sensitive[0]],
+                    n_neighbors=NEIGHBORHOOD_SIZE
+                )
+            
+            # 2. Transparency
+            # Models without native importances get permutation importance (one-hot families permuted together)
+            analysis['transparency'] = generate_explanations(model, X_processed[:500], families=raw_families)
+            # Partial dependence (+ ICE for a few individual rows) of the most important raw features
+            if 'feature_importance' in analysis['transparency'] and 1 in list(getattr(model, 'classes_', [])):
+                top_raw = top_raw_features(analysis['transparency']['feature_importance'], raw_families, k=5)
+                analysis['pd_curves'] = partial_dependence_curves(
+                    model, X_processed, {f: raw_families[f] for f in top_raw}, n_ice=20
+                )
+            
+            # 3. Pairwise similarity bias: one vectorized pass over all pairs and all sensitive features
+            if not pairs.empty and sensitive:
+                analysis['discordance'] = analyze_pair_discordance(
+                    pairs['Person A'].to_numpy(), pairs['Person B'].to_numpy(),
+                    st.session_state.y_pred, st.session_state.df_raw[sensitive],
+                    distances=pairs['Distance'].to_numpy(), pair_ids=pairs.index.to_numpy()
+                )
+                # Local TreeSHAP attributions (class 1) of both people in the discordant pairs
+                if hasattr(model, 'estimators_') and 1 in list(model.classes_):
+                    for sens_feat, result in analysis['discordance'].items():
+                        if result['details'].empty:
+                            continue
+                        shown = pairs.loc[result['details']['Pair ID'].head(MAX_EXPLAINED_PAIRS)]
+                        rows = np.unique(np.r_[shown['Person A'].to_numpy(), shown['Person B'].to_numpy()])
+                        local = local_explanations(model, X_processed, rows, class_label=1, families=raw_families)
+                        diff = local.loc[shown['Person A'].to_numpy()].to_numpy() - local.loc[shown['Person B'].to_numpy()].to_numpy()
+                        analysis['shap_diffs'][sens_feat] = pd.DataFrame(diff, index=shown.index, columns=local.columns)
+            st.session_state.analysis = analysis
+    analysis = st.session_state.analysis
+    
     # 1. Fairness
-    if st.session_state.sensitive_features:
-        sens_col = st.session_state.sensitive_features[0]
-        sens_data = st.session_state.df_raw[sens_col]
-        fairness_metrics = calculate_fairness_metrics(
-             st.session_state.y_raw, st.session_state.y_pred, sens_data, unique_privileged_group='Male' 
-        )
+    fairness_by_feature = analysis['fairness_by_feature']
+    counterfactual = analysis['counterfactual']
+    threshold_curves = analysis['threshold_curves']
+    if fairness_by_feature:
+        # Headline metrics = the attribute with the largest disparity
+        worst_feat = max(fairness_by_feature, key=lambda f: abs(fairness_by_feature[f]['statistical_parity_difference']))
+        fairness_metrics = fairness_by_feature[worst_feat]
+        
+        st.subheader(get_text(lang, 's6_fair_header'))
+        st.dataframe(pd.DataFrame({
+            feat: {
+                'SPD': m['statistical_parity_difference'],
+                'SPD 95% CI': "[{:.3f}, {:.3f}]".format(*m['statistical_parity_difference_ci']),
+                'Disparate Impact': m['disparate_impact'],
+                'DI 95% CI': "[{:.3f}, {:.3f}]".format(*m['disparate_impact_ci']),
+                'Equalized Odds': m['equalized_odds_difference'],
+                'Predictive Parity': m['predictive_parity_difference'],
+                **{f"FPR [{g}]": v for g, v in m['group_false_positive_rates'].items()},
+                **{f"FNR [{g}]": v for g, v in m['group_false_negative_rates'].items()},
+                **{f"SR [{g}]": v for g, v in m['group_selection_rates'].items()}
+            } for feat, m in fairness_by_feature.items()
+        }).T)
+        
+        if analysis['intersections'] is not None:
+            st.write(get_text(lang, 's6_inter_desc'))
+            inter_df = analysis['intersections']
+            st.dataframe(inter_df[inter_df['order'] > 1].head(10))
+        
+        # Fairness / accuracy trade-off: the selectbox only picks one of the precomputed curves
+        if threshold_curves:
+            st.write(get_text(lang, 's6_curve_desc'))
+            curve_feat = st.selectbox(get_text(lang, 's6_curve_feat'), list(threshold_curves))
+            st.line_chart(threshold_curves[curve_feat].set_index('threshold')[
+                ['accuracy', 'statistical_parity_difference', 'disparate_impact']
+            ])
+        
+        st.write(get_text(lang, 's6_cf_desc'))
+        st.dataframe(pd.DataFrame({
+            feat: {
+                'Flip Rate': r['flip_rate'],
+                'Mean Max Probability Shift': r['mean_max_proba_shift'],
+                **{f"Flip Rate [{lv}]": v for lv, v in r['level_flip_rates'].items()}
+            } for feat, r in counterfactual.items()
+        }).T)
     else:
         fairness_metrics = {'statistical_parity_difference': 0, 'disparate_impact': 1}
 
     # 2. Transparency
-    transp_metrics = generate_explanations(st.session_state.model, st.session_state.X_processed[:50])
+    transp_metrics = analysis['transparency']
     
     # VISUALIZE TRANSPARENCY
     if 'feature_importance' in transp_metrics:
@@ -272,50 +453,36 @@ elif st.session_state.step == 6:
         fi_df = transp_metrics['feature_importance']
         # Take Top 10 for clarity
         top_fi = fi_df.head(10).set_index('feature')
-        st.bar_chart(top_fi)
+        st.bar_chart(top_fi[['importance']])
+        
+        # Partial dependence: the selectbox only picks one of the precomputed curves
+        pd_curves = analysis['pd_curves']
+        if pd_curves:
+            st.write(get_text(lang, 's6_pd_desc'))
+            pd_feat = st.selectbox(get_text(lang, 's6_pd_feat'), list(pd_curves))
+            curve = pd_curves[pd_feat]
+            if curve['kind'] == 'numeric':
+                chart = pd.DataFrame(curve['ice'].T, index=curve['grid']).add_prefix('ICE ')
+                chart.insert(0, 'PD', curve['pd'])
+                st.line_chart(chart)
+            else:
+                st.bar_chart(pd.Series(curve['pd'], index=curve['grid'], name='PD'))
 
     # 3. Pairwise Similarity Bias
-    pairs = st.session_state.pairs_df
     sim_bias_detected = False
     
-    if not pairs.empty and st.session_state.sensitive_features:
+    if analysis['discordance']:
         st.subheader(get_text(lang, 's6_bias_header'))
         st.write(get_text(lang, 's6_bias_desc').format(len(pairs)))
         
         feature_scores = []
         
-        for sens_feat in st.session_state.sensitive_features:
+        for sens_feat in sensitive:
             with st.expander(get_text(lang, 's6_expand_title').format(sens_feat), expanded=True):
-                discordant_counts = {'Same Group': 0, 'Different Group': 0}
-                total_counts = {'Same Group': 0, 'Different Group': 0}
-                discordant_pairs_detail = [] # Store details
-                
-                for idx, row in pairs.iterrows():
-                    p1, p2 = int(row['Person A']), int(row['Person B'])
-                    
-                    v1 = st.session_state.df_raw.iloc[p1][sens_feat]
-                    v2 = st.session_state.df_raw.iloc[p2][sens_feat]
-                    is_same_group = (v1 == v2)
-                    
-                    out1 = st.session_state.y_pred.iloc[p1]
-                    out2 = st.session_state.y_pred.iloc[p2]
-                    is_discordant = (out1 != out2)
-                    
-                    key = 'Same Group' if is_same_group else 'Different Group'
-                    total_counts[key] += 1
-                    if is_discordant:
-                        discordant_counts[key] += 1
-                        if not is_same_group:
-                            # Capture detail
-                             discordant_pairs_detail.append({
-                                 'Pair ID': idx,
-                                 f'{sens_feat}_A': v1, f'{sens_feat}_B': v2,
-                                 'Outcome_A': out1, 'Outcome_B': out2,
-                                 'Dist': row['Distance']
-                             })
-                        
-                rate_same = (discordant_counts['Same Group'] / total_counts['Same Group']) if total_counts['Same Group'] > 0 else 0
-                rate_diff = (discordant_counts['Different Group'] / total_counts['Different Group']) if total_counts['Different Group'] > 0 else 0
+                result = analysis['discordance'][sens_feat]
+                rate_same, rate_diff = result['rate_same'], result['rate_diff']
+                total_counts = {'Same Group': result['total_same'], 'Different Group': result['total_diff']}
+                discordant_pairs_detail = result['details']
                 
                 feat_score = 100 * (1.0 - rate_diff)
                 feature_scores.append(feat_score)
@@ -333,20 +500,33 @@ elif st.session_state.step == 6:
                     c3.metric(get_text(lang, 's6_bias_sev'), get_text(lang, 's6_low'))
                 
                 # Show Drilldown View
-                if discordant_pairs_detail:
+                if not discordant_pairs_detail.empty:
                     st.markdown(f"**{get_text(lang, 's6_show_details')}**")
-                    st.dataframe(pd.DataFrame(discordant_pairs_detail))
+                    st.dataframe(discordant_pairs_detail)
+                    
+                    if sens_feat in analysis['shap_diffs']:
+                        st.write(get_text(lang, 's6_shap_desc'))
+                        st.dataframe(analysis['shap_diffs'][sens_feat])
 
         sim_score = sum(feature_scores) / len(feature_scores) if feature_scores else 100
             
     else:
         sim_score = 100
         st.warning(get_text(lang, 's6_warn_nopairs'))
+    
+    neighborhoods = analysis['neighborhoods']
+    if neighborhoods is not None:
+        st.metric(get_text(lang, 's6_consistency'), f"{neighborhoods['dataset_consistency']:.3f}",
+                  help=get_text(lang, 's6_consistency_help'))
         
     st.session_state.metrics = {
         'fairness': fairness_metrics,
+        'fairness_by_feature': fairness_by_feature,
+        'threshold_curves': threshold_curves,
+        'counterfactual': counterfactual,
         'transparency': transp_metrics,
         'similarity_score': sim_score,
+        'neighborhoods': neighborhoods,
         'sim_bias_detected': sim_bias_detected
     }
     
@@ -364,9 +544,16 @@ elif st.session_state.step == 7:
     weights = st.session_state.ahp_weights
     total_w = sum(weights.values())
     
-    s_fair = max(0, 100 - abs(metrics['fairness'].get('statistical_parity_difference',0)*500))
-    s_transp = 50 if metrics['transparency'].get('is_mock') else 100
+    # Fairness, Transparency and neighborhood consistency come from the scoring engine;
+    # Similarity averages the pair-discordance score with the consistency score.
+    raw_scores = EthicsScoringEngine(AHPScorer(list(weights))).calculate_raw_score(
+        metrics['fairness'], metrics['transparency'], similarity_metrics=metrics.get('neighborhoods')
+    )
+    s_fair = raw_scores['Fairness']
+    s_transp = raw_scores['Transparency']
     s_sim = metrics['similarity_score']
+    if 'Similarity' in raw_scores:
+        s_sim = (s_sim + raw_scores['Similarity']) / 2
     
     final_raw = (s_fair * weights['Fairness'] + s_transp * weights['Transparency'] + s_sim * weights['Similarity']) / total_w
     final_5 = 1 + (final_raw / 25)
@@ -409,7 +596,7 @@ elif st.session_state.step == 7:
     
     report_pdf = EthicsReportPDF(lang=lang)
     pdf_bytes = report_pdf.generate(
-        metrics=metrics, 
+        metrics={**metrics, 'similarity_score': s_sim}, 
         weights=weights, 
         final_score=final_5, 
         config={'sensitive_features': st.session_state.sensitive_features}
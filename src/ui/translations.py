@@ -21,6 +21,8 @@ TRANSLATIONS = {
         's1_upload_label': "Upload CSV File",
         's1_target_col': "Target Column (Label)",
         's1_btn_upload': "Process & Train",
+        's1_precision': "Feature Precision",
+        's1_precision_help': "float32 halves the memory of the processed data and speeds up similarity search; float64 is the exact default.",
         
         # Step 2
         's2_title': "Step 2: Data Inspection",
@@ -46,6 +48,7 @@ TRANSLATIONS = {
         's4_recalc': "🔄 Apply Threshold & Search",
         's4_spinner': "Finding twins...",
         's4_found': "Identical Pairs Found",
+        's4_truncated': "Too many pairs at this threshold to index; showing the first {:,} pairs. Lower the threshold for the full list.",
         's4_inspect': "### Inspect a Pair",
         's4_select_pair': "Select a Pair to Inspect:",
         's4_discordant': "🚨 Discordant Outcome! These twins got different results.",
@@ -62,9 +65,17 @@ TRANSLATIONS = {
 
         # Step 6
         's6_title': "Step 6: Analysis Results",
+        's6_spinner': "Running the analysis...",
         's6_bias_header': "👥 Neighborhood Bias Analysis",
+        's6_fair_header': "⚖️ Fairness Analysis (All Sensitive Attributes)",
+        's6_inter_desc': "Worst-treated intersections of the selected attributes (groups with at least 30 people):",
+        's6_curve_desc': "Fairness / accuracy trade-off across all decision thresholds (probability of class 1):",
+        's6_curve_feat': "Sensitive attribute for the trade-off curve",
+        's6_cf_desc': "Counterfactual test: share of decisions that change when only the sensitive attribute is changed:",
         's6_transp_header': "🔍 Transparency Analysis (Feature Importance)",
         's6_transp_desc': "Factors that most influence the model's decisions:",
+        's6_pd_desc': "Partial dependence: average predicted probability of class 1 as one feature changes (thin lines: individual people, ICE):",
+        's6_pd_feat': "Feature for the partial dependence plot",
         's6_bias_desc': "Analyzing {} similar pairs across all selected sensitive features.",
         's6_expand_title': "Analysis: {}",
         's6_same_group': "Same Group Inconsistency",
@@ -76,7 +87,10 @@ TRANSLATIONS = {
         's6_err_bias': "⚠️ **Bias Detected for {}!** People with different {} are significantly more likely to get different results.",
         's6_success_bias': "✅ No significant discrimination found based on {}.",
         's6_warn_nopairs': "Not enough pairs or sensitive features for Pairwise Analysis.",
+        's6_consistency': "Neighborhood Consistency",
+        's6_consistency_help': "Mean over all people of 1 - std of the predictions among their nearest neighbors (sensitive features masked). 1.0 means similar people always get the same outcome.",
         's6_show_details': "🔍 Show Discordant Pairs (Diff Group)",
+        's6_shap_desc': "Why the outcomes differ: TreeSHAP contribution of each feature, Person A minus Person B (probability of class 1):",
         's6_calculated': "Scores Calculated.",
         's6_next': "Generate Final Report ➡️",
 
@@ -117,6 +131,8 @@ TRANSLATIONS = {
         's1_upload_label': "CSV Dosyası Yükle",
         's1_target_col': "Hedef Sütun (Tahmin Edilecek Değer)",
         's1_btn_upload': "Veriyi İşle ve Eğit",
+        's1_precision': "Özellik Hassasiyeti",
+        's1_precision_help': "float32 işlenmiş verinin bellek kullanımını yarıya indirir ve benzerlik aramasını hızlandırır; float64 tam hassasiyetli varsayılandır.",
         
         # Step 2
         's2_title': "Adım 2: Veri İnceleme",
@@ -142,6 +158,7 @@ TRANSLATIONS = {
         's4_recalc': "🔄 Eşiği Uygula ve Tekrar Ara",
         's4_spinner': "İkizler bulunuyor...",
         's4_found': "Bulunan Benzer Çiftler",
+        's4_truncated': "Bu eşikte indekslenemeyecek kadar çok çift var; ilk {:,} çift gösteriliyor. Tam liste için eşiği düşürün.",
         's4_inspect': "### Bir Çifti İncele",
         's4_select_pair': "İncelenecek Çifti Seçin:",
         's4_discordant': "🚨 Uyumsuz Sonuç! Bu ikizler farklı sonuçlar aldı.",
@@ -158,9 +175,17 @@ TRANSLATIONS = {
 
         # Step 6
         's6_title': "Adım 6: Analiz Sonuçları",
+        's6_spinner': "Analiz yapılıyor...",
         's6_bias_header': "👥 Komşuluk Yanlılık Analizi",
+        's6_fair_header': "⚖️ Adillik Analizi (Tüm Hassas Özellikler)",
+        's6_inter_desc': "Seçilen özelliklerin en olumsuz etkilenen kesişimleri (en az 30 kişilik gruplar):",
+        's6_curve_desc': "Tüm karar eşikleri boyunca adillik / doğruluk dengesi (sınıf 1 olasılığı):",
+        's6_curve_feat': "Denge eğrisi için hassas özellik",
+        's6_cf_desc': "Karşı olgusal test: yalnızca hassas özellik değiştirildiğinde değişen kararların oranı:",
         's6_transp_header': "🔍 Şeffaflık Analizi (Özellik Önemi)",
         's6_transp_desc': "Modelin kararlarını en çok etkileyen faktörler aşağıdadır:",
+        's6_pd_desc': "Kısmi bağımlılık: bir özellik değiştikçe ortalama sınıf 1 olasılığı (ince çizgiler: bireyler, ICE):",
+        's6_pd_feat': "Kısmi bağımlılık grafiği için özellik",
         's6_bias_desc': "Seçilen tüm hassas özellikler üzerinden {} benzer çift analiz ediliyor.",
         's6_expand_title': "Analiz: {}",
         's6_same_group': "Aynı Grup Tutarsızlığı",
@@ -172,7 +197,10 @@ TRANSLATIONS = {
         's6_err_bias': "⚠️ **{} için Yanlılık Tespit Edildi!** Farklı {} değerine sahip kişilerin farklı sonuç alma olasılığı önemli ölçüde daha yüksek.",
         's6_success_bias': "✅ {} bazında önemli bir ayrımcılık bulunamadı.",
         's6_warn_nopairs': "İkili Analiz için yeterli çift veya hassas özellik yok.",
+        's6_consistency': "Komşuluk Tutarlılığı",
+        's6_consistency_help': "Tüm kişiler üzerinden, en yakın komşularındaki tahminlerin 1 - standart sapmasının ortalaması (hassas özellikler maskelenmiş). 1.0, benzer kişilerin her zaman aynı sonucu aldığı anlamına gelir.",
         's6_show_details': "🔍 Uyumsuz Çiftleri Göster (Farklı Grup)",
+        's6_shap_desc': "Sonuçlar neden farklı: her özelliğin TreeSHAP katkısı, Kişi A eksi Kişi B (sınıf 1 olasılığı):",
         's6_calculated': "Skorlar Hesaplandı.",
         's6_next': "Nihai Raporu Oluştur ➡️",
 
@@ -0,0 +1,41 @@
+import os
+import hashlib
+import pandas as pd
+
+CACHE_DIR_ENV = 'AEI_CACHE_DIR'
+
+def get_cache_dir(*subdirs):
+    """
+    Returns (and creates) a directory inside the AEI cache.
+    The cache root is $AEI_CACHE_DIR if set, otherwise ~/.cache/aei.
+    
+    Args:
+        *subdirs (str): Path components below the cache root.
+        
+    Returns:
+        str: Absolute path of the directory.
+    """
+    root = os.environ.get(CACHE_DIR_ENV) or os.path.join(os.path.expanduser('~'), '.cache', 'aei')
+    path = os.path.join(root, *subdirs)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def fingerprint_frame(df, *extra):
+    """
+    Content fingerprint of a DataFrame: values, column names and dtypes,
+    plus any extra key parts (e.g. a masked column list).
+    
+    Args:
+        df (pd.DataFrame): Frame to fingerprint. The index is ignored.
+        *extra: Additional values folded into the key via repr().
+        
+    Returns:
+        str: 32 character hex digest.
+    """
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    digest.update(repr([str(c) for c in df.columns]).encode())
+    digest.update(repr([str(t) for t in df.dtypes]).encode())
+    for part in extra:
+        digest.update(repr(part).encode())
+    return digest.hexdigest()[:32]
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse as sp
+
+# Feature precision of the pipeline: 'float32' halves the memory of the processed
+# matrix, the masked similarity matrix and every batch built from them.
+PRECISIONS = {
+    'float64': np.float64,
+    'float32': np.float32
+}
+
+def feature_dtype(precision):
+    """
+    Resolves a precision name (or dtype) to the numpy feature dtype.
+
+    Args:
+        precision (str / np.dtype): 'float64', 'float32' or a float dtype.
+
+    Returns:
+        type: np.float64 or np.float32.
+    """
+    name = np.dtype(precision).name if not isinstance(precision, str) else precision
+    if name not in PRECISIONS:
+        raise ValueError(f"Unknown precision: {precision}. Use one of {list(PRECISIONS)}.")
+    return PRECISIONS[name]
+
+def float_dtype(X):
+    """
+    Working float dtype for computations on X: float32 if X is already float32
+    (dense or sparse), float64 otherwise. Keeps float32 runs from being upcast.
+    """
+    if sp.issparse(X) or isinstance(X, np.ndarray):
+        dtypes = [X.dtype]
+    elif isinstance(X, pd.DataFrame):
+        dtypes = list(X.dtypes)
+    else:
+        dtypes = [np.asarray(X).dtype]
+    return np.float32 if dtypes and all(t == np.float32 for t in dtypes) else np.float64
+
+def smallest_int_dtype(low, high):
+    """Smallest signed integer dtype holding every value in [low, high]."""
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    return np.int64
+
+def compact_labels(values, index=None):
+    """
+    Stores labels (e.g. model predictions) in the smallest integer type.
+    Non-integer labels (strings, floats) are returned unchanged.
+
+    Args:
+        values (array-like): Labels.
+        index (pd.Index): Optional index of the returned Series.
+
+    Returns:
+        pd.Series: The labels, as int8/int16/int32 where possible.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind in 'iub' and len(values):
+        values = values.astype(smallest_int_dtype(values.min(), values.max()), copy=False)
+    return pd.Series(values, index=index)
@@ -0,0 +1,76 @@
+import pytest
+import pandas as pd
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from src.data.preprocessing import get_feature_families
+from src.ethics.counterfactual import counterfactual_flip_test
+
+def _make_data(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame({
+        'income': rng.normal(size=n),
+        'age': rng.normal(size=n),
+        'sex_male': 0.0,
+        'sex_female': 0.0
+    })
+    male = rng.random(n) < 0.5
+    X.loc[male, 'sex_male'] = 1.0
+    X.loc[~male, 'sex_female'] = 1.0
+    return X, rng
+
+def test_flip_rates_match_row_by_row():
+    """Stacked, batched scoring gives the same flips as perturbing one row at a time."""
+    X, rng = _make_data()
+    y = ((X['income'] + 0.8 * X['sex_male'] + 0.3 * X['age'] + rng.normal(scale=0.3, size=len(X))) > 0.5).astype(int)
+    model = RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y)
+    families = get_feature_families(X.columns, ['sex', 'age'])
+    
+    result = counterfactual_flip_test(model, X, families, max_batch_rows=64)
+    full = counterfactual_flip_test(model, X, families)
+    assert np.array_equal(result['sex']['flipped_rows'], full['sex']['flipped_rows'])
+    
+    # Reference: flip sex one row at a time
+    base = model.predict(X)
+    expected = []
+    for i in range(len(X)):
+        row = X.iloc[[i]].copy()
+        row[['sex_male', 'sex_female']] = row[['sex_female', 'sex_male']].to_numpy()
+        expected.append(model.predict(row)[0] != base[i])
+    assert result['sex']['flip_rate'] == pytest.approx(np.mean(expected))
+    assert np.array_equal(result['sex']['flipped_rows'], np.flatnonzero(expected))
+    
+    assert set(result['sex']['level_flip_rates']) == {'male', 'female'}
+    assert set(result['age']['level_flip_rates']) == {'q10', 'q25', 'q50', 'q75', 'q90'}
+
+def test_model_ignoring_attribute_never_flips():
+    """A model that does not use the sensitive columns has a zero flip rate."""
+    X, rng = _make_data(seed=1)
+    y = (X['income'] > 0).astype(int)
+    model = LogisticRegression().fit(X, y)
+    model.coef_[:, 1:] = 0.0  # age, sex_male, sex_female
+    
+    result = counterfactual_flip_test(model, X, get_feature_families(X.columns, ['sex']))
+    assert result['sex']['flip_rate'] == 0.0
+    assert result['sex']['mean_max_proba_shift'] == pytest.approx(0.0)
+
+def test_sparse_matrix_matches_dense():
+    """A CSR matrix, densified one block of rows at a time, gives the same flips as the DataFrame."""
+    from scipy import sparse as sp
+    from src.data.preprocessing import with_columns
+    
+    X, rng = _make_data(seed=2)
+    y = ((X['income'] + 0.8 * X['sex_male'] + 0.3 * X['age']) > 0.5).astype(int)
+    X_sparse = with_columns(sp.csr_matrix(X.to_numpy()), X.columns)
+    model = RandomForestClassifier(n_estimators=10, random_state=0).fit(X_sparse, y)
+    families = get_feature_families(X.columns, ['sex', 'age'])
+    
+    result = counterfactual_flip_test(model, X_sparse, families, max_batch_rows=64)
+    
+    # Reference: flip sex on the dense array
+    X_arr = X.to_numpy()
+    flipped = X_arr.copy()
+    flipped[:, [2, 3]] = X_arr[:, [3, 2]]
+    expected = model.predict(flipped) != model.predict(X_arr)
+    assert np.array_equal(result['sex']['flipped_rows'], np.flatnonzero(expected))
+    assert set(result['age']['level_flip_rates']) == {'q10', 'q25', 'q50', 'q75', 'q90'}
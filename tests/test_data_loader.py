@@ -1,5 +1,6 @@
 import pytest
 import pandas as pd
+import numpy as np
 from src.data.loader import load_german_data
 
 def test_load_german_data_returns_dataframe():
@@ -29,3 +30,55 @@ def test_target_values():
     # German credit data target is usually 1 (Good) and 2 (Bad)
     assert 1 in unique_values
     assert 2 in unique_values
+
+def _write_uci_file(path, n=30, seed=0):
+    """Writes a small file in the original whitespace-separated 'german.data' layout."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for _ in range(n):
+        cats = [f"A{rng.integers(11, 15)}", str(rng.integers(6, 48)), f"A{rng.integers(30, 35)}", f"A{rng.integers(40, 44)}",
+                str(rng.integers(500, 9000)), f"A{rng.integers(61, 65)}", f"A{rng.integers(71, 75)}", str(rng.integers(1, 5)),
+                f"A{rng.integers(91, 95)}", f"A{rng.integers(101, 104)}", str(rng.integers(1, 5)), f"A{rng.integers(121, 125)}",
+                str(rng.integers(19, 75)), f"A{rng.integers(141, 144)}", f"A{rng.integers(151, 154)}", str(rng.integers(1, 4)),
+                f"A{rng.integers(171, 175)}", str(rng.integers(1, 3)), f"A{rng.integers(191, 193)}", f"A{rng.integers(201, 203)}",
+                str(rng.integers(1, 3))]
+        rows.append(" ".join(cats))
+    path.write_text("\n".join(rows) + "\n")
+
+def test_offline_cache_seed_and_load(tmp_path, monkeypatch):
+    """A seeded cache is loaded offline with the same values and dtypes; a missing cache fails fast offline."""
+    from src.data.loader import seed_german_cache
+    
+    monkeypatch.setenv('AEI_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setenv('AEI_OFFLINE', '1')
+    
+    with pytest.raises(RuntimeError, match="offline"):
+        load_german_data()
+    
+    data_file = tmp_path / 'german.data'
+    _write_uci_file(data_file)
+    X_seed, y_seed = seed_german_cache(str(data_file))
+    
+    X, y = load_german_data()
+    assert 'personal_status_sex' in X.columns and len(X) == 30
+    # Numeric columns come back memory-mapped; compare values on an in-memory copy
+    pd.testing.assert_frame_equal(X.copy(), X_seed)
+    pd.testing.assert_frame_equal(y.copy(), y_seed)
+    assert X['age'].dtype == np.int64 and X['purpose'].dtype == X_seed['purpose'].dtype
+
+def test_cache_version_mismatch_is_ignored(tmp_path, monkeypatch):
+    """A cache written by another layout version is not used."""
+    import json
+    from src.data import loader
+    
+    monkeypatch.setenv('AEI_CACHE_DIR', str(tmp_path))
+    df = pd.DataFrame({'a': [1, 2], 'b': ['x', 'y']})
+    cache_dir = str(tmp_path / 'frames')
+    loader.save_columnar_cache({'X': df}, cache_dir)
+    pd.testing.assert_frame_equal(loader.load_columnar_cache(cache_dir)['X'].copy(), df)
+    
+    manifest = tmp_path / 'frames' / 'manifest.json'
+    meta = json.loads(manifest.read_text())
+    meta['version'] = loader.DATASET_CACHE_VERSION + 1
+    manifest.write_text(json.dumps(meta))
+    assert loader.load_columnar_cache(cache_dir) is None
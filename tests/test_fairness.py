@@ -1,7 +1,7 @@
 import pytest
 import pandas as pd
 import numpy as np
-from src.ethics.fairness import calculate_fairness_metrics
+from src.ethics.fairness import calculate_fairness_metrics, StreamingFairnessAccumulator
 
 def test_fairness_metrics_structure():
     """Test if the function returns a dictionary with expected keys."""
@@ -42,3 +42,187 @@ def test_extreme_bias():
     # Group B selection rate = 0.0
     # Stat Parity Diff = 0.0 - 1.0 = -1.0 (or 1.0 depending on direction)
     assert abs(metrics['statistical_parity_difference']) > 0.9
+
+def test_multi_fairness_matches_fairlearn():
+    """The single-pass engine reproduces the fairlearn-based metrics for every attribute."""
+    from src.ethics.fairness import calculate_multi_fairness_metrics
+    
+    rng = np.random.default_rng(0)
+    n = 500
+    y_true = pd.Series(rng.choice([1, 2], n))
+    y_pred = pd.Series(rng.choice([1, 2], n, p=[0.7, 0.3]))
+    sensitive = pd.DataFrame({
+        'sex': rng.choice(['Male', 'Female'], n),
+        'age_band': rng.choice(['<25', '25-40', '40+'], n),
+        'foreign': rng.choice(['yes', 'no'], n, p=[0.9, 0.1])
+    })
+    
+    multi = calculate_multi_fairness_metrics(y_true, y_pred, sensitive)
+    
+    for col in sensitive.columns:
+        reference = calculate_fairness_metrics(y_true, y_pred, sensitive[col], unique_privileged_group=None)
+        for key, value in reference.items():
+            assert multi[col][key] == pytest.approx(value), (col, key)
+        assert set(multi[col]['group_selection_rates']) == set(sensitive[col])
+
+def test_bootstrap_intervals_cover_point_estimate():
+    """Bootstrap CIs are attached to the metrics dict and bracket the point estimates."""
+    rng = np.random.default_rng(1)
+    n = 2000
+    y_true = pd.Series(rng.integers(0, 2, n))
+    sensitive = pd.Series(rng.choice(['A', 'B'], n))
+    y_pred = pd.Series((rng.random(n) < np.where(sensitive == 'A', 0.6, 0.4)).astype(int))
+    
+    metrics = calculate_fairness_metrics(y_true, y_pred, sensitive, unique_privileged_group='A', n_bootstrap=500)
+    
+    lo, hi = metrics['statistical_parity_difference_ci']
+    assert lo < metrics['statistical_parity_difference'] < hi
+    assert hi - lo < 0.15
+    lo, hi = metrics['disparate_impact_ci']
+    assert lo < metrics['disparate_impact'] < hi
+    lo, hi = metrics['accuracy_ci']
+    assert lo < metrics['accuracy'] < hi
+
+def test_bootstrap_is_reproducible_and_widens_for_small_groups():
+    from src.ethics.fairness import bootstrap_fairness_intervals
+    
+    rng = np.random.default_rng(2)
+    n = 1000
+    y_true = pd.Series(rng.integers(0, 2, n))
+    y_pred = pd.Series(rng.integers(0, 2, n))
+    balanced = pd.Series(rng.choice(['A', 'B'], n))
+    tiny_group = pd.Series(np.where(np.arange(n) < 20, 'B', 'A'))
+    
+    a = bootstrap_fairness_intervals(y_true, y_pred, balanced, n_bootstrap=300, random_state=7)
+    b = bootstrap_fairness_intervals(y_true, y_pred, balanced, n_bootstrap=300, random_state=7)
+    assert a == b
+    
+    small = bootstrap_fairness_intervals(y_true, y_pred, tiny_group, n_bootstrap=300)
+    width = lambda ci: ci[1] - ci[0]
+    assert width(small['statistical_parity_difference_ci']) > width(a['statistical_parity_difference_ci'])
+
+def _random_log(n, seed):
+    rng = np.random.default_rng(seed)
+    sens = rng.choice(['A', 'B', 'C'], size=n)
+    y_true = rng.integers(0, 2, size=n)
+    y_pred = np.where(sens == 'A', rng.random(n) < 0.7, rng.random(n) < 0.4).astype(int)
+    return y_true, y_pred, sens
+
+def test_streaming_accumulator_matches_batch_metrics():
+    """Running totals over mini-batches equal the one-shot metrics on all rows."""
+    y_true, y_pred, sens = _random_log(3000, seed=0)
+    
+    acc = StreamingFairnessAccumulator()
+    for start in range(0, 3000, 250):
+        acc.update(y_true[start:start + 250], y_pred[start:start + 250], sens[start:start + 250])
+    
+    streamed = acc.metrics()
+    batch = calculate_fairness_metrics(pd.Series(y_true), pd.Series(y_pred), pd.Series(sens), unique_privileged_group='A')
+    for key in ['accuracy', 'selection_rate', 'statistical_parity_difference', 'disparate_impact']:
+        assert streamed[key] == pytest.approx(batch[key])
+    assert streamed['n_samples'] == 3000
+
+def test_streaming_accumulator_windows():
+    """Sliding windows cover the last batches; tumbling windows reset and keep the last one."""
+    y_true, y_pred, sens = _random_log(1000, seed=1)
+    batches = [(y_true[i:i + 100], y_pred[i:i + 100], sens[i:i + 100]) for i in range(0, 1000, 100)]
+    
+    sliding = StreamingFairnessAccumulator(window=3, mode='sliding')
+    tumbling = StreamingFairnessAccumulator(window=4, mode='tumbling')
+    for b in batches:
+        sliding.update(*b)
+        tumbling.update(*b)
+    
+    expected = StreamingFairnessAccumulator()
+    for b in batches[-3:]:
+        expected.update(*b)
+    for key in ['accuracy', 'statistical_parity_difference', 'disparate_impact', 'n_samples']:
+        assert sliding.metrics('window')[key] == pytest.approx(expected.metrics()[key])
+    
+    # 10 batches with window 4: last completed window is batches 4..7, current holds 8..9
+    last = StreamingFairnessAccumulator()
+    for b in batches[4:8]:
+        last.update(*b)
+    assert tumbling.metrics('last_window')['statistical_parity_difference'] == pytest.approx(
+        last.metrics()['statistical_parity_difference'])
+    assert tumbling.metrics('window')['n_samples'] == 200
+
+def test_streaming_accumulator_merge():
+    """Merging worker states equals one accumulator over all batches, even with disjoint groups."""
+    y_true, y_pred, sens = _random_log(2000, seed=2)
+    sens = sens.copy()
+    sens[1000:][sens[1000:] == 'C'] = 'D'  # a group only the second worker sees
+    
+    full = StreamingFairnessAccumulator()
+    left, right = StreamingFairnessAccumulator(), StreamingFairnessAccumulator()
+    for start in range(0, 2000, 200):
+        batch = (y_true[start:start + 200], y_pred[start:start + 200], sens[start:start + 200])
+        full.update(*batch)
+        (left if start < 1000 else right).update(*batch)
+    
+    merged = left.merge(right).metrics()
+    expected = full.metrics()
+    assert merged['n_samples'] == expected['n_samples']
+    assert merged['statistical_parity_difference'] == pytest.approx(expected['statistical_parity_difference'])
+    assert merged['group_selection_rates'] == pytest.approx(expected['group_selection_rates'])
+    
+    with pytest.raises(ValueError):
+        left.merge(StreamingFairnessAccumulator(window=2))
+
+def test_threshold_curve_matches_per_threshold_metrics():
+    """Every point of the cumulative-sum curve equals recomputing the metrics at that cutoff."""
+    from src.ethics.fairness import fairness_threshold_curve, calculate_multi_fairness_metrics
+    
+    rng = np.random.default_rng(3)
+    n = 400
+    sens = pd.Series(rng.choice(['M', 'F', 'X'], n))
+    y_true = pd.Series(rng.integers(0, 2, n))
+    # Rounded scores so that ties are exercised
+    score = np.round(np.clip(0.4 * y_true + 0.1 * (sens == 'M') + rng.random(n) * 0.5, 0, 1), 2)
+    
+    curve = fairness_threshold_curve(y_true, score, sens)
+    assert len(curve) == len(np.unique(score))
+    assert curve['threshold'].is_monotonic_decreasing
+    
+    for _, row in curve.iloc[::7].iterrows():
+        y_pred = pd.Series((score >= row['threshold']).astype(int))
+        ref = calculate_multi_fairness_metrics(y_true, y_pred, sens.to_frame('s'))['s']
+        assert row['accuracy'] == pytest.approx(ref['accuracy'])
+        assert row['statistical_parity_difference'] == pytest.approx(ref['statistical_parity_difference'])
+        assert row['disparate_impact'] == pytest.approx(ref['disparate_impact'])
+        for g in ['M', 'F', 'X']:
+            in_g = (sens == g).to_numpy()
+            assert row[f'selection_rate [{g}]'] == pytest.approx(ref['group_selection_rates'][g])
+            tpr = y_pred[in_g & (y_true == 1).to_numpy()].mean()
+            fpr = y_pred[in_g & (y_true == 0).to_numpy()].mean()
+            assert row[f'true_positive_rate [{g}]'] == pytest.approx(tpr)
+            assert row[f'false_positive_rate [{g}]'] == pytest.approx(fpr)
+
+def test_error_rate_metrics_match_fairlearn():
+    """Equalized odds / equal opportunity / FPR-FNR from the count tensor agree with fairlearn."""
+    from fairlearn.metrics import equalized_odds_difference, MetricFrame, false_positive_rate, false_negative_rate
+    from src.ethics.fairness import calculate_multi_fairness_metrics
+    
+    rng = np.random.default_rng(4)
+    n = 600
+    sens = pd.Series(rng.choice(['A', 'B', 'C'], n))
+    y_true = pd.Series(rng.integers(0, 2, n))
+    y_pred = pd.Series(np.where(sens == 'A', rng.random(n) < 0.6, rng.random(n) < 0.4).astype(int))
+    
+    metrics = calculate_fairness_metrics(y_true, y_pred, sens, unique_privileged_group='A')
+    assert metrics['equalized_odds_difference'] == pytest.approx(
+        equalized_odds_difference(y_true, y_pred, sensitive_features=sens))
+    
+    frame = MetricFrame(metrics={'fpr': false_positive_rate, 'fnr': false_negative_rate},
+                        y_true=y_true, y_pred=y_pred, sensitive_features=sens)
+    for g in ['A', 'B', 'C']:
+        assert metrics['group_false_positive_rates'][g] == pytest.approx(frame.by_group.loc[g, 'fpr'])
+        assert metrics['group_false_negative_rates'][g] == pytest.approx(frame.by_group.loc[g, 'fnr'])
+    
+    tpr = {g: 1 - v for g, v in metrics['group_false_negative_rates'].items()}
+    assert metrics['equal_opportunity_difference'] == pytest.approx(max(tpr.values()) - min(tpr.values()))
+    precision = {g: y_true[(sens == g) & (y_pred == 1)].mean() for g in ['A', 'B', 'C']}
+    assert metrics['predictive_parity_difference'] == pytest.approx(max(precision.values()) - min(precision.values()))
+    
+    multi = calculate_multi_fairness_metrics(y_true, y_pred, sens.to_frame('s'))['s']
+    assert multi['equalized_odds_difference'] == pytest.approx(metrics['equalized_odds_difference'])
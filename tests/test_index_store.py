@@ -0,0 +1,114 @@
+import pytest
+import pandas as pd
+import numpy as np
+from src.ethics.index_store import SimilarityIndexStore
+from src.ethics.similarity import SimilarityAnalyzer
+
+def _make_data():
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(rng.normal(size=(150, 4)), columns=['a', 'b', 'sex_M', 'sex_F'])
+
+def test_store_round_trip(tmp_path):
+    """A stored analyzer loads back with identical neighbors and pairs."""
+    X = _make_data()
+    store = SimilarityIndexStore(root=str(tmp_path))
+    
+    trained = store.load_or_train(X, sensitive_columns_masked=['sex_M', 'sex_F'])
+    trained.build_pair_index(max_distance=1.0)
+    store.save(trained, trained.index_key)
+    
+    loaded = store.load(trained.index_key)
+    assert loaded is not None
+    assert list(loaded.X_masked.columns) == ['a', 'b']
+    # Memory-mapped read-only, not copied into memory
+    assert not loaded.X_masked.to_numpy().flags.writeable
+    
+    d1, i1 = trained.find_neighbors(3, n_neighbors=4)
+    d2, i2 = loaded.find_neighbors(3, n_neighbors=4)
+    np.testing.assert_allclose(d1, d2)
+    
+    pd.testing.assert_frame_equal(trained.query_pair_index(0.7), loaded.query_pair_index(0.7))
+    
+    # Growing the pair index rewrites only the pair index of the entry
+    assert loaded.ensure_pair_index(1.8)
+    store.save_pair_index(loaded)
+    reloaded = store.load(trained.index_key)
+    assert reloaded.pair_index['max_distance'] == loaded.pair_index['max_distance']
+    pd.testing.assert_frame_equal(reloaded.query_pair_index(1.6), loaded.query_pair_index(1.6))
+
+def test_store_key_depends_on_mask_and_data(tmp_path):
+    X = _make_data()
+    store = SimilarityIndexStore(root=str(tmp_path))
+    
+    key = store.key(X, ['sex_M', 'sex_F'])
+    assert key == store.key(X, ['sex_F', 'sex_M'])
+    assert key != store.key(X, ['sex_M'])
+    
+    X2 = X.copy()
+    X2.iloc[0, 0] += 1
+    assert key != store.key(X2, ['sex_M', 'sex_F'])
+
+def test_load_missing_returns_none(tmp_path):
+    store = SimilarityIndexStore(root=str(tmp_path))
+    assert store.load('does-not-exist') is None
+
+def test_shared_index_is_stored_once(tmp_path):
+    """Entries backed by a shared index only record their mask; the shared index is written once."""
+    import os
+    from src.ethics.neighbors import SharedMaskIndex
+    
+    rng = np.random.default_rng(1)
+    X = pd.DataFrame(rng.normal(size=(200, 6)), columns=['a', 'b', 'c', 'sex_M', 'sex_F', 'age'])
+    store = SimilarityIndexStore(root=str(tmp_path))
+    data_key = store.data_key(X)
+    shared = SharedMaskIndex().fit(X, maskable_columns=['sex_M', 'sex_F', 'age'])
+    
+    keys = {}
+    for mask in (['sex_M', 'sex_F'], ['age']):
+        trained = store.load_or_train(X, sensitive_columns_masked=mask, shared_index=shared, data_key=data_key)
+        keys[tuple(mask)] = trained.index_key
+        entry = os.listdir(tmp_path / trained.index_key)
+        assert 'index.joblib' not in entry and 'X_masked.npy' not in entry
+    assert len(os.listdir(tmp_path / 'shared')) == 1
+    
+    # A fresh store (new session) rebuilds the view and the masked matrix from the shared entry
+    loaded = SimilarityIndexStore(root=str(tmp_path)).load(keys[('age',)])
+    fresh = SimilarityAnalyzer()
+    fresh.train(X, sensitive_columns_masked=['age'])
+    assert list(loaded.X_masked.columns) == ['a', 'b', 'c', 'sex_M', 'sex_F']
+    np.testing.assert_allclose(loaded.X_masked.to_numpy(), X.drop(columns=['age']).to_numpy())
+    d1, _ = loaded.find_neighbors(7, n_neighbors=5)
+    d2, _ = fresh.find_neighbors(7, n_neighbors=5)
+    np.testing.assert_allclose(d1, d2, atol=1e-9)
+
+def test_sparse_input_is_rejected(tmp_path):
+    """The store fingerprints dense frames only; a CSR matrix raises instead of failing deep in hashing."""
+    from scipy import sparse as sp
+    from src.data.preprocessing import with_columns
+    
+    X = _make_data()
+    X_sparse = with_columns(sp.csr_matrix(X.to_numpy()), X.columns)
+    store = SimilarityIndexStore(root=str(tmp_path))
+    with pytest.raises(ValueError):
+        store.data_key(X_sparse)
+    with pytest.raises(ValueError):
+        store.load_or_train(X_sparse, ['sex_M', 'sex_F'])
+
+def test_add_rows_detaches_from_stored_entry(tmp_path):
+    """After add_rows the pair index refers to new rows, so it is no longer written to the entry."""
+    X = _make_data()
+    store = SimilarityIndexStore(root=str(tmp_path))
+    trained = store.load_or_train(X.iloc[:120], sensitive_columns_masked=['sex_M', 'sex_F'])
+    trained.build_pair_index(max_distance=1.0)
+    key = trained.index_key
+    store.save(trained, key)
+    
+    trained.add_rows(X.iloc[120:], distance_threshold=1.0)
+    assert trained.index_key is None
+    assert store.save_pair_index(trained) is None
+    
+    # Even with the key restored, a pair index over rows the entry lacks is not written
+    trained.index_key = key
+    assert store.save_pair_index(trained) is None
+    stored = store.load(key)
+    assert stored.pair_index['person_b'].max() < 120
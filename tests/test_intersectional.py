@@ -0,0 +1,56 @@
+import pytest
+import pandas as pd
+import numpy as np
+from src.ethics.intersectional import intersectional_fairness
+
+def _make_data(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    sensitive = pd.DataFrame({
+        'sex': rng.choice(['M', 'F'], n),
+        'foreign': rng.choice(['yes', 'no'], n, p=[0.8, 0.2]),
+        'age': rng.integers(19, 75, n)
+    })
+    # Young foreign women are approved far less often
+    p_approve = np.where((sensitive['sex'] == 'F') & (sensitive['foreign'] == 'yes') & (sensitive['age'] < 30), 0.2, 0.7)
+    y_pred = pd.Series((rng.random(n) < p_approve).astype(int))
+    y_true = pd.Series(rng.integers(0, 2, n))
+    return y_true, y_pred, sensitive
+
+def test_intersectional_matches_groupby():
+    """Rolled-up cube values equal a direct pandas groupby for every reported group."""
+    y_true, y_pred, sensitive = _make_data()
+    result = intersectional_fairness(y_true, y_pred, sensitive, min_support=1, numeric_bins=3)
+    
+    age_bucket = pd.qcut(sensitive['age'], q=3, duplicates='drop').astype(str)
+    frame = sensitive.assign(age=age_bucket, pred=y_pred, correct=(y_true == y_pred))
+    
+    for attrs in [['sex'], ['sex', 'foreign'], ['sex', 'foreign', 'age']]:
+        expected = frame.groupby(attrs).agg(support=('pred', 'size'), sr=('pred', 'mean'), acc=('correct', 'mean'))
+        got = result[result['attributes'] == ' & '.join(attrs)]
+        assert len(got) == len(expected)
+        for keys, exp in expected.iterrows():
+            keys = keys if isinstance(keys, tuple) else (keys,)
+            label = ' & '.join(f"{a}={k}" for a, k in zip(attrs, keys))
+            row = got[got['group'] == label].iloc[0]
+            assert row['support'] == exp['support']
+            assert row['selection_rate'] == pytest.approx(exp['sr'])
+            assert row['accuracy'] == pytest.approx(exp['acc'])
+
+def test_intersectional_ranks_worst_group_first():
+    y_true, y_pred, sensitive = _make_data()
+    result = intersectional_fairness(y_true, y_pred, sensitive, min_support=30, numeric_bins=4)
+    
+    worst = result.iloc[0]
+    assert worst['order'] == 3
+    assert 'sex=F' in worst['group'] and 'foreign=yes' in worst['group']
+    assert result['disparate_impact'].is_monotonic_increasing
+
+def test_intersectional_min_support_prunes():
+    y_true, y_pred, sensitive = _make_data(n=300)
+    result = intersectional_fairness(y_true, y_pred, sensitive, min_support=40, numeric_bins=4)
+    
+    assert (result['support'] >= 40).all()
+    # Every reported intersection also has supported parents
+    for _, row in result[result['order'] > 1].iterrows():
+        for part in row['group'].split(' & '):
+            assert part in set(result.loc[result['order'] == 1, 'group'])
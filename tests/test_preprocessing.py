@@ -45,3 +45,154 @@ def test_sensitive_features_preserved():
     # We need to make sure we know which one is sex for fairness analysis later.
     # For now, just pass.
     pass
+
+def test_streaming_csv_matches_in_memory(tmp_path, monkeypatch):
+    """Two-pass chunked preprocessing reproduces preprocess_data on the full frame."""
+    from src.data.preprocessing import preprocess_csv_streaming
+    
+    rng = np.random.default_rng(0)
+    n = 1037
+    df = pd.DataFrame({
+        'age': rng.integers(19, 75, n),
+        'amount': rng.normal(3000, 800, n),
+        'sex': rng.choice(['male', 'female'], n),
+        # A rare category that only shows up late in the file
+        'purpose': np.where(np.arange(n) > 1000, 'boat', rng.choice(['car', 'tv'], n)),
+        'class': rng.integers(1, 3, n)
+    })
+    # Missing categories (only after the first chunk) get their own '<col>_nan' column
+    df.loc[[150, 700], 'sex'] = np.nan
+    csv_path = tmp_path / 'data.csv'
+    df.to_csv(csv_path, index=False)
+    df = pd.read_csv(csv_path)
+    
+    expected_X, expected_y = preprocess_data(df.drop(columns=['class']), df['class'])
+    assert 'sex_nan' in expected_X.columns
+    X, y = preprocess_csv_streaming(str(csv_path), 'class', chunksize=100, out_path=str(tmp_path / 'X.npy'))
+    
+    assert list(X.columns) == list(expected_X.columns)
+    np.testing.assert_allclose(X.to_numpy(), expected_X.to_numpy(), atol=1e-10)
+    np.testing.assert_array_equal(y.to_numpy(), expected_y.to_numpy())
+    assert isinstance(X.to_numpy().base, np.memmap) or not X.to_numpy().flags.writeable
+    
+    # Without out_path the matrix is keyed by content: a repeat upload reuses the same file
+    monkeypatch.setenv('AEI_CACHE_DIR', str(tmp_path / 'cache'))
+    first, _ = preprocess_csv_streaming(str(csv_path), 'class', chunksize=100)
+    second, _ = preprocess_csv_streaming(str(csv_path), 'class', chunksize=300)
+    assert len(list((tmp_path / 'cache' / 'preprocessed').iterdir())) == 1
+    np.testing.assert_allclose(second.to_numpy(), X.to_numpy())
+
+def test_streaming_csv_column_kinds_span_all_chunks(tmp_path):
+    """A column is categorical if any chunk holds text, even when the first chunk is all missing."""
+    from src.data.preprocessing import preprocess_csv_streaming
+    
+    rng = np.random.default_rng(2)
+    n = 450
+    df = pd.DataFrame({
+        'amount': rng.normal(size=n),
+        # Empty for the whole first chunk, text afterwards
+        'housing': np.where(np.arange(n) < 100, None, rng.choice(['own', 'rent'], n)),
+        # Numbers until one stray text value in the last chunk
+        'duration': rng.integers(1, 4, n).astype(object),
+        'class': rng.integers(0, 2, n)
+    })
+    df.loc[420, 'duration'] = 'unknown'
+    csv_path = tmp_path / 'data.csv'
+    df.to_csv(csv_path, index=False)
+    df = pd.read_csv(csv_path)
+    
+    expected_X, _ = preprocess_data(df.drop(columns=['class']), df['class'])
+    X, y, raw = preprocess_csv_streaming(str(csv_path), 'class', chunksize=100,
+                                         out_path=str(tmp_path / 'X.npy'), return_raw=True)
+    
+    assert 'duration_unknown' in X.columns and 'housing_nan' in X.columns
+    assert list(X.columns) == list(expected_X.columns)
+    np.testing.assert_allclose(X.to_numpy(), expected_X.to_numpy(), atol=1e-10)
+    # The raw columns come from the same pass, categoricals in the compact 'category' dtype
+    assert raw['housing'].dtype == 'category'
+    assert raw['housing'].astype(object).where(raw['housing'].notna(), None).tolist() == \
+        df['housing'].astype(object).where(df['housing'].notna(), None).tolist()
+    assert raw['duration'].astype(str).tolist() == df['duration'].astype(str).tolist()
+    np.testing.assert_allclose(raw['amount'].to_numpy(), df['amount'].to_numpy())
+
+def test_sparse_mode_returns_named_csr():
+    """Sparse mode returns a CSR matrix with the same columns and values as the dense frame."""
+    from scipy import sparse as sp
+    
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame({
+        'amount': rng.normal(size=50),
+        'merchant': rng.choice([f"m{i}" for i in range(30)], 50)
+    })
+    y = pd.Series(rng.integers(0, 2, 50))
+    
+    dense, _ = preprocess_data(df, y)
+    X_sparse, _ = preprocess_data(df, y, sparse=True)
+    assert sp.isspmatrix_csr(X_sparse)
+    assert list(X_sparse.columns) == list(dense.columns)
+    np.testing.assert_allclose(X_sparse.toarray(), dense.to_numpy())
+
+def _synthetic_frame(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'age': rng.integers(19, 75, n),
+        'amount': rng.normal(3000, 800, n),
+        'sex': rng.choice(['male', 'female'], n),
+        'purpose': rng.choice(['car', 'tv', 'boat'], n)
+    })
+
+def test_transform_data_reuses_fitted_preprocessor():
+    """transform_data on a slice gives the same rows as the full fit, without refitting."""
+    from src.data.preprocessing import transform_data
+    
+    df = _synthetic_frame(200)
+    X_full, _, preprocessor = preprocess_data(df, pd.Series(np.zeros(200)), return_preprocessor=True)
+    
+    # Reordered columns are aligned to the fitted schema
+    X_new = transform_data(df.iloc[50:80][df.columns[::-1]], preprocessor)
+    np.testing.assert_allclose(X_new.to_numpy(), X_full.iloc[50:80].to_numpy())
+    assert list(X_new.columns) == list(X_full.columns)
+    
+    with pytest.raises(ValueError):
+        transform_data(df.drop(columns=['sex']), preprocessor)
+
+def test_preprocessor_cache_skips_fit(tmp_path, monkeypatch):
+    """A repeat run on the same data loads the persisted artifact instead of fitting."""
+    from src.data import preprocessing
+    
+    monkeypatch.setenv('AEI_CACHE_DIR', str(tmp_path))
+    df = _synthetic_frame(100, seed=1)
+    y = pd.Series(np.zeros(100))
+    X_first, _, first = preprocess_data(df, y, return_preprocessor=True, cache=True)
+    
+    def fail_fit(*args, **kwargs):
+        raise AssertionError("preprocessor was refitted")
+    monkeypatch.setattr(preprocessing, 'fit_preprocessor', fail_fit)
+    X_second, _, second = preprocess_data(df, y, return_preprocessor=True, cache=True)
+    
+    assert second['fingerprint'] == first['fingerprint']
+    pd.testing.assert_frame_equal(X_second, X_first)
+    
+    # Artifacts from another version are ignored
+    monkeypatch.setattr(preprocessing, 'PREPROCESSOR_VERSION', first['version'] + 1)
+    assert preprocessing.load_preprocessor(first['fingerprint']) is None
+
+def test_float32_precision_and_compact_labels():
+    """dtype=np.float32 gives the same encoding in half the memory; integer labels are compacted."""
+    from src.utils.precision import compact_labels, feature_dtype
+    
+    df = _synthetic_frame(120, seed=2)
+    y = pd.Series(np.zeros(120))
+    X64, _ = preprocess_data(df, y)
+    X32, _ = preprocess_data(df, y, dtype=feature_dtype('float32'))
+    
+    assert (X32.dtypes == np.float32).all()
+    assert X32.to_numpy().nbytes * 2 == X64.to_numpy().nbytes
+    np.testing.assert_allclose(X32.to_numpy(), X64.to_numpy(), rtol=1e-6, atol=1e-6)
+    
+    labels = compact_labels(np.array([1, 2, 1], dtype=np.int64), index=pd.Index([5, 6, 7]))
+    assert labels.dtype == np.int8 and list(labels.index) == [5, 6, 7]
+    assert compact_labels(np.array(['good', 'bad'])).tolist() == ['good', 'bad']
+    
+    with pytest.raises(ValueError):
+        feature_dtype('float16')
@@ -1,6 +1,7 @@
 import pytest
 import os
 import pandas as pd
+import numpy as np
 from src.reporting.generator import EthicsReportPDF
 
 def test_pdf_creation():
@@ -45,3 +46,42 @@ def test_turkish_character_sanitization():
     cleaned = pdf.sanitize(test_str)
     assert "Seffaflik" in cleaned
     assert "Ş" not in cleaned 
+
+def test_pdf_with_per_feature_fairness():
+    """Per-group dicts in the fairness metrics are skipped, per-attribute SPD is listed."""
+    fairness = {
+        'statistical_parity_difference': 0.12,
+        'disparate_impact': 0.8,
+        'statistical_parity_difference_ci': (0.05, 0.19),
+        'group_selection_rates': {'Male': 0.7, 'Female': 0.58}
+    }
+    metrics = {
+        'fairness': fairness,
+        'fairness_by_feature': {'personal_status_sex': fairness, 'age': {'statistical_parity_difference': 0.05}},
+        'transparency': {'is_mock': False},
+        'similarity_score': 90.0,
+        'sim_bias_detected': True
+    }
+    weights = {'Fairness': 5, 'Transparency': 3, 'Similarity': 7}
+    
+    pdf_bytes = EthicsReportPDF(lang='en').generate(metrics, weights, 3.9, {'sensitive_features': ['personal_status_sex', 'age']})
+    assert pdf_bytes.startswith(b'%PDF')
+
+def test_pdf_with_threshold_curves():
+    """Threshold trade-off curves are summarized at fixed cutoffs."""
+    from src.ethics.fairness import fairness_threshold_curve
+    
+    rng = np.random.default_rng(0)
+    sens = pd.Series(rng.choice(['A', 'B'], 200))
+    curve = fairness_threshold_curve(pd.Series(rng.integers(0, 2, 200)), rng.random(200), sens)
+    metrics = {
+        'fairness': {'statistical_parity_difference': 0.1},
+        'threshold_curves': {'sex': curve},
+        'transparency': {'is_mock': False},
+        'similarity_score': 90.0,
+        'sim_bias_detected': False
+    }
+    weights = {'Fairness': 5, 'Transparency': 3, 'Similarity': 7}
+    
+    pdf_bytes = EthicsReportPDF(lang='en').generate(metrics, weights, 3.9, {'sensitive_features': ['sex']})
+    assert pdf_bytes.startswith(b'%PDF')
@@ -41,3 +41,46 @@ def test_scoring_engine_mock_transparency():
     # Avg = 300 / 4 = 75
     # Rating = 1 + (75/25) = 4.0
     assert final_score == pytest.approx(4.0)
+
+def test_scoring_engine_similarity_criterion():
+    ahp = AHPScorer(criteria=["Fairness", "Transparency", "Similarity"])
+    ahp.calculate_weights()
+    engine = EthicsScoringEngine(ahp)
+    
+    raw_scores = engine.calculate_raw_score(
+        {'statistical_parity_difference': 0.0},
+        {'is_mock': True},
+        similarity_metrics={'dataset_consistency': 0.8}
+    )
+    assert raw_scores['Similarity'] == pytest.approx(80.0)
+    
+    # Scores: F=100, T=50, S=80 -> Avg 76.67 -> 1 + 76.67/25
+    assert engine.calculate_final_score() == pytest.approx(1 + (230 / 3) / 25)
+
+def test_multi_metric_fairness_score():
+    """The Fairness score averages the penalties of all available gaps and skips undefined ones."""
+    from src.scoring.engine import fairness_score
+    
+    assert fairness_score({'statistical_parity_difference': 0.05}) == pytest.approx(75.0)
+    assert fairness_score({
+        'statistical_parity_difference': 0.05,
+        'equalized_odds_difference': 0.1,
+        'predictive_parity_difference': float('nan')
+    }) == pytest.approx((75.0 + 50.0) / 2)
+    assert fairness_score({}) == 0.0
+    
+    ahp = AHPScorer()
+    ahp.calculate_weights()
+    engine = EthicsScoringEngine(ahp)
+    raw = engine.calculate_raw_score({'statistical_parity_difference': 0.0, 'equalized_odds_difference': 0.3}, {'is_mock': True})
+    assert raw['Fairness'] == pytest.approx(50.0)
+
+def test_engine_reads_generate_explanations_output():
+    """The Transparency score reads the 'feature_importance' key of generate_explanations."""
+    import pandas as pd
+    engine = EthicsScoringEngine(AHPScorer())
+    raw_scores = engine.calculate_raw_score(
+        {'statistical_parity_difference': 0.0},
+        {'is_mock': False, 'feature_importance': pd.DataFrame({'feature': ['a'], 'importance': [0.1]})}
+    )
+    assert raw_scores['Transparency'] == 100.0
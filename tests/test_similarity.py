@@ -1,7 +1,7 @@
 import pytest
 import pandas as pd
 import numpy as np
-from src.ethics.similarity import SimilarityAnalyzer
+from src.ethics.similarity import SimilarityAnalyzer, analyze_pair_discordance
 
 def test_similarity_masking():
     """Test if the analyzer correctly ignores masking columns."""
@@ -56,3 +56,419 @@ def test_neighborhood_bias_analysis():
     assert stats['stats']['F'] == 0.0
     assert stats['counts']['M'] == 2 # Target(0) + neighbor(1)
     assert stats['counts']['F'] == 2
+
+def test_find_all_similar_pairs_matches_loop():
+    """Vectorized pair search should return the same pairs as the reference loop."""
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.normal(size=(200, 4)), columns=['a', 'b', 'c', 'd'])
+    
+    analyzer = SimilarityAnalyzer()
+    analyzer.train(df, sensitive_columns_masked=['d'])
+    
+    pairs_df = analyzer.find_all_similar_pairs(n_neighbors=4, distance_threshold=0.8)
+    
+    # Reference: the original nested loop over kneighbors output
+    distances, indices = analyzer.knn_model.kneighbors(analyzer.X_masked, n_neighbors=4)
+    expected = set()
+    for i in range(len(df)):
+        for k in range(1, 4):
+            if distances[i, k] < 0.8:
+                expected.add(tuple(sorted((i, int(indices[i, k])))))
+    
+    found = set(zip(pairs_df['Person A'], pairs_df['Person B']))
+    assert found == expected
+    assert (pairs_df['Person A'] < pairs_df['Person B']).all()
+    assert pairs_df['Person A'].dtype == np.int32
+    assert pairs_df['Distance'].dtype == np.float32
+
+def test_find_all_similar_pairs_dedups_duplicates():
+    """Exact duplicate rows produce one pair, never a self-pair."""
+    df = pd.DataFrame({'Skill': [5, 5, 0], 'Gender': [0, 1, 0]})
+    analyzer = SimilarityAnalyzer()
+    analyzer.train(df, sensitive_columns_masked=['Gender'])
+    
+    pairs_df = analyzer.find_all_similar_pairs(n_neighbors=2, distance_threshold=0.5)
+    
+    assert len(pairs_df) == 1
+    assert tuple(pairs_df.iloc[0][['Person A', 'Person B']]) == (0, 1)
+
+def test_radius_mode_finds_every_pair():
+    """Radius mode should match a brute-force scan of all pairs under the threshold."""
+    rng = np.random.default_rng(1)
+    # A dense cluster where k=2 truncation misses most pairs
+    df = pd.DataFrame(rng.normal(scale=0.2, size=(60, 3)), columns=['a', 'b', 'g'])
+    
+    analyzer = SimilarityAnalyzer()
+    analyzer.train(df, sensitive_columns_masked=['g'])
+    
+    pairs_df = analyzer.find_all_similar_pairs(distance_threshold=0.3, mode='radius', chunk_size=7)
+    
+    X = df[['a', 'b']].values
+    dist = np.sqrt(((X[:, None, :] - X[None, :, :]) ** 2).sum(-1))
+    ii, jj = np.nonzero(np.triu(dist < 0.3, k=1))
+    expected = set(zip(ii.tolist(), jj.tolist()))
+    
+    assert set(zip(pairs_df['Person A'], pairs_df['Person B'])) == expected
+    assert len(pairs_df) > len(analyzer.find_all_similar_pairs(n_neighbors=2, distance_threshold=0.3))
+
+def test_iter_similar_pairs_adapts_chunk_size():
+    """A small pair budget splits the scan into more chunks without losing pairs."""
+    rng = np.random.default_rng(2)
+    df = pd.DataFrame(rng.normal(scale=0.1, size=(80, 2)), columns=['a', 'b'])
+    
+    analyzer = SimilarityAnalyzer()
+    analyzer.train(df, sensitive_columns_masked=[])
+    
+    chunks = list(analyzer.iter_similar_pairs(distance_threshold=0.5, chunk_size=40, max_pairs_per_chunk=100))
+    full = analyzer.find_all_similar_pairs(distance_threshold=0.5, mode='radius')
+    
+    assert len(chunks) > 2
+    assert sum(len(c) for c in chunks) == len(full)
+
+def test_pair_index_matches_radius_search():
+    """Any threshold answered from the pair index equals a fresh radius search."""
+    rng = np.random.default_rng(3)
+    df = pd.DataFrame(rng.normal(size=(120, 3)), columns=['a', 'b', 'c'])
+    
+    analyzer = SimilarityAnalyzer()
+    analyzer.train(df, sensitive_columns_masked=[])
+    analyzer.build_pair_index(max_distance=2.0)
+    
+    for thresh in [0.1, 0.5, 1.3, 2.0]:
+        from_index = analyzer.query_pair_index(thresh)
+        fresh = analyzer.find_all_similar_pairs(distance_threshold=thresh, mode='radius')
+        assert set(zip(from_index['Person A'], from_index['Person B'])) == set(zip(fresh['Person A'], fresh['Person B']))
+        assert from_index['Distance'].is_monotonic_increasing
+    
+    with pytest.raises(ValueError):
+        analyzer.query_pair_index(2.5)
+
+def test_ivf_backend_full_probe_matches_exact():
+    """Probing every cell makes the IVF backend exact."""
+    rng = np.random.default_rng(4)
+    df = pd.DataFrame(rng.normal(size=(300, 5)), columns=list('abcde'))
+    
+    exact = SimilarityAnalyzer()
+    exact.train(df, sensitive_columns_masked=['e'])
+    ivf = SimilarityAnalyzer(backend='ivf', backend_params={'n_lists': 10, 'n_probe': 10})
+    ivf.train(df, sensitive_columns_masked=['e'])
+    
+    d_exact, i_exact = exact.find_neighbors(target_idx=5, n_neighbors=6)
+    d_ivf, i_ivf = ivf.find_neighbors(target_idx=5, n_neighbors=6)
+    np.testing.assert_allclose(d_ivf, d_exact, atol=1e-6)
+    
+    for mode in ['knn', 'radius']:
+        p_exact = exact.find_all_similar_pairs(n_neighbors=3, distance_threshold=0.9, mode=mode)
+        p_ivf = ivf.find_all_similar_pairs(n_neighbors=3, distance_threshold=0.9, mode=mode)
+        assert set(zip(p_ivf['Person A'], p_ivf['Person B'])) == set(zip(p_exact['Person A'], p_exact['Person B']))
+
+def test_ivf_recall_report():
+    """Partial probing trades recall for speed; the report quantifies it."""
+    rng = np.random.default_rng(5)
+    df = pd.DataFrame(rng.normal(size=(2000, 8)), columns=[f'f{i}' for i in range(8)])
+    
+    analyzer = SimilarityAnalyzer(backend='ivf', backend_params={'n_lists': 40, 'n_probe': 8})
+    analyzer.train(df, sensitive_columns_masked=[])
+    report = analyzer.recall_report(n_neighbors=10, n_queries=200)
+    
+    assert set(report) >= {'recall_at_k', 'exact_seconds', 'approx_seconds', 'speedup'}
+    assert 0.5 < report['recall_at_k'] <= 1.0
+    
+    # Probing every cell gives perfect recall
+    analyzer.knn_model.n_probe = 40
+    assert analyzer.recall_report(n_neighbors=10, n_queries=200)['recall_at_k'] == 1.0
+
+def test_ivf_find_neighbors_drops_padding():
+    """Slots the probed IVF cells cannot fill are not returned as row -1."""
+    rng = np.random.default_rng(15)
+    df = pd.DataFrame(rng.normal(size=(800, 4)), columns=list('abcd'))
+    
+    analyzer = SimilarityAnalyzer(backend='ivf', backend_params={'n_lists': 40, 'n_probe': 2})
+    analyzer.train(df, sensitive_columns_masked=[])
+    _, raw = analyzer.knn_model.kneighbors(df.iloc[[0]], n_neighbors=80)
+    assert (raw < 0).any()
+    
+    distances, indices = analyzer.find_neighbors(target_idx=0, n_neighbors=80)
+    assert (indices >= 0).all() and np.isfinite(distances).all()
+    assert len(indices) == (raw >= 0).sum()
+
+def test_unknown_backend_raises():
+    analyzer = SimilarityAnalyzer(backend='annoy')
+    with pytest.raises(ValueError):
+        analyzer.train(pd.DataFrame({'a': [0.0, 1.0]}), sensitive_columns_masked=[])
+
+def test_pair_discordance_matches_loop():
+    """Vectorized discordance counts equal the per-pair loop used in Step 6."""
+    rng = np.random.default_rng(6)
+    n = 50
+    df_raw = pd.DataFrame({
+        'sex': rng.choice(['M', 'F'], n),
+        'age_band': rng.choice(['young', 'mid', 'old'], n)
+    })
+    y_pred = pd.Series(rng.integers(0, 2, n))
+    pairs = pd.DataFrame({'Person A': rng.integers(0, n, 200), 'Person B': rng.integers(0, n, 200), 'Distance': rng.random(200)})
+    
+    result = analyze_pair_discordance(
+        pairs['Person A'], pairs['Person B'], y_pred, df_raw,
+        distances=pairs['Distance'], pair_ids=pairs.index
+    )
+    
+    for feat in df_raw.columns:
+        disc = {'same': 0, 'diff': 0}
+        total = {'same': 0, 'diff': 0}
+        detail_ids = []
+        for idx, row in pairs.iterrows():
+            p1, p2 = int(row['Person A']), int(row['Person B'])
+            key = 'same' if df_raw.iloc[p1][feat] == df_raw.iloc[p2][feat] else 'diff'
+            total[key] += 1
+            if y_pred.iloc[p1] != y_pred.iloc[p2]:
+                disc[key] += 1
+                if key == 'diff':
+                    detail_ids.append(idx)
+        
+        assert result[feat]['total_same'] == total['same']
+        assert result[feat]['total_diff'] == total['diff']
+        assert result[feat]['discordant_same'] == disc['same']
+        assert result[feat]['rate_diff'] == pytest.approx(disc['diff'] / total['diff'])
+        assert list(result[feat]['details']['Pair ID']) == detail_ids
+        assert list(result[feat]['details'].columns) == ['Pair ID', f'{feat}_A', f'{feat}_B', 'Outcome_A', 'Outcome_B', 'Dist']
+
+def test_analyze_all_neighborhoods_matches_single():
+    """Batch neighborhood stats equal analyze_neighborhood_bias row by row."""
+    rng = np.random.default_rng(7)
+    n = 40
+    df = pd.DataFrame(rng.normal(size=(n, 3)), columns=['a', 'b', 'c'])
+    y_pred = pd.Series(rng.integers(0, 2, n))
+    sensitive = pd.Series(rng.choice(['M', 'F'], n))
+    
+    analyzer = SimilarityAnalyzer()
+    analyzer.train(df, sensitive_columns_masked=[])
+    _, indices = analyzer.knn_model.kneighbors(df, n_neighbors=6)
+    
+    batch = analyzer.analyze_all_neighborhoods(indices, y_pred, sensitive)
+    
+    for i in [0, 7, 23]:
+        single = analyzer.analyze_neighborhood_bias(i, indices[i], y_pred, sensitive)
+        for group, rate in single['stats'].items():
+            assert batch['stats'].loc[i, group] == pytest.approx(rate)
+            assert batch['counts'].loc[i, group] == single['counts'][group]
+        assert batch['consistency_score'][i] == pytest.approx(single['consistency_score'])
+    
+    full = analyzer.neighborhood_consistency(y_pred, sensitive, n_neighbors=6)
+    assert full['dataset_consistency'] == pytest.approx(np.nanmean(batch['consistency_score']))
+
+def test_add_rows_finds_new_pairs_incrementally():
+    """Pairs from incremental appends equal a full refit on the grown dataset."""
+    rng = np.random.default_rng(8)
+    df = pd.DataFrame(rng.normal(size=(200, 3)), columns=['a', 'b', 'sex'])
+    
+    analyzer = SimilarityAnalyzer(max_buffer_rows=40)
+    analyzer.train(df.iloc[:150], sensitive_columns_masked=['sex'])
+    analyzer.build_pair_index(max_distance=1.0)
+    
+    pairs = [analyzer.find_all_similar_pairs(distance_threshold=0.6, mode='radius')]
+    # First batch stays in the buffer, second batch triggers a merge
+    pairs.append(analyzer.add_rows(df.iloc[150:180], distance_threshold=0.6))
+    assert len(analyzer.buffer) == 1
+    pairs.append(analyzer.add_rows(df.iloc[180:], distance_threshold=0.6))
+    assert analyzer.buffer == []
+    assert len(analyzer.X_masked) == 200
+    
+    # New pairs always involve a new row
+    assert (pairs[1]['Person B'] >= 150).all()
+    
+    full = SimilarityAnalyzer()
+    full.train(df, sensitive_columns_masked=['sex'])
+    expected = full.find_all_similar_pairs(distance_threshold=0.6, mode='radius')
+    
+    combined = pd.concat(pairs)
+    assert set(zip(combined['Person A'], combined['Person B'])) == set(zip(expected['Person A'], expected['Person B']))
+    
+    # The pair index was kept up to date and is still sorted
+    from_index = analyzer.query_pair_index(0.9)
+    fresh = full.find_all_similar_pairs(distance_threshold=0.9, mode='radius')
+    assert set(zip(from_index['Person A'], from_index['Person B'])) == set(zip(fresh['Person A'], fresh['Person B']))
+    assert from_index['Distance'].is_monotonic_increasing
+
+def test_blocked_mode_matches_radius():
+    """The blocked matrix-product engine returns the same pairs as radius queries."""
+    rng = np.random.default_rng(9)
+    df = pd.DataFrame(rng.normal(size=(500, 6)), columns=list('abcdef'))
+    
+    analyzer = SimilarityAnalyzer()
+    analyzer.train(df, sensitive_columns_masked=['f'])
+    
+    radius = analyzer.find_all_similar_pairs(distance_threshold=1.2, mode='radius')
+    # A tiny budget forces many tiles
+    blocked = analyzer.find_all_similar_pairs(distance_threshold=1.2, mode='blocked', memory_budget_mb=0.05, n_jobs=3)
+    
+    pd.testing.assert_frame_equal(blocked[['Person A', 'Person B']], radius[['Person A', 'Person B']])
+    np.testing.assert_allclose(blocked['Distance'], radius['Distance'], atol=1e-5)
+
+def test_blocked_workers_use_one_blas_thread(monkeypatch):
+    """Parallel tiles cap BLAS at one thread each; a single worker leaves BLAS alone."""
+    from src.ethics import neighbors
+    
+    calls = []
+    real_limits = neighbors.threadpool_limits
+    def record(limits=None, user_api=None):
+        calls.append((limits, user_api))
+        return real_limits(limits=limits, user_api=user_api)
+    monkeypatch.setattr(neighbors, 'threadpool_limits', record)
+    
+    X = np.random.default_rng(0).normal(size=(200, 4))
+    rows, cols, _ = neighbors.blocked_pairs_within(X, 1.0, memory_budget_mb=0.05, n_jobs=4)
+    single = neighbors.blocked_pairs_within(X, 1.0, n_jobs=1)
+    
+    assert calls == [(1, 'blas'), (None, 'blas')]
+    assert set(zip(rows, cols)) == set(zip(single[0], single[1]))
+
+def test_shared_mask_index_matches_refit():
+    """Views of one shared index answer every mask exactly like a fresh fit."""
+    from src.ethics.neighbors import SharedMaskIndex
+    
+    rng = np.random.default_rng(10)
+    df = pd.DataFrame(rng.normal(size=(150, 6)), columns=['a', 'b', 'c', 'sex_M', 'sex_F', 'age'])
+    shared = SharedMaskIndex().fit(df, maskable_columns=['sex_M', 'sex_F', 'age'])
+    
+    for mask in [['sex_M', 'sex_F'], ['age'], ['sex_M', 'sex_F', 'age'], []]:
+        fresh = SimilarityAnalyzer()
+        fresh.train(df, sensitive_columns_masked=mask)
+        viewed = SimilarityAnalyzer()
+        viewed.train(df, sensitive_columns_masked=mask, shared_index=shared)
+        
+        d_fresh, _ = fresh.find_neighbors(11, n_neighbors=5)
+        d_view, _ = viewed.find_neighbors(11, n_neighbors=5)
+        np.testing.assert_allclose(d_view, d_fresh, atol=1e-9)
+        
+        p_fresh = fresh.find_all_similar_pairs(distance_threshold=1.5, mode='radius')
+        p_view = viewed.find_all_similar_pairs(distance_threshold=1.5, mode='radius')
+        assert set(zip(p_view['Person A'], p_view['Person B'])) == set(zip(p_fresh['Person A'], p_fresh['Person B']))
+        
+        k_fresh = fresh.find_all_similar_pairs(n_neighbors=3, distance_threshold=1.5)
+        k_view = viewed.find_all_similar_pairs(n_neighbors=3, distance_threshold=1.5)
+        np.testing.assert_allclose(np.sort(k_view['Distance']), np.sort(k_fresh['Distance']), atol=1e-5)
+    
+    with pytest.raises(ValueError):
+        shared.view(['a'])
+
+def test_sparse_input_matches_dense():
+    """A CSR matrix from preprocess_data(sparse=True) gives the same pairs as the dense frame, in every mode."""
+    from scipy import sparse as sp
+    from src.data.preprocessing import preprocess_data, with_columns
+    
+    rng = np.random.default_rng(11)
+    n = 300
+    raw = pd.DataFrame({
+        'income': rng.normal(size=n),
+        'zip': rng.choice([f"z{i}" for i in range(40)], n),
+        'sex': rng.choice(['m', 'f'], n)
+    })
+    y = pd.Series(rng.integers(0, 2, n))
+    X_dense, _ = preprocess_data(raw, y)
+    X_sparse, _ = preprocess_data(raw, y, sparse=True)
+    masked = ['sex_m', 'sex_f']
+    
+    dense = SimilarityAnalyzer()
+    dense.train(X_dense, sensitive_columns_masked=masked)
+    sparse = SimilarityAnalyzer()
+    sparse.train(X_sparse, sensitive_columns_masked=masked)
+    assert sp.issparse(sparse.X_masked) and list(sparse.X_masked.columns) == list(dense.X_masked.columns)
+    
+    for mode in ['knn', 'radius', 'blocked']:
+        expected = dense.find_all_similar_pairs(n_neighbors=4, distance_threshold=0.5, mode=mode)
+        got = sparse.find_all_similar_pairs(n_neighbors=4, distance_threshold=0.5, mode=mode)
+        assert set(zip(got['Person A'], got['Person B'])) == set(zip(expected['Person A'], expected['Person B'])), mode
+    
+    # Incremental appends stay sparse
+    extra = with_columns(X_sparse[:10], X_sparse.columns)
+    new_pairs = sparse.add_rows(extra, distance_threshold=0.5)
+    assert (new_pairs['Person B'] >= n).all() and len(new_pairs) >= 10
+    sparse.merge_buffer()
+    assert sp.issparse(sparse.X_masked) and sparse.X_masked.shape[0] == n + 10
+    
+    with pytest.raises(ValueError):
+        SimilarityAnalyzer(backend='ivf').train(X_sparse, sensitive_columns_masked=masked)
+
+def test_float32_mode_matches_float64():
+    """float32 features stay float32 through masking and give the same pairs as float64."""
+    rng = np.random.default_rng(12)
+    df = pd.DataFrame(rng.normal(size=(400, 6)), columns=['a', 'b', 'c', 'd', 'sex_M', 'sex_F'])
+    masked = ['sex_M', 'sex_F']
+    
+    exact = SimilarityAnalyzer()
+    exact.train(df, sensitive_columns_masked=masked)
+    compact = SimilarityAnalyzer(dtype=np.float32)
+    compact.train(df, sensitive_columns_masked=masked)
+    assert (compact.X_masked.dtypes == np.float32).all()
+    assert list(compact.X_masked.columns) == ['a', 'b', 'c', 'd']
+    
+    # float32 input is kept as is, without a cast to float64
+    inherited = SimilarityAnalyzer()
+    inherited.train(df.astype(np.float32), sensitive_columns_masked=[])
+    assert (inherited.X_masked.dtypes == np.float32).all()
+    
+    for mode in ['knn', 'radius', 'blocked']:
+        expected = exact.find_all_similar_pairs(n_neighbors=4, distance_threshold=1.0, mode=mode)
+        got = compact.find_all_similar_pairs(n_neighbors=4, distance_threshold=1.0, mode=mode)
+        # Pairs right at the threshold may flip with the rounding, so compare the clear ones
+        clear = expected[np.abs(expected['Distance'] - 1.0) > 1e-3]
+        assert set(zip(clear['Person A'], clear['Person B'])) <= set(zip(got['Person A'], got['Person B'])), mode
+        assert abs(len(got) - len(expected)) <= len(expected) - len(clear), mode
+    
+    new_pairs = compact.add_rows(df.iloc[:5], distance_threshold=1.0)
+    assert len(new_pairs) >= 5
+    compact.merge_buffer()
+    assert (compact.X_masked.dtypes == np.float32).all()
+
+def test_iter_similar_pairs_first_chunk_is_bounded():
+    """Even when every row matches every row, no radius query returns more than the pair budget."""
+    rng = np.random.default_rng(13)
+    df = pd.DataFrame(rng.normal(scale=0.01, size=(300, 2)), columns=['a', 'b'])
+    
+    analyzer = SimilarityAnalyzer()
+    analyzer.train(df, sensitive_columns_masked=[])
+    
+    returned = []
+    query = analyzer.knn_model.radius_neighbors
+    def counting_query(X, radius):
+        dist_lists, ind_lists = query(X, radius=radius)
+        returned.append(sum(len(ind) for ind in ind_lists))
+        return dist_lists, ind_lists
+    analyzer.knn_model.radius_neighbors = counting_query
+    
+    pairs = pd.concat(analyzer.iter_similar_pairs(distance_threshold=10.0, chunk_size=2048, max_pairs_per_chunk=1500))
+    assert len(pairs) == 300 * 299 // 2
+    assert max(returned) <= 1500
+
+def test_ensure_pair_index_grows_lazily_and_stays_bounded():
+    """The pair index only covers the thresholds asked for, and never grows past max_pairs."""
+    rng = np.random.default_rng(14)
+    df = pd.DataFrame(rng.normal(size=(300, 3)), columns=['a', 'b', 'c'])
+    
+    analyzer = SimilarityAnalyzer()
+    analyzer.train(df, sensitive_columns_masked=[])
+    
+    assert analyzer.ensure_pair_index(0.3, step=0.5)
+    assert analyzer.pair_index['max_distance'] == 0.5
+    n_strict = len(analyzer.pair_index['distance'])
+    assert n_strict == len(analyzer.find_all_similar_pairs(distance_threshold=0.5, mode='radius'))
+    
+    # Moving the slider past the range extends the index by whole steps
+    assert analyzer.ensure_pair_index(1.2, step=0.5)
+    assert analyzer.pair_index['max_distance'] == 1.5
+    for thresh in [0.2, 0.5, 0.9, 1.5]:
+        from_index = analyzer.query_pair_index(thresh)
+        fresh = analyzer.find_all_similar_pairs(distance_threshold=thresh, mode='radius')
+        assert set(zip(from_index['Person A'], from_index['Person B'])) == set(zip(fresh['Person A'], fresh['Person B']))
+        assert from_index['Distance'].is_monotonic_increasing
+    
+    # A loose threshold over the cap leaves the index as it was
+    n_indexed = len(analyzer.pair_index['distance'])
+    assert not analyzer.ensure_pair_index(5.0, max_pairs=n_indexed + 10)
+    assert analyzer.pair_index['max_distance'] == 1.5 and len(analyzer.pair_index['distance']) == n_indexed
+    
+    fresh_analyzer = SimilarityAnalyzer()
+    fresh_analyzer.train(df, sensitive_columns_masked=[])
+    assert not fresh_analyzer.ensure_pair_index(5.0, max_pairs=100)
+    assert fresh_analyzer.pair_index is None
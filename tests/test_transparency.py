@@ -45,3 +45,166 @@ def test_global_importance_sorting():
     assert 'importance' in global_imp.columns
     # Check if sorted descending
     assert global_imp['importance'].iloc[0] >= global_imp['importance'].iloc[-1]
+
+def test_permutation_importance_for_models_without_native_importance():
+    """Models without feature_importances_ get real, reproducible permutation importances."""
+    from sklearn.linear_model import LogisticRegression
+    from src.ethics.transparency import permutation_importance
+    
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(300, 3)), columns=['signal', 'noise', 'weak'])
+    X['color_red'] = (rng.random(300) < 0.5).astype(float)
+    X['color_blue'] = 1.0 - X['color_red']
+    y = ((2 * X['signal'] + 0.5 * X['weak'] + 1.5 * X['color_red']) > 0.7).astype(int)
+    model = LogisticRegression().fit(X, y)
+    families = {'color': ['color_red', 'color_blue']}
+    
+    explanations = generate_explanations(model, X, families=families)
+    fi = explanations['feature_importance']
+    assert explanations['is_mock'] is False
+    assert list(fi['feature'])[0] == 'signal'
+    assert set(fi['feature']) == {'signal', 'noise', 'weak', 'color'}
+    assert fi.set_index('feature')['importance']['noise'] == pytest.approx(0.0, abs=0.02)
+    
+    # Same seed -> same result regardless of thread count and batch size
+    a = permutation_importance(model, X, y, families=families, n_jobs=1)
+    b = permutation_importance(model, X, y, families=families, n_jobs=4, max_batch_rows=500)
+    pd.testing.assert_frame_equal(a, b)
+    assert a.set_index('feature')['importance']['color'] > 0.05
+
+def test_permutation_buffers_share_the_row_budget():
+    """The per-thread buffers of all workers together stay within max_batch_rows."""
+    from sklearn.linear_model import LogisticRegression
+    from src.ethics.transparency import permutation_importance
+    
+    rng = np.random.default_rng(3)
+    X = pd.DataFrame(rng.normal(size=(300, 6)), columns=list('abcdef'))
+    y = (X['a'] > 0).astype(int)
+    model = LogisticRegression().fit(X, y)
+    
+    batch_rows = []
+    class Recorder:
+        classes_ = model.classes_
+        def predict(self, frame):
+            batch_rows.append(len(frame))
+            return model.predict(frame)
+    
+    expected = permutation_importance(model, X, y, n_jobs=1)
+    got = permutation_importance(Recorder(), X, y, n_jobs=4, max_batch_rows=2400)
+    pd.testing.assert_frame_equal(got, expected)
+    # 4 workers share 2400 rows: 600 rows (two shuffled copies) per batch at most
+    assert max(batch_rows[1:]) <= 2400 // 4
+
+def test_partial_dependence_matches_per_grid_point_predictions():
+    """Stacked, chunked PD/ICE equals scoring each grid point separately; the sample budget is respected."""
+    from src.ethics.transparency import partial_dependence_curves, top_raw_features
+    
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(400, 2)), columns=['income', 'age'])
+    X['sex_m'] = (rng.random(400) < 0.5).astype(float)
+    X['sex_f'] = 1.0 - X['sex_m']
+    y = ((X['income'] + X['sex_m']) > 0.5).astype(int)
+    model = RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y)
+    families = {'income': ['income'], 'sex': ['sex_m', 'sex_f']}
+    
+    curves = partial_dependence_curves(model, X, families, grid_resolution=8, n_ice=10, max_batch_rows=300)
+    
+    inc = curves['income']
+    assert inc['kind'] == 'numeric' and inc['ice'].shape == (10, len(inc['grid']))
+    for i, value in enumerate(inc['grid']):
+        expected = model.predict_proba(X.assign(income=value))[:, 1]
+        assert inc['pd'][i] == pytest.approx(expected.mean())
+        np.testing.assert_allclose(inc['ice'][:, i], expected[:10])
+    
+    sex = curves['sex']
+    assert sex['grid'] == ['m', 'f']
+    assert sex['pd'][0] > sex['pd'][1]
+    
+    sampled = partial_dependence_curves(model, X, families, sample_size=100, n_ice=500)
+    assert sampled['income']['ice'].shape[0] == 100
+    
+    fi = generate_explanations(model, X)['feature_importance']
+    assert top_raw_features(fi, {'income': ['income'], 'age': ['age'], 'sex': ['sex_m', 'sex_f']}, k=2)[0] == 'income'
+
+def test_permutation_importance_on_sparse_matrix():
+    """Sparse mode permutes CSC entries in place of dense buffers and gives the same importances."""
+    from scipy import sparse as sp
+    from sklearn.linear_model import LogisticRegression
+    from src.data.preprocessing import with_columns
+    from src.ethics.transparency import permutation_importance
+    
+    rng = np.random.default_rng(2)
+    X = pd.DataFrame(rng.normal(size=(200, 2)), columns=['signal', 'noise'])
+    X['zip_a'] = (rng.random(200) < 0.3).astype(float)
+    X['zip_b'] = 1.0 - X['zip_a']
+    y = (X['signal'] + 2 * X['zip_a'] > 0.5).astype(int)
+    families = {'zip': ['zip_a', 'zip_b']}
+    
+    X_sparse = with_columns(sp.csr_matrix(X.to_numpy()), X.columns)
+    model = LogisticRegression().fit(X_sparse, y)
+    
+    dense = permutation_importance(model, X, y, families=families, n_jobs=1)
+    sparse = permutation_importance(model, X_sparse, y, families=families, n_jobs=2, max_batch_rows=400)
+    pd.testing.assert_frame_equal(dense, sparse)
+    assert generate_explanations(model, X_sparse, families=families)['is_mock'] is False
+
+def test_partial_dependence_on_sparse_matrix():
+    """PD/ICE on a CSR matrix (only the sampled rows densified) equals the dense result."""
+    from scipy import sparse as sp
+    from src.data.preprocessing import with_columns
+    from src.ethics.transparency import partial_dependence_curves
+    
+    rng = np.random.default_rng(3)
+    X = pd.DataFrame(rng.normal(size=(300, 1)), columns=['income'])
+    X['sex_m'] = (rng.random(300) < 0.5).astype(float)
+    X['sex_f'] = 1.0 - X['sex_m']
+    y = ((X['income'] + X['sex_m']) > 0.5).astype(int)
+    X_sparse = with_columns(sp.csr_matrix(X.to_numpy()), X.columns)
+    model = RandomForestClassifier(n_estimators=10, random_state=0).fit(X_sparse, y)
+    families = {'income': ['income'], 'sex': ['sex_m', 'sex_f']}
+    
+    curves = partial_dependence_curves(model, X_sparse, families, grid_resolution=6, sample_size=100)
+    
+    # Same row sample as the function (seed 42)
+    sampled = X.iloc[np.sort(np.random.default_rng(42).choice(300, 100, replace=False))]
+    for i, value in enumerate(curves['income']['grid']):
+        expected = model.predict_proba(sampled.assign(income=value).to_numpy())[:, 1]
+        assert curves['income']['pd'][i] == pytest.approx(expected.mean())
+    
+    assert curves['sex']['grid'] == ['m', 'f']
+    for i, level in enumerate(curves['sex']['grid']):
+        frame = sampled.assign(sex_m=float(level == 'm'), sex_f=float(level == 'f'))
+        assert curves['sex']['pd'][i] == pytest.approx(model.predict_proba(frame.to_numpy())[:, 1].mean())
+
+def test_explanations_on_sliced_sparse_matrix():
+    """A row slice of a named CSR matrix keeps its column names for every explanation path."""
+    from scipy import sparse as sp
+    from sklearn.linear_model import LogisticRegression
+    from src.data.preprocessing import with_columns
+    from src.ethics.counterfactual import counterfactual_flip_test
+    from src.ethics.transparency import partial_dependence_curves
+    
+    rng = np.random.default_rng(4)
+    X = pd.DataFrame(rng.normal(size=(200, 1)), columns=['income'])
+    X['sex_m'] = (rng.random(200) < 0.5).astype(float)
+    X['sex_f'] = 1.0 - X['sex_m']
+    y = ((X['income'] + X['sex_m']) > 0.5).astype(int)
+    X_sparse = with_columns(sp.csr_matrix(X.to_numpy()), X.columns)
+    families = {'income': ['income'], 'sex': ['sex_m', 'sex_f']}
+    
+    sliced = X_sparse[:50]
+    assert list(sliced.columns) == list(X.columns)
+    assert list(X_sparse[:, [0, 2]].columns) == ['income', 'sex_f']
+    
+    forest = RandomForestClassifier(n_estimators=10, random_state=0).fit(X_sparse, y)
+    native = generate_explanations(forest, sliced, families=families)
+    assert native['is_mock'] is False
+    assert set(native['feature_importance']['feature']) == set(X.columns)
+    
+    linear = LogisticRegression().fit(X_sparse, y)
+    permuted = generate_explanations(linear, sliced, families=families)
+    assert permuted['is_mock'] is False
+    assert set(permuted['feature_importance']['feature']) == {'income', 'sex'}
+    
+    assert set(partial_dependence_curves(forest, sliced, families, grid_resolution=4)) == {'income', 'sex'}
+    assert 'sex' in counterfactual_flip_test(forest, sliced, {'sex': ['sex_m', 'sex_f']})
@@ -0,0 +1,113 @@
+import pytest
+import pandas as pd
+import numpy as np
+from itertools import combinations
+from math import factorial
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.tree import DecisionTreeClassifier
+from src.ethics.tree_shap import forest_shap_values, local_explanations
+
+def _make_data(n=400, seed=0):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.normal(size=(n, 4)), columns=['a', 'b', 'c', 'd'])
+    X['d'] = np.round(X['d'])  # ties in the thresholds
+    y = ((X['a'] + X['b'] * X['c'] + 0.5 * X['d'] + rng.normal(scale=0.5, size=n)) > 0).astype(int)
+    return X, y
+
+def _conditional_expectation(tree, x, subset):
+    """E[f(x) | x_S] with the path-dependent (cover-weighted) rule, by plain recursion."""
+    values = tree.value[:, 0, :] / tree.value[:, 0, :].sum(axis=1, keepdims=True)
+    
+    def walk(node):
+        if tree.children_left[node] == -1:
+            return values[node]
+        left, right = tree.children_left[node], tree.children_right[node]
+        if tree.feature[node] in subset:
+            return walk(left if x[tree.feature[node]] <= tree.threshold[node] else right)
+        cover = tree.weighted_n_node_samples
+        return (cover[left] * walk(left) + cover[right] * walk(right)) / cover[node]
+    return walk(0)
+
+def test_matches_brute_force_shapley_on_small_tree():
+    """On a small tree the vectorized values equal the exact Shapley values of the path-dependent game."""
+    X, y = _make_data()
+    model = DecisionTreeClassifier(max_depth=5, random_state=0).fit(X, y)
+    values, _ = forest_shap_values(model, X.iloc[:15])
+    
+    n_feat = X.shape[1]
+    for r in range(15):
+        x = X.to_numpy()[r]
+        for i in range(n_feat):
+            others = [f for f in range(n_feat) if f != i]
+            phi = np.zeros(2)
+            for size in range(n_feat):
+                for subset in combinations(others, size):
+                    weight = factorial(size) * factorial(n_feat - size - 1) / factorial(n_feat)
+                    with_i = _conditional_expectation(model.tree_, x, set(subset) | {i})
+                    without_i = _conditional_expectation(model.tree_, x, set(subset))
+                    phi += weight * (with_i - without_i)
+            assert values[r, i] == pytest.approx(phi, abs=1e-10)
+
+def test_forest_values_are_additive():
+    """Attributions plus the expected value reproduce predict_proba for every row and class."""
+    X, y = _make_data(seed=1)
+    model = RandomForestClassifier(n_estimators=20, random_state=0).fit(X, y)
+    values, expected = forest_shap_values(model, X, chunk_size=128)
+    
+    np.testing.assert_allclose(values.sum(axis=1) + expected, model.predict_proba(X), atol=1e-9)
+    
+    local = local_explanations(model, X, [0, 5, 7], class_label=1, families={'bc': ['b', 'c']})
+    assert list(local.columns) == ['bc', 'a', 'd']
+    np.testing.assert_allclose(local.loc[5, 'bc'], values[5, 1, 1] + values[5, 2, 1])
+
+def test_rows_are_routed_like_sklearn():
+    """A value just above a threshold in float64 but equal to it in float32 goes left, as in sklearn."""
+    from sklearn.tree import DecisionTreeClassifier
+    
+    model = DecisionTreeClassifier().fit(np.array([[0.4], [0.6]]), [0, 1])
+    x = np.array([[model.tree_.threshold[0] + 1e-10]])
+    values, expected = forest_shap_values(model, x)
+    np.testing.assert_allclose(values.sum(axis=1) + expected, model.predict_proba(x), atol=1e-12)
+
+def test_sparse_input_matches_dense():
+    """A CSR matrix (densified chunk by chunk) gives the same attributions as the DataFrame."""
+    from scipy import sparse as sp
+    from src.data.preprocessing import with_columns
+    
+    X, y = _make_data(n=200, seed=2)
+    X['d'] = X['d'].clip(lower=0)  # mostly zeros
+    model = RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y)
+    X_sparse = with_columns(sp.csr_matrix(X.to_numpy()), X.columns)
+    
+    dense, expected = forest_shap_values(model, X)
+    sparse, sparse_expected = forest_shap_values(model, X_sparse, chunk_size=64)
+    np.testing.assert_allclose(sparse, dense)
+    np.testing.assert_allclose(sparse_expected, expected)
+    
+    pd.testing.assert_frame_equal(local_explanations(model, X_sparse, [3, 9]), local_explanations(model, X, [3, 9]))
+
+def test_cost_scales_with_trees_not_nodes(monkeypatch):
+    """Deep trees: paths are built once per fitted tree and scored in one batched call per tree, not per node."""
+    from src.ethics import tree_shap
+    
+    rng = np.random.default_rng(3)
+    X = pd.DataFrame(rng.normal(size=(3000, 6)), columns=list('abcdef'))
+    y = (X['a'] * X['b'] + rng.normal(scale=1.0, size=3000) > 0).astype(int)
+    model = RandomForestClassifier(n_estimators=8, random_state=0).fit(X, y)
+    assert min(est.tree_.node_count for est in model.estimators_) > 500
+    
+    calls = {'paths': 0, 'scored': 0}
+    real_paths, real_add = tree_shap._tree_paths, tree_shap._add_tree_shap
+    def count_paths(*args):
+        calls['paths'] += 1
+        return real_paths(*args)
+    def count_add(*args):
+        calls['scored'] += 1
+        return real_add(*args)
+    monkeypatch.setattr(tree_shap, '_tree_paths', count_paths)
+    monkeypatch.setattr(tree_shap, '_add_tree_shap', count_add)
+    
+    values, expected = forest_shap_values(model, X.iloc[:200])
+    forest_shap_values(model, X.iloc[200:400])
+    assert calls == {'paths': 8, 'scored': 16}
+    np.testing.assert_allclose(values.sum(axis=1) + expected, model.predict_proba(X.iloc[:200]), atol=1e-9)